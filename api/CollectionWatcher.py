@@ -0,0 +1,227 @@
+import threading
+import random
+import time
+
+from classes import WorkshopCollection, WorkshopItem, UpdatePlan
+from utils import AssertParameter, filemanager, logger
+from utils.metrics import ResetMetrics
+from api import SteamAPI, SteamDownloaderAPI
+
+
+class Settings:
+    # seconds between polls of a collection
+    interval: float = 600
+    # random part of every interval, as a fraction of it,
+    # so collections (and several watchers) do not poll steam api at the same moment
+    jitter: float = 0.1
+    # interval of a collection grows this many times after every poll without changes,
+    # and is back to its own value after a change
+    backoff: float = 1.5
+    # longest time a collection is left without a poll
+    maxStaleness: float = 3600
+    # collections due this many seconds after a poll are polled together with it
+    coalesce: float = 30
+
+    def setInterval(interval: float):
+        AssertParameter(interval, (int, float), "interval")
+        if (interval <= 0):
+            raise ValueError(f"Watch interval must be greater than 0: {interval}")
+        Settings.interval = interval
+
+    def setMaxStaleness(maxStaleness: float):
+        AssertParameter(maxStaleness, (int, float), "maxStaleness")
+        if (maxStaleness <= 0):
+            raise ValueError(f"Max staleness must be greater than 0: {maxStaleness}")
+        Settings.maxStaleness = maxStaleness
+
+
+class WatchedCollection:
+    '''Collection polled by the watcher, with items known to be downloaded'''
+
+    def __init__(self, collection: WorkshopCollection, interval: float, redownload: bool = False) -> None:
+        self.collection = collection
+        # own interval, and the current one, longer while nothing changes
+        self.interval = interval
+        self.currentInterval = interval
+        # first poll downloads (or updates) the collection the way a single run does
+        self.synced = False
+        self.redownload = redownload
+        self.nextPoll: float = 0
+
+    def scheduleNextPoll(self, now: float, changed: bool) -> None:
+        '''Backs off the interval of a quiet collection, but never past Settings.maxStaleness'''
+        if (changed):
+            self.currentInterval = self.interval
+        else:
+            self.currentInterval = min(self.currentInterval * Settings.backoff, Settings.maxStaleness)
+        jitter = self.currentInterval * Settings.jitter
+        delay = self.currentInterval + random.uniform(-jitter, jitter)
+        self.nextPoll = now + min(max(delay, 0), Settings.maxStaleness)
+
+    def __str__(self) -> str:
+        return (
+            f"{{WatchedCollection - collection: {self.collection.name} | "
+            f"interval: {self.interval} | currentInterval: {self.currentInterval:.0f}}}"
+        )
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+class CollectionWatcher:
+    '''Keeps collections up to date, until stopped.\n
+    Items known to be downloaded are kept in memory, so every poll only asks steam api
+    for collection and item details, and downloads items whose time_updated changed.
+    Folders are not scanned and collection.json is only read after a collection changed.'''
+
+    def __init__(self, directory: str, removeDeletedItems: bool = True) -> None:
+        AssertParameter(directory, str, "directory")
+
+        self.directory = directory
+        self.removeDeletedItems = removeDeletedItems
+        self.collections: list[WatchedCollection] = []
+        self._stopEvent = threading.Event()
+
+    def add(self, collection: WorkshopCollection, interval: float = -1, redownload: bool = False) -> None:
+        '''Watches collection, polled every interval seconds (Settings.interval by default).
+        With redownload, all its items are downloaded again by the first poll'''
+        AssertParameter(collection, WorkshopCollection, "collection")
+        AssertParameter(interval, (int, float), "interval")
+        if (interval < 0):
+            interval = Settings.interval
+        if (interval == 0 or interval > Settings.maxStaleness):
+            raise ValueError(
+                f"Watch interval must be greater than 0 and at most {Settings.maxStaleness}: {interval}"
+            )
+
+        self.collections.append(WatchedCollection(collection, interval, redownload))
+
+    def stop(self) -> None:
+        self._stopEvent.set()
+
+    def run(self) -> None:
+        '''Polls collections until stop() is called'''
+        self._stopEvent.clear()
+        while (not self._stopEvent.is_set()):
+            now = time.monotonic()
+            nextPoll = min(watched.nextPoll for watched in self.collections)
+            if (nextPoll > now):
+                self._stopEvent.wait(nextPoll - now)
+                continue
+
+            dueCollections = [
+                watched for watched
+                in self.collections
+                if watched.nextPoll <= nextPoll + Settings.coalesce
+            ]
+            self.poll(dueCollections)
+
+    def poll(self, dueCollections: list[WatchedCollection]) -> None:
+        '''Fetches details of collections and their items with shared requests,
+        then downloads what changed'''
+        collections = [watched.collection for watched in dueCollections]
+        # details must be fresh, changes are what the watcher is looking for
+        bypassCache = SteamAPI.Settings.bypassCache
+        SteamAPI.Settings.bypassCache = True
+        try:
+            missingCollections = WorkshopCollection.FetchNewItemsBatch(collections)
+        except (SteamAPI.SteamAPIException, OSError) as exception:
+            # requests.RequestException is an OSError, network errors do not stop the watcher
+            logger.LogWarning(
+                f"{logger.StartIndent()}Could not check {len(collections)} collections: {exception}"
+            )
+            # checked again after their own interval, not a longer one
+            for watched in dueCollections:
+                watched.scheduleNextPoll(time.monotonic(), True)
+            return
+        finally:
+            SteamAPI.Settings.bypassCache = bypassCache
+
+        for watched in dueCollections:
+            if (self._stopEvent.is_set()):
+                return
+            if (watched.collection in missingCollections):
+                logger.LogWarning(
+                    f"{logger.StartIndent()}Collection does not exist: {watched.collection.id}"
+                )
+                watched.scheduleNextPoll(time.monotonic(), False)
+                continue
+
+            try:
+                changed = self.sync(watched)
+            except Exception as exception:
+                if (self._stopEvent.is_set()):
+                    return
+                # state of the failed download is dropped, its journal is kept,
+                # so the next sync skips items it finished
+                if (SteamDownloaderAPI.IsDownloading()):
+                    SteamDownloaderAPI.onDownloadStopped()
+                # one failing collection does not stop the others
+                watched.scheduleNextPoll(time.monotonic(), False)
+                logger.LogWarning(
+                    f"{logger.StartIndent()}{watched.collection.name}: could not sync: {exception}, "
+                    f"next check in {(watched.nextPoll - time.monotonic()) / 60:.1f} min"
+                )
+                continue
+            watched.scheduleNextPoll(time.monotonic(), changed)
+            logger.LogMessage(
+                f"{logger.StartIndent()}{watched.collection.name}: "
+                f"{'updated' if changed else 'no changes'}, "
+                f"next check in {(watched.nextPoll - time.monotonic()) / 60:.1f} min"
+            )
+
+    def sync(self, watched: WatchedCollection) -> bool:
+        '''Downloads changes of a polled collection. Returns False if nothing changed'''
+        collection = watched.collection
+        if (not watched.synced and watched.redownload):
+            # every download is a run of its own in metrics
+            ResetMetrics()
+            SteamDownloaderAPI.DownloadCollection(collection, self.directory, True)
+            watched.synced = True
+            collection.localItems = self.readDownloadedItems(collection)
+            return True
+
+        if (not watched.synced):
+            # collections from urls only know their downloaded items from collection.json,
+            # so a restarted watcher updates them instead of downloading everything again
+            if (len(collection.localItems) == 0):
+                collection.localItems = self.readDownloadedItems(collection)
+            # folders and journal of an interrupted download are only checked once
+            plan = SteamDownloaderAPI.PlanCollection(collection, self.directory)
+        else:
+            plan = UpdatePlan.fromItems(collection.localItems, collection.fetchedItems)
+        if (not self.removeDeletedItems):
+            plan.deletedItems = []
+            plan.deletedFolders = []
+
+        # UpdateCollection always gets a plan, so it never asks (on stdin)
+        # what to do with a collection without items
+        if (plan.isEmpty):
+            watched.synced = True
+            collection.localItems = list(plan.localItemsById.values())
+            return False
+
+        ResetMetrics()
+        SteamDownloaderAPI.UpdateCollection(
+            collection, self.directory, True, self.removeDeletedItems, plan
+        )
+        watched.synced = True
+        collection.localItems = self.readDownloadedItems(collection)
+        return True
+
+    def readDownloadedItems(self, collection: WorkshopCollection) -> list[WorkshopItem]:
+        '''Returns items saved to collection.json by the last download'''
+        path = f"{self.directory}/{collection.name}/collection.json"
+        if (not filemanager.doesFileExist(path)):
+            return []
+        try:
+            jsonDict = filemanager.readJsonFile(path)
+        except ValueError:
+            return []
+        return [WorkshopItem.fromJson(item) for item in jsonDict.get("items", [])]
+
+    def __str__(self) -> str:
+        return f"{{CollectionWatcher - directory: {self.directory} | collections: {self.collections}}}"
+
+    def __repr__(self) -> str:
+        return self.__str__()
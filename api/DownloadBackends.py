@@ -0,0 +1,213 @@
+from typing import Callable
+import collections
+import threading
+
+from classes import WorkshopItem
+from utils import AssertParameter, filemanager, transport
+
+
+class DownloadBackendException(Exception):
+    pass
+
+
+class Settings:
+    # results remembered for every backend
+    statsWindow: int = 20
+    # weight of the newest measurement in the rolling averages
+    smoothing: float = 0.3
+    # success rate a failing backend is ranked with, so it is still tried when nothing else is left
+    minSuccessRate: float = 0.05
+    # where items are found in a mirror, relative to its location
+    mirrorPattern: str = "{id}/{lastUpdated}.zip"
+
+
+class DownloadBackend:
+    '''Source of item zipfiles.\n
+    locate() returns url or local path of the zipfile, the download stage fetches it.
+    expectedOverhead and expectedRate are used until the backend is measured.'''
+    # backends which can be enabled, in their default order
+    names: list[str] = ["mirror", "direct", "node"]
+    name: str = ""
+
+    def __init__(self, expectedOverhead: float, expectedRate: float) -> None:
+        # seconds before the first byte, and bytes per second after it
+        self.expectedOverhead = expectedOverhead
+        self.expectedRate = expectedRate
+
+    def has(self, item: WorkshopItem) -> bool:
+        '''Returns False if backend certainly can not serve item, without asking anyone'''
+        return True
+
+    def locate(self, item: WorkshopItem) -> str:
+        '''Returns url or path of item's zipfile. Raises DownloadBackendException if backend does not have it'''
+        raise NotImplementedError()
+
+    def __str__(self) -> str:
+        return f"{{{type(self).__name__} - name: {self.name}}}"
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+class NodeBackend(DownloadBackend):
+    '''steamworkshopdownloader.io: serves every item, after waiting for it to be prepared'''
+    name = "node"
+
+    def __init__(self, resolve: Callable[[WorkshopItem], str], expectedOverhead: float, expectedRate: float) -> None:
+        super().__init__(expectedOverhead, expectedRate)
+        if (not callable(resolve)):
+            raise TypeError("resolve must be callable")
+        self.resolve = resolve
+
+    def locate(self, item: WorkshopItem) -> str:
+        return self.resolve(item)
+
+
+class DirectBackend(DownloadBackend):
+    '''file_url given by steam api for legacy items, downloaded without any preparation'''
+    name = "direct"
+
+    def has(self, item: WorkshopItem) -> bool:
+        return bool(item.fileUrl)
+
+    def locate(self, item: WorkshopItem) -> str:
+        if (not item.fileUrl):
+            raise DownloadBackendException(f"Item ({item}) has no file_url")
+        return item.fileUrl
+
+
+class MirrorBackend(DownloadBackend):
+    '''Zipfiles of items in a local folder or on an http server, laid out by Settings.mirrorPattern'''
+    name = "mirror"
+
+    def __init__(self, location: str, expectedOverhead: float, expectedRate: float) -> None:
+        super().__init__(expectedOverhead, expectedRate)
+        AssertParameter(location, str, "location")
+        self.location = location.rstrip("/")
+        self.isRemote = isUrl(location)
+
+    def pathFor(self, item: WorkshopItem) -> str:
+        return f"{self.location}/" + Settings.mirrorPattern.format(
+            id=item.id, appid=item.appid, lastUpdated=item.lastUpdated
+        )
+
+    def has(self, item: WorkshopItem) -> bool:
+        # files of a remote mirror are only checked by locate()
+        return self.isRemote or filemanager.doesFileExist(self.pathFor(item))
+
+    def locate(self, item: WorkshopItem) -> str:
+        path = self.pathFor(item)
+        if (not self.isRemote):
+            if (not filemanager.doesFileExist(path)):
+                raise DownloadBackendException(f"Item ({item}) is not in mirror {self.location}")
+            return path
+
+        response = transport.head(path, retry=False, allow_redirects=True)
+        if (response.status_code == 404):
+            raise DownloadBackendException(f"Item ({item}) is not in mirror {self.location}")
+        response.raise_for_status()
+        return path
+
+
+def isUrl(location: str) -> bool:
+    '''Returns False if location returned by a backend is a local file'''
+    return location.startswith("http://") or location.startswith("https://")
+
+
+class BackendStats:
+    '''Rolling success rate, overhead and speed of a single backend'''
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.items = 0
+        self.failures = 0
+        self.bytes = 0
+        # -1 until the first successful item
+        self.overhead: float = -1
+        self.rate: float = -1
+        # seconds lost on a failed attempt
+        self.failureSeconds: float = 0
+        self._results: collections.deque = collections.deque(maxlen=Settings.statsWindow)
+
+    @property
+    def successRate(self) -> float:
+        if (len(self._results) == 0):
+            return 1
+        return self._results.count(True) / len(self._results)
+
+    def recordSuccess(self, overhead: float, transferSeconds: float, bytes: int) -> None:
+        self.items += 1
+        self.bytes += bytes
+        self._results.append(True)
+        self.overhead = smoothed(self.overhead, overhead)
+        if (bytes > 0 and transferSeconds > 0):
+            self.rate = smoothed(self.rate, bytes / transferSeconds)
+
+    def recordFailure(self, seconds: float) -> None:
+        self.items += 1
+        self.failures += 1
+        self._results.append(False)
+        self.failureSeconds += Settings.smoothing * (seconds - self.failureSeconds)
+
+    def expectedSeconds(self, backend: DownloadBackend, size: int) -> float:
+        '''Returns expected seconds until item of size bytes is downloaded, counting attempts which fail.
+        Trying backends from the lowest value is the fastest order on average'''
+        overhead = self.overhead if self.overhead >= 0 else backend.expectedOverhead
+        rate = self.rate if self.rate > 0 else backend.expectedRate
+        successRate = max(self.successRate, Settings.minSuccessRate)
+        successSeconds = overhead + max(size, 0) / rate
+        attemptSeconds = successRate * successSeconds + (1 - successRate) * self.failureSeconds
+        return attemptSeconds / successRate
+
+    def __str__(self) -> str:
+        overhead = f"{self.overhead:.1f}s" if self.overhead >= 0 else "-"
+        rate = f"{self.rate / 1024 / 1024:.2f} MB/s" if self.rate > 0 else "-"
+        return (
+            f"{self.name}: {self.items - self.failures} items, "
+            f"{self.failures} failed, first byte after {overhead}, {rate}"
+        )
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+def smoothed(average: float, value: float) -> float:
+    '''Returns rolling average with value added. Negative average is unknown'''
+    if (average < 0):
+        return value
+    return average + Settings.smoothing * (value - average)
+
+
+class BackendRanking:
+    '''Orders backends for every item by their measured speed and success rate'''
+
+    def __init__(self) -> None:
+        self.stats: dict[str, BackendStats] = {}
+        self._lock = threading.Lock()
+
+    def rankedBackends(self, backends: list[DownloadBackend], item: WorkshopItem) -> list[DownloadBackend]:
+        '''Returns backends which may have item, fastest first. Equal backends keep their order'''
+        candidates = [backend for backend in backends if backend.has(item)]
+        with self._lock:
+            expectedSeconds = {
+                backend.name: self._stats(backend.name).expectedSeconds(backend, item.fileSize)
+                for backend in candidates
+            }
+        return sorted(candidates, key=lambda backend: expectedSeconds[backend.name])
+
+    def recordSuccess(self, name: str, overhead: float, transferSeconds: float, bytes: int) -> None:
+        with self._lock:
+            self._stats(name).recordSuccess(overhead, transferSeconds, bytes)
+
+    def recordFailure(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._stats(name).recordFailure(seconds)
+
+    def summary(self) -> list[str]:
+        with self._lock:
+            return [str(stats) for stats in self.stats.values() if stats.items > 0]
+
+    def _stats(self, name: str) -> BackendStats:
+        if (name not in self.stats):
+            self.stats[name] = BackendStats(name)
+        return self.stats[name]
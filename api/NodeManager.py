@@ -0,0 +1,188 @@
+from typing import Callable, Optional
+import collections
+import threading
+import time
+
+from utils import AssertParameter, LazyModule, logger, transport
+from utils.transport import requests
+from utils.metrics import Metrics
+
+futures = LazyModule("concurrent.futures")
+
+
+class NodeManagerException(Exception):
+    pass
+
+
+class Settings:
+    # results remembered for every node
+    statsWindow: int = 20
+    # weight of the newest latency in the rolling average
+    latencySmoothing: float = 0.3
+    # node is unhealthy when more of its recent requests failed
+    maxErrorRate: float = 0.5
+    # after this many failures in a row node is not used for cooldown seconds
+    maxConsecutiveErrors: int = 3
+    cooldown: float = 30
+    # seconds to wait for a probe response
+    probeTimeout: float = 5
+
+
+class NodeStats:
+    '''Rolling latency and error rate of a single node'''
+
+    def __init__(self, nodeId: int) -> None:
+        self.nodeId = nodeId
+        self.requests = 0
+        self.errors = 0
+        self.consecutiveErrors = 0
+        # -1 until the first successful request
+        self.latency: float = -1
+        self.cooldownUntil: float = 0
+        self._results: collections.deque = collections.deque(maxlen=Settings.statsWindow)
+
+    @property
+    def errorRate(self) -> float:
+        if (len(self._results) == 0):
+            return 0
+        return self._results.count(False) / len(self._results)
+
+    @property
+    def healthy(self) -> bool:
+        return (
+            time.monotonic() >= self.cooldownUntil and
+            self.errorRate <= Settings.maxErrorRate
+        )
+
+    def recordSuccess(self, latency: float) -> None:
+        self.requests += 1
+        self.consecutiveErrors = 0
+        self._results.append(True)
+        if (self.latency < 0):
+            self.latency = latency
+        else:
+            self.latency += Settings.latencySmoothing * (latency - self.latency)
+
+    def recordError(self) -> None:
+        self.requests += 1
+        self.errors += 1
+        self.consecutiveErrors += 1
+        self._results.append(False)
+        if (self.consecutiveErrors >= Settings.maxConsecutiveErrors):
+            self.cooldownUntil = time.monotonic() + Settings.cooldown
+
+    def score(self) -> float:
+        '''Lower is better. Unknown latency is treated as average, so new nodes get tried'''
+        latency = self.latency if self.latency >= 0 else 1
+        return latency * (1 + 4 * self.errorRate)
+
+    def __str__(self) -> str:
+        latency = f"{self.latency * 1000:.0f} ms" if self.latency >= 0 else "-"
+        return (
+            f"node {self.nodeId}: {self.requests} requests, "
+            f"{self.errors} errors, latency {latency}"
+            f"{'' if self.healthy else ' (unhealthy)'}"
+        )
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+class NodeManager:
+    '''Sends requests to the fastest healthy node, failing over to the next one on errors'''
+
+    def __init__(self, nodeIds: list[int], endpointUrl: Callable[[int], str]) -> None:
+        AssertParameter(nodeIds, list, "nodeIds")
+        if (len(nodeIds) == 0):
+            raise ValueError("NodeManager needs at least one node")
+        if (not callable(endpointUrl)):
+            raise TypeError("endpointUrl must be callable")
+
+        self.endpointUrl = endpointUrl
+        self.stats: dict[int, NodeStats] = {
+            nodeId: NodeStats(nodeId) for nodeId
+            in nodeIds
+        }
+        self.probed = False
+        self._lock = threading.Lock()
+        self._probeLock = threading.Lock()
+
+    def probe(self) -> None:
+        '''Measures latency of every node with an empty status request'''
+        def probeNode(nodeId: int) -> None:
+            try:
+                self.post(nodeId, "status", json={"uuids": []}, timeout=Settings.probeTimeout)
+            except requests.RequestException:
+                pass
+
+        with futures.ThreadPoolExecutor(max_workers=len(self.stats)) as executor:
+            list(executor.map(probeNode, self.stats))
+        self.probed = True
+
+        if (not any(stats.healthy for stats in self.stats.values())):
+            logger.LogWarning(
+                f"{logger.StartIndent()}No steamworkshopdownloader.io node answered the probe"
+            )
+
+    def rankedNodes(self) -> list[int]:
+        '''Returns node ids, best first. Unhealthy nodes are last, but still included'''
+        with self._lock:
+            stats = list(self.stats.values())
+        return [
+            nodeStats.nodeId for nodeStats
+            in sorted(stats, key=lambda nodeStats: (not nodeStats.healthy, nodeStats.score()))
+        ]
+
+    def bestNode(self) -> int:
+        return self.rankedNodes()[0]
+
+    def isHealthy(self, nodeId: int) -> bool:
+        with self._lock:
+            return self.stats[nodeId].healthy
+
+    def post(self, nodeId: int, endpoint: str, **kwargs) -> "requests.Response":
+        '''Sends request to a node and records how it went. Server errors raise requests.HTTPError'''
+        start = time.monotonic()
+        try:
+            # with more nodes, failing over is faster than retrying the same one
+            response = transport.post(
+                self.endpointUrl(nodeId) + endpoint,
+                retry=len(self.stats) == 1,
+                **kwargs
+            )
+            # client errors are answers of a working node
+            if (response.status_code >= 500):
+                response.raise_for_status()
+        except requests.RequestException:
+            with self._lock:
+                self.stats[nodeId].recordError()
+            raise
+
+        with self._lock:
+            self.stats[nodeId].recordSuccess(time.monotonic() - start)
+        return response
+
+    def postToBest(self, endpoint: str, **kwargs) -> tuple["requests.Response", int]:
+        '''Sends request to the best node, trying other nodes if it fails.
+        Returns response and id of the node which answered'''
+        if (not self.probed):
+            # first requests are sent from many workers at once, only one of them probes
+            with self._probeLock:
+                if (not self.probed):
+                    self.probe()
+
+        lastException: Optional[Exception] = None
+        for nodeId in self.rankedNodes():
+            try:
+                return self.post(nodeId, endpoint, **kwargs), nodeId
+            except requests.RequestException as exception:
+                lastException = exception
+                Metrics().count("node_failovers")
+
+        raise NodeManagerException(
+            f"All nodes failed to answer {endpoint} request: {lastException}"
+        )
+
+    def summary(self) -> list[str]:
+        with self._lock:
+            return [str(stats) for stats in self.stats.values()]
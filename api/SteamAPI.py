@@ -1,15 +1,90 @@
-import requests
 import json
 import re
+import time
+
+from typing import Optional
 
 from classes import WorkshopItem
-from utils import logger
+from utils import AssertParameter, LazyModule, logger, transport
+from utils.transport import requests
+from utils.cache import DiskCache
+from utils.metrics import Metrics
+
+futures = LazyModule("concurrent.futures")
 
 
 class SteamAPIException(Exception):
     pass
 
 
+class Settings:
+    # steam web api, other hosts serving the same endpoints can be used for testing
+    apiUrl: str = "http://api.steampowered.com"
+    # ids sent in one GetPublishedFileDetails request
+    pageSize: int = 100
+    # pages fetched at the same time
+    pageJobs: int = 4
+    # attempts for every page before giving up
+    pageAttempts: int = 3
+    # seconds before the first retry, doubled for every next one
+    pageRetryDelay: float = 1
+    # .json file responses are cached in, empty string disables the cache
+    cachePath: str = ""
+    # seconds cached responses are used for
+    cacheTtl: float = 600
+    # least recently used responses are evicted above this amount
+    cacheMaxEntries: int = 100000
+    # ignore cached responses, but still cache the fresh ones
+    bypassCache: bool = False
+
+    def setPageSize(pageSize: int):
+        AssertParameter(pageSize, int, "pageSize")
+        if (pageSize < 1):
+            raise ValueError(f"Page size must be greater than 0: {pageSize}")
+        Settings.pageSize = pageSize
+
+    def setPageJobs(jobs: int):
+        AssertParameter(jobs, int, "jobs")
+        if (jobs < 1):
+            raise ValueError(f"Amount of page jobs must be greater than 0: {jobs}")
+        Settings.pageJobs = jobs
+
+    def setCache(path: str, ttl: float = -1, maxEntries: int = -1):
+        '''Enables metadata cache stored at path. Empty path disables it'''
+        global _cache
+
+        AssertParameter(path, str, "path")
+        AssertParameter(ttl, (int, float), "ttl")
+        AssertParameter(maxEntries, int, "maxEntries")
+        Settings.cachePath = path
+        if (ttl >= 0):
+            Settings.cacheTtl = ttl
+        if (maxEntries > 0):
+            Settings.cacheMaxEntries = maxEntries
+        _cache = None
+
+
+_cache: Optional[DiskCache] = None
+# fields of steam api responses worth caching, descriptions and tags are not used
+_cachedFileDetailsFields: list[str] = [
+    "publishedfileid", "result", "consumer_app_id", "title",
+    "time_updated", "file_size", "file_url", "filename"
+]
+
+
+def Cache() -> Optional[DiskCache]:
+    '''Returns metadata cache, or None if it is disabled'''
+    global _cache
+
+    if (not Settings.cachePath):
+        return None
+    if (_cache is None):
+        _cache = DiskCache(
+            Settings.cachePath, Settings.cacheTtl, Settings.cacheMaxEntries
+        )
+    return _cache
+
+
 class Validator:
     @staticmethod
     def ValidSteamItemUrl(url: str) -> bool:
@@ -60,17 +135,41 @@ class Converter:
 class ISteamRemoteStorage:
     @ staticmethod
     def GetCollectionDetails(collectionId: int) -> dict:
-        '''Returns id from steam url.'''
+        '''Returns details of a collection with its children'''
         if (not Validator.ValidSteamItemId(collectionId)):
             raise SteamAPIException(
                 f"Collection id is not valid: {collectionId}"
             )
 
-        apiString = "http://api.steampowered.com/ISteamRemoteStorage/GetCollectionDetails/v1"
+        collectitonDetails = ISteamRemoteStorage.GetCollectionDetailsBatch([collectionId])[0]
+        collectionSteamApiResult = collectitonDetails["result"]
+        if (collectionSteamApiResult != 1):
+            if (collectionSteamApiResult == 9):
+                raise SteamAPIException("Collection does not exist!")
+            else:
+                raise SteamAPIException(
+                    f"{logger.StartIndent()}Uknown error occurred while trying to fetch collection details.\n"
+                    f"{logger.Indent(1)}Steam api returned result code: {collectionSteamApiResult}"
+                )
+        return collectitonDetails
+
+    @ staticmethod
+    def GetCollectionDetailsBatch(collectionIds: list[int]) -> list[dict]:
+        '''Returns details of several collections, asked for in one request.
+        Every collection has its own result code, failed ones are not raised'''
+        for collectionId in collectionIds:
+            if (not Validator.ValidSteamItemId(collectionId)):
+                raise SteamAPIException(
+                    f"Collection id is not valid: {collectionId}"
+                )
 
-        data = {"collectioncount": 1, "publishedfileids[0]": collectionId}
+        apiString = f"{Settings.apiUrl}/ISteamRemoteStorage/GetCollectionDetails/v1"
+
+        data = {"collectioncount": len(collectionIds)}
+        for index, collectionId in enumerate(collectionIds):
+            data[f"publishedfileids[{index}]"] = collectionId
         headers = {"Content-type": "application/x-www-form-urlencoded"}
-        response = requests.post(
+        response = transport.post(
             apiString, data=data, headers=headers
         )
         try:
@@ -95,21 +194,11 @@ class ISteamRemoteStorage:
                 f"{logger.Indent(1)}Steam API returned result code: {steamApiResult}"
             )
 
-        collectitonDetails = reponseDictionary["response"]["collectiondetails"][0]
-        collectionSteamApiResult = collectitonDetails["result"]
-        if (collectionSteamApiResult != 1):
-            if (collectionSteamApiResult == 9):
-                raise SteamAPIException("Collection does not exist!")
-            else:
-                raise SteamAPIException(
-                    f"{logger.StartIndent()}Uknown error occurred while trying to fetch collection details.\n"
-                    f"{logger.Indent(1)}Steam api returned result code: {collectionSteamApiResult}"
-                )
-        return collectitonDetails
+        return reponseDictionary["response"]["collectiondetails"]
 
     @ staticmethod
     def GetPublishedFileDetails(fileIdList: list[int]) -> dict:
-        apiUrl = "http://api.steampowered.com/ISteamRemoteStorage/GetPublishedFileDetails/v1"
+        apiUrl = f"{Settings.apiUrl}/ISteamRemoteStorage/GetPublishedFileDetails/v1"
 
         data = {}
         validItems = 0
@@ -124,7 +213,7 @@ class ISteamRemoteStorage:
         data["itemcount"] = validItems
 
         headers = {"Content-type": "application/x-www-form-urlencoded"}
-        response = requests.post(
+        response = transport.post(
             apiUrl, data=data, headers=headers
         )
         try:
@@ -154,14 +243,166 @@ class ISteamRemoteStorage:
         return publishedFileDetails
 
 
+def GetPublishedFileDetailsPaged(fileIdList: list[int]) -> list[dict]:
+    '''Fetches published file details page by page, several pages at the same time.
+    Failed pages are retried. Returns details in the same order as fileIdList'''
+    AssertParameter(fileIdList, list, "fileIdList")
+
+    pages = [
+        fileIdList[index:index + Settings.pageSize] for index
+        in range(0, len(fileIdList), Settings.pageSize)
+    ]
+
+    def fetchPage(page: list[int]) -> list[dict]:
+        for attempt in range(Settings.pageAttempts):
+            try:
+                with Metrics().timer("metadata"):
+                    return ISteamRemoteStorage.GetPublishedFileDetails(page)
+            except (SteamAPIException, requests.RequestException) as exception:
+                if (attempt + 1 >= Settings.pageAttempts):
+                    raise SteamAPIException(
+                        f"{logger.StartIndent()}Could not fetch {len(page)} items after {Settings.pageAttempts} attempts.\n"
+                        f"{exception}"
+                    )
+                logger.LogWarning(
+                    f"{logger.StartIndent()}Could not fetch {len(page)} items, retrying..."
+                )
+                Metrics().count("metadata_retries")
+                time.sleep(Settings.pageRetryDelay * 2 ** attempt)
+
+    if (len(pages) <= 1):
+        return fetchPage(fileIdList)
+
+    with futures.ThreadPoolExecutor(
+        max_workers=min(Settings.pageJobs, len(pages)),
+        thread_name_prefix="steamapi-page"
+    ) as executor:
+        # map keeps results in page order
+        pageDetails = list(executor.map(fetchPage, pages))
+
+    return [
+        details for page
+        in pageDetails
+        for details in page
+    ]
+
+
+def GetCachedPublishedFileDetails(fileIdList: list[int]) -> list[dict]:
+    '''Returns published file details, fresh cached ones are not fetched again.
+    Keeps the order of fileIdList'''
+    cache = Cache()
+    if (cache is None):
+        return GetPublishedFileDetailsPaged(fileIdList)
+
+    cachedDetails: dict[str, dict] = {}
+    if (not Settings.bypassCache):
+        cachedDetails = cache.getMany([str(fileId) for fileId in fileIdList])
+
+    missingIds = [
+        fileId for fileId
+        in fileIdList
+        if str(fileId) not in cachedDetails
+    ]
+    fetchedDetails = GetPublishedFileDetailsPaged(missingIds) if len(missingIds) > 0 else []
+
+    # failed lookups are not cached, they are asked for again next time
+    cache.setMany({
+        str(details["publishedfileid"]): {
+            field: details[field] for field
+            in _cachedFileDetailsFields
+            if field in details
+        } for details
+        in fetchedDetails
+        if details.get("result") == 1
+    })
+    cache.save()
+
+    detailsById = dict(cachedDetails)
+    for details in fetchedDetails:
+        detailsById[str(details["publishedfileid"])] = details
+
+    # invalid ids are skipped by steam api requests, skip them here too
+    return [
+        detailsById[str(fileId)] for fileId
+        in fileIdList
+        if str(fileId) in detailsById
+    ]
+
+
+def GetCachedCollectionDetails(collectionId: int) -> dict:
+    '''Returns collection details, from cache if they are fresh'''
+    if (Cache() is None):
+        return ISteamRemoteStorage.GetCollectionDetails(collectionId)
+
+    collectionDetails = GetCachedCollectionDetailsBatch([collectionId]).get(collectionId)
+    if (collectionDetails is None):
+        # not cached because it failed, ask again to get the error
+        return ISteamRemoteStorage.GetCollectionDetails(collectionId)
+    return collectionDetails
+
+
+def GetCachedCollectionDetailsBatch(collectionIds: list[int]) -> dict[int, dict]:
+    '''Returns details of collections which exist, by collection id.
+    Missing collections are fetched pageSize at a time, fresh cached ones are not fetched again'''
+    AssertParameter(collectionIds, list, "collectionIds")
+
+    cache = Cache()
+    detailsById: dict[int, dict] = {}
+    if (cache is not None and not Settings.bypassCache):
+        cachedDetails = cache.getMany([f"collection:{collectionId}" for collectionId in collectionIds])
+        for collectionId in collectionIds:
+            details = cachedDetails.get(f"collection:{collectionId}")
+            if (details is not None):
+                detailsById[collectionId] = details
+
+    missingIds = list(dict.fromkeys(
+        collectionId for collectionId
+        in collectionIds
+        if collectionId not in detailsById
+    ))
+    fetchedDetails: list[dict] = []
+    for index in range(0, len(missingIds), Settings.pageSize):
+        with Metrics().timer("metadata"):
+            fetchedDetails += ISteamRemoteStorage.GetCollectionDetailsBatch(
+                missingIds[index:index + Settings.pageSize]
+            )
+
+    fetchedById: dict[int, dict] = {}
+    for details in fetchedDetails:
+        if (details.get("result") != 1):
+            logger.LogWarning(
+                f"{logger.StartIndent()}{details.get('publishedfileid')}: Could not fetch collection, "
+                f"steam api returned result code: {details.get('result')}"
+            )
+            continue
+        fetchedById[int(details["publishedfileid"])] = details
+    detailsById.update(fetchedById)
+
+    if (cache is not None):
+        # cached details are not stored again, that would keep them fresh forever
+        cache.setMany({
+            f"collection:{collectionId}": {
+                "publishedfileid": details.get("publishedfileid"),
+                "result": details["result"],
+                "children": [
+                    {"publishedfileid": child["publishedfileid"], "filetype": child["filetype"]}
+                    for child
+                    in details.get("children", [])
+                ]
+            } for collectionId, details
+            in fetchedById.items()
+        })
+        cache.save()
+
+    return detailsById
+
+
 def GetWorkshopCollectionInfo(collectionId: int) -> tuple[str, int, list[WorkshopItem]]:
     '''Returns collection name, appid and list of workshop items'''
 
     collectionDetails = None
     try:
-        collectionDetails = ISteamRemoteStorage.GetCollectionDetails(
-            collectionId
-        )
+        collectionDetails = GetCachedCollectionDetails(collectionId)
     except SteamAPIException as exception:
         raise SteamAPIException(
             f"Exception occurred while trying to get collection information:\n"
@@ -187,15 +428,64 @@ def GetWorkshopCollectionInfo(collectionId: int) -> tuple[str, int, list[Worksho
     )
 
 
+def GetWorkshopCollectionsInfo(collectionIds: list[int], extraItemIds: list[int] = []) -> tuple[dict[int, tuple[str, int, list[WorkshopItem]]], dict[int, WorkshopItem]]:
+    '''Returns name, appid and workshop items of several collections (by collection id),
+    and info of every item in them and in extraItemIds (by item id).\n
+    Collection details are fetched in batches, and every item shared by collections is fetched once.
+    Collections which do not exist are left out'''
+    AssertParameter(collectionIds, list, "collectionIds")
+    AssertParameter(extraItemIds, list, "extraItemIds")
+
+    try:
+        collectionsDetails = GetCachedCollectionDetailsBatch(collectionIds)
+    except SteamAPIException as exception:
+        raise SteamAPIException(
+            f"Exception occurred while trying to get collections information:\n"
+            f"{exception}"
+        )
+
+    childrenIds: dict[int, list[int]] = {
+        collectionId: [
+            int(item["publishedfileid"]) for item
+            in details.get("children", [])
+            if (item["filetype"] == 0)
+        ] for collectionId, details
+        in collectionsDetails.items()
+    }
+
+    # every id once, in the order it was first seen
+    uniqueIds = list(dict.fromkeys(
+        list(collectionsDetails) +
+        [id for ids in childrenIds.values() for id in ids] +
+        extraItemIds
+    ))
+    itemsById: dict[int, WorkshopItem] = {
+        item.id: item for item
+        in GetItemsInfo(uniqueIds)
+    }
+
+    collectionsInfo: dict[int, tuple[str, int, list[WorkshopItem]]] = {}
+    for collectionId, ids in childrenIds.items():
+        collectionItem = itemsById.get(collectionId)
+        if (collectionItem is None):
+            continue
+        collectionsInfo[collectionId] = (
+            collectionItem.name,
+            collectionItem.appid,
+            # every collection gets its own copies, so changing one does not change the others
+            [itemsById[id].copy() for id in ids if id in itemsById]
+        )
+
+    return collectionsInfo, itemsById
+
+
 def GetLocalCollectionInfo(collectionItems: list[WorkshopItem]) -> list[WorkshopItem]:
     return GetItemsInfo([item.id for item in collectionItems])
 
 
 def GetItemsInfo(fileIdList: list[int]) -> list[WorkshopItem]:
     try:
-        items = ISteamRemoteStorage.GetPublishedFileDetails(
-            fileIdList
-        )
+        items = GetCachedPublishedFileDetails(fileIdList)
     except SteamAPIException as exception:
         raise SteamAPIException(
             f"Exception occurred while trying to get updated items info:\n"
@@ -219,7 +509,10 @@ def GetItemsInfo(fileIdList: list[int]) -> list[WorkshopItem]:
             int(item["publishedfileid"]),
             int(item["consumer_app_id"]),
             item["title"],
-            int(item["time_updated"])
+            int(item["time_updated"]),
+            int(item.get("file_size", -1)),
+            item.get("file_url", ""),
+            item.get("filename", "")
         ) for item
         in items
         if item["result"] == 1
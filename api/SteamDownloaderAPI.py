@@ -1,45 +1,501 @@
 import json
-from typing import Optional
-from zipfile import BadZipFile
-import requests
+from typing import Any, BinaryIO, Callable, Optional, Union
 import io
 import time
 import random
+import threading
+import functools
+import os
+import urllib.parse
 
 from classes import WorkshopCollection
 from classes import WorkshopItem
-
-from utils import AssertParameter, filemanager, logger
-from utils.logger import Indent, Spinner
+from classes import UpdatePlan
+
+from utils import AssertParameter, filemanager, logger, transport
+from utils.transport import requests
+from utils.logger import Spinner
+from utils.pipeline import Pipeline, PipelineStage, PipelineResult, PipelineStoppedException
+from utils.itemStore import ItemStore
+from utils.journal import Journal
+from utils.rateLimiter import RateLimiter, RateWindow
+from utils.metrics import Metrics
+from utils.scheduler import Scheduler
 from api import SteamAPI
+from api.NodeManager import NodeManager, NodeManagerException
+from api.DownloadBackends import DownloadBackend, DownloadBackendException, NodeBackend, DirectBackend, MirrorBackend, BackendRanking, isUrl
 
 
 _ongoingDownload: WorkshopCollection = None
 _ongoingDownloadSaveDirectory: str = ""
 _ongoingDownloadDownloadedItems: list[WorkshopItem] = []
+# finished items of the ongoing download, until they are saved to collection.json
+_ongoingDownloadJournal: Optional[Journal] = None
+# set when download is stopped, running downloads check it between chunks
+_downloadStopEvent: threading.Event = threading.Event()
+_nodes: Optional[NodeManager] = None
+_nodesLock: threading.Lock = threading.Lock()
+_store: Optional[ItemStore] = None
+_storeLock: threading.Lock = threading.Lock()
+# shapes traffic of all downloads together
+_rateLimiter: RateLimiter = RateLimiter()
+# measured speed and success rate of download backends, kept between downloads
+_backendRanking: BackendRanking = BackendRanking()
+
+
+class DownloadStoppedException(Exception):
+    pass
+
+
+class StaleDownloadUrlException(Exception):
+    '''Storage node no longer serves url of an interrupted download, item has to be located again'''
+    pass
+
 
 class Settings:
     # taken from main.js on steamworkshopdownloader.io
     nodeRange: list[int] = [4, 8]
-    nodeId: int = random.randint(nodeRange[0], nodeRange[1])
-    
-    def getEndpointUrl():
-        return f"https://node0{Settings.getNodeId()}.steamworkshopdownloader.io/prod/api/download/"
+    # api of a node, {nodeId} is replaced with id of the node
+    nodeUrl: str = "https://node0{nodeId}.steamworkshopdownloader.io/prod/api/download/"
+    # prepared zipfile, {host} and {path} are taken from its status
+    storageUrl: str = "https://{host}/prod//storage//{path}?uuid={uuid}"
+    # node all requests are sent to, None picks the best node for every request
+    nodeId: Optional[int] = None
+    # workers for network stages (resolving zipfile url, downloading)
+    networkJobs: int = 4
+    # workers extracting downloaded zipfiles
+    extractJobs: int = 2
+    # items submitted for preparation at the same time
+    resolveWindow: int = 16
+    # seconds before the first status request,
+    # every next one waits statusPollBackoff times longer (up to statusPollMaxDelay)
+    statusPollFirstDelay: float = 0.5
+    statusPollBackoff: float = 1.6
+    statusPollMaxDelay: float = 8
+    # random part of every delay, as a fraction of it
+    statusPollJitter: float = 0.2
+    # items due this many seconds after a tick are counted as polled by it
+    statusPollCoalesce: float = 0.25
+    # seconds before item preparation times out,
+    # plus preparationTimeoutPerMB for every megabyte of item's file_size
+    preparationTimeout: float = 10
+    preparationTimeoutPerMB: float = 0.25
+    # write downloads to a temporary file instead of keeping them in memory
+    spoolDownloads: bool = True
+    # bytes read from the connection at once
+    chunkSize: int = 64 * 1024
+    # show progress bars of running downloads
+    showProgress: bool = True
+    # folder with items shared by all collections, "" to extract items straight to collections
+    storePath: str = ""
+    # how stored items get into collection folders: hardlink, reflink or copy
+    storeLinkMode: str = "hardlink"
+    # rewrite only changed files of updated items, using manifests of their previous zipfiles
+    deltaUpdates: bool = False
+    # when finished items are flushed from the journal to disk: always, interval or never
+    journalFsync: str = "interval"
+    journalFsyncInterval: float = 1
+    # bytes per second all downloads together may use, 0 is unlimited
+    maxRate: float = 0
+    # windows of the day with their own rate, maxRate is used outside of them
+    rateSchedule: list[RateWindow] = []
+    # .json report of stage timings and throughput written after every run, "" disables it
+    metricsPath: str = ""
+    # same report for the prometheus node_exporter textfile collector, "" disables it
+    prometheusPath: str = ""
+    # download speed and seconds to prepare an item, used to estimate duration of a plan
+    # when there is no report of a previous run in metricsPath
+    estimatedRate: float = 4 * 1024 * 1024
+    estimatedPrepareTime: float = 5
+    # order items are started in, by their size and preparation time: largest, smallest, fair or collection
+    schedulePolicy: str = "largest"
+    # sources of zipfiles tried for every item, fastest measured first:
+    # mirror, direct (file_url of legacy items) and node (steamworkshopdownloader.io)
+    backends: list[str] = ["mirror", "direct", "node"]
+    # folder or http url with zipfiles of items, "" disables the mirror
+    mirrorLocation: str = ""
+
+    def getEndpointUrl(nodeId: int = -1):
+        if (nodeId < 0):
+            nodeId = Settings.getNodeId()
+        return Settings.nodeUrl.format(nodeId=nodeId)
+
+    def getNodeIds() -> list[int]:
+        '''Returns ids of all nodes requests may be sent to'''
+        if (Settings.nodeId is not None):
+            return [Settings.nodeId]
+        return list(range(Settings.nodeRange[0], Settings.nodeRange[1] + 1))
 
     def getNodeId():
-        return Settings.nodeId
-    
-    def setNodeId(nodeId: int):
-        AssertParameter(nodeId, (int), "nodeId")
-        if (nodeId != Settings.nodeRange):
-            raise ValueError(f"nodeId not in node range: {nodeId} not in {Settings.nodeRange}")
+        '''Returns pinned node, or the best one right now'''
+        if (Settings.nodeId is not None):
+            return Settings.nodeId
+        return Nodes().bestNode()
+
+    def setNodeId(nodeId: Optional[int]):
+        '''Sends all requests to nodeId. None picks the best node for every request'''
+        global _nodes
+
+        if (nodeId is not None):
+            AssertParameter(nodeId, (int), "nodeId")
+            if (nodeId < Settings.nodeRange[0] or nodeId > Settings.nodeRange[1]):
+                raise ValueError(f"nodeId not in node range: {nodeId} not in {Settings.nodeRange}")
         Settings.nodeId = nodeId
+        _nodes = None
+
+    def getRequestUrl(nodeId: int = -1):
+        return Settings.getEndpointUrl(nodeId) + "request"
+
+    def getStatusUrl(nodeId: int = -1):
+        return Settings.getEndpointUrl(nodeId) + "status"
+
+    def setNetworkJobs(jobs: int):
+        AssertParameter(jobs, int, "jobs")
+        if (jobs < 1):
+            raise ValueError(f"Amount of network jobs must be greater than 0: {jobs}")
+        Settings.networkJobs = jobs
+
+    def setExtractJobs(jobs: int):
+        AssertParameter(jobs, int, "jobs")
+        if (jobs < 1):
+            raise ValueError(f"Amount of extract jobs must be greater than 0: {jobs}")
+        Settings.extractJobs = jobs
+
+    def setPreparationTimeout(timeout: float, timeoutPerMB: float = -1):
+        AssertParameter(timeout, (int, float), "timeout")
+        AssertParameter(timeoutPerMB, (int, float), "timeoutPerMB")
+        if (timeout <= 0):
+            raise ValueError(f"Preparation timeout must be greater than 0: {timeout}")
+        Settings.preparationTimeout = timeout
+        if (timeoutPerMB >= 0):
+            Settings.preparationTimeoutPerMB = timeoutPerMB
+
+    def getStatusPollDelay(attempt: int) -> float:
+        '''Returns seconds to wait before status request number attempt (starting from 0)'''
+        delay = min(
+            Settings.statusPollFirstDelay * Settings.statusPollBackoff ** attempt,
+            Settings.statusPollMaxDelay
+        )
+        jitter = delay * Settings.statusPollJitter
+        return max(delay + random.uniform(-jitter, jitter), 0)
+
+    def getPreparationTimeout(item: WorkshopItem) -> float:
+        '''Returns seconds item may take to prepare, scaled by its file size'''
+        if (item.fileSize <= 0):
+            return Settings.preparationTimeout
+        return Settings.preparationTimeout + \
+            Settings.preparationTimeoutPerMB * item.fileSize / (1024 * 1024)
+
+    def setResolveWindow(window: int):
+        AssertParameter(window, int, "window")
+        if (window < 1):
+            raise ValueError(f"Resolve window must be greater than 0: {window}")
+        Settings.resolveWindow = window
+
+    def setStore(path: str, linkMode: str = ""):
+        '''Downloads items to a store at path and links them into collections. "" disables the store'''
+        global _store
+
+        AssertParameter(path, str, "path")
+        AssertParameter(linkMode, str, "linkMode")
+        if (linkMode):
+            if (linkMode not in ItemStore.linkModes):
+                raise ValueError(f"Link mode must be one of {ItemStore.linkModes}: {linkMode}")
+            Settings.storeLinkMode = linkMode
+        Settings.storePath = path
+        _store = None
+
+    def setMaxRate(maxRate: float, schedule: list[RateWindow] = []):
+        '''Limits download speed of all downloads together, in bytes per second'''
+        _rateLimiter.configure(maxRate, schedule)
+        Settings.maxRate = maxRate
+        Settings.rateSchedule = schedule
+
+    def setChunkSize(chunkSize: int):
+        AssertParameter(chunkSize, int, "chunkSize")
+        if (chunkSize < 1):
+            raise ValueError(f"Chunk size must be greater than 0: {chunkSize}")
+        Settings.chunkSize = chunkSize
+
+    def setMetrics(path: str, prometheusPath: str = ""):
+        '''Writes metrics of every run to path (json) and prometheusPath (textfile). "" disables them'''
+        AssertParameter(path, str, "path")
+        AssertParameter(prometheusPath, str, "prometheusPath")
+        Settings.metricsPath = path
+        Settings.prometheusPath = prometheusPath
+
+    def setSchedulePolicy(policy: str):
+        AssertParameter(policy, str, "policy")
+        if (policy not in Scheduler.policies):
+            raise ValueError(f"Schedule policy must be one of {Scheduler.policies}: {policy}")
+        Settings.schedulePolicy = policy
+
+    def setBackends(backends: list[str], mirrorLocation: str = ""):
+        '''Downloads items from backends. Order is used until their speed is measured'''
+        AssertParameter(backends, list, "backends")
+        AssertParameter(mirrorLocation, str, "mirrorLocation")
+        if (len(backends) == 0):
+            raise ValueError("At least one download backend is required")
+        for backend in backends:
+            if (backend not in DownloadBackend.names):
+                raise ValueError(f"Download backend must be one of {DownloadBackend.names}: {backend}")
+        if (len(set(backends)) != len(backends)):
+            raise ValueError(f"Download backends must not repeat: {backends}")
+        Settings.backends = backends
+        Settings.mirrorLocation = mirrorLocation
+
+    def setJournalFsync(policy: str, interval: float = -1):
+        AssertParameter(policy, str, "policy")
+        AssertParameter(interval, (int, float), "interval")
+        if (policy not in Journal.fsyncPolicies):
+            raise ValueError(f"Journal fsync policy must be one of {Journal.fsyncPolicies}: {policy}")
+        Settings.journalFsync = policy
+        if (interval >= 0):
+            Settings.journalFsyncInterval = interval
+
+
+def Nodes() -> NodeManager:
+    '''Returns manager of steamworkshopdownloader.io nodes, shared by all downloads'''
+    global _nodes
+
+    with _nodesLock:
+        if (_nodes is None):
+            _nodes = NodeManager(Settings.getNodeIds(), Settings.getEndpointUrl)
+        return _nodes
+
+
+def Store() -> Optional[ItemStore]:
+    '''Returns store of extracted items, or None if it is disabled'''
+    global _store
+
+    if (not Settings.storePath):
+        return None
+    with _storeLock:
+        if (_store is None):
+            _store = ItemStore(Settings.storePath, Settings.storeLinkMode)
+        return _store
+
+
+def WriteMetrics() -> None:
+    '''Writes metrics of everything downloaded so far to Settings.metricsPath and Settings.prometheusPath'''
+    if (not Settings.metricsPath and not Settings.prometheusPath):
+        return
+
+    metrics = Metrics()
+    extractSummary = metrics.stageSummary("extract")
+    report = metrics.report(
+        extractSummary["count"] - extractSummary["failed"],
+        metrics.stageSummary("download")["bytes"]
+    )
+    try:
+        if (Settings.metricsPath):
+            metrics.writeJson(Settings.metricsPath, report)
+        if (Settings.prometheusPath):
+            metrics.writePrometheus(Settings.prometheusPath, report)
+    except OSError as exception:
+        logger.LogWarning(
+            f"{logger.StartIndent()}Could not write metrics: {exception}"
+        )
+        return
+
+    logger.LogMessage(
+        f"{logger.Indent(1)}{report['items']} items in {report['wallSeconds']:.1f}s: "
+        f"{report['itemsPerMinute']:.1f} items/min, {report['mbPerSecond']:.2f} MB/s"
+    )
+
+
+def LogBackendStats() -> None:
+    '''Prints items, failures and speed of every download backend used'''
+    summary = _backendRanking.summary()
+    if (len(summary) < 2):
+        return
 
-    def getRequestUrl():
-        return Settings.getEndpointUrl() + "request"
+    logger.LogMessage(f"{logger.Indent(1)}Download backends:")
+    for line in summary:
+        logger.LogMessage(f"{logger.Indent(2)}{line}")
 
-    def getStatusUrl():
-        return Settings.getEndpointUrl() + "status"
+
+def LogNodeStats() -> None:
+    '''Prints per-node request, error and latency stats'''
+    if (_nodes is None or not _nodes.probed):
+        return
+
+    logger.LogMessage(f"{logger.Indent(1)}Nodes:")
+    for line in _nodes.summary():
+        logger.LogMessage(f"{logger.Indent(2)}{line}")
+
+
+class DownloadJob:
+    '''Item moving through the download pipeline'''
+
+    def __init__(self, index: int, item: WorkshopItem, directory: str, oldDirectories: list[str] = []) -> None:
+        self.index = index
+        self.item = item
+        self.directory = directory
+        # folders of the previous version, replaced or removed once the new one is extracted
+        self.oldDirectories = oldDirectories
+        # backends not tried yet, best first, and the one zipfile is downloaded from
+        self.backends: list[DownloadBackend] = []
+        self.backend: Optional[DownloadBackend] = None
+        # seconds the backend took to locate the zipfile
+        self.backendOverhead: float = 0
+
+    def __str__(self) -> str:
+        return f"{{DownloadJob - index: {self.index} | item: {self.item} | directory: {self.directory}}}"
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    def partialDownloadPath(self) -> str:
+        '''Returns path the zipfile is spooled to'''
+        # next to the item folder, so it is on the same disk
+        return PartialDownload.pathFor(os.path.dirname(self.directory), self.item)
+
+    def manifestPath(self) -> str:
+        return getManifestPath(os.path.dirname(self.directory), self.item)
+
+    def loadManifest(self) -> Optional[dict[str, list[int]]]:
+        '''Returns manifest of files in item directory, or None if it is unknown'''
+        if (not filemanager.doesFileExist(self.manifestPath()) or not filemanager.doesDirectoryExist(self.directory)):
+            return None
+        try:
+            manifest = filemanager.readJsonFile(self.manifestPath())
+        except ValueError:
+            return None
+        # item was renamed, its files are in another folder
+        if (manifest.get("directory") != os.path.basename(self.directory)):
+            return None
+        return manifest.get("files")
+
+    def saveManifest(self, files: Optional[dict[str, list[int]]]) -> None:
+        '''Saves manifest of files in item directory. None removes it'''
+        if (files is None):
+            if (filemanager.doesFileExist(self.manifestPath())):
+                filemanager.deleteFile(self.manifestPath())
+            return
+        filemanager.saveJsonFile(
+            self.manifestPath(),
+            {"directory": os.path.basename(self.directory), "files": files}
+        )
+
+
+def getManifestPath(directory: str, item: WorkshopItem) -> str:
+    '''Returns path of the .json file with size and CRC32 of every file extracted from item's zipfile'''
+    return f"{directory}/.{item.id}.manifest.json"
+
+
+def createJournal(collectionDirectory: str) -> Journal:
+    '''Returns journal of items finished since collection.json was last saved'''
+    return Journal(
+        f"{collectionDirectory}/collection.journal",
+        Settings.journalFsync,
+        Settings.journalFsyncInterval
+    )
+
+
+def readJournal(journal: Journal) -> list[WorkshopItem]:
+    '''Returns items finished by an interrupted download'''
+    items = [WorkshopItem.fromJson(record) for record in journal.replay()]
+    if (len(items) > 0):
+        logger.LogWarning(
+            f"{logger.StartIndent()}Found {len(items)} items finished by an interrupted download, "
+            "they will not be downloaded again"
+        )
+    return items
+
+
+def mergeJournaledItems(localItems: list[WorkshopItem], journaledItems: list[WorkshopItem]) -> list[WorkshopItem]:
+    '''Returns local items with versions finished by an interrupted download'''
+    localItemsById: dict[int, WorkshopItem] = {}
+    for item in localItems:
+        localItemsById.setdefault(item.id, item)
+    for item in journaledItems:
+        localItemsById[item.id] = item
+    return list(localItemsById.values())
+
+
+def replayJournal(collection: WorkshopCollection, journal: Journal) -> None:
+    '''Adds items finished by an interrupted download to local items of collection'''
+    journaledItems = readJournal(journal)
+    if (len(journaledItems) > 0):
+        collection.localItems = mergeJournaledItems(collection.localItems, journaledItems)
+
+
+def saveCollection(items: list[WorkshopItem]) -> None:
+    '''Saves collection.json and collection_backup.json of the ongoing download,
+    then removes the journal, as all its items are in collection.json now'''
+    filemanager.saveCollectionAsJson(
+        f"{_ongoingDownloadSaveDirectory}/collection.json",
+        _ongoingDownload,
+        items,
+        True
+    )
+    filemanager.saveCollectionAsJson(
+        f"{_ongoingDownloadSaveDirectory}/collection_backup.json",
+        _ongoingDownload,
+        _ongoingDownload.localItems,
+        True
+    )
+    if (_ongoingDownloadJournal is not None):
+        _ongoingDownloadJournal.delete()
+
+
+class PartialDownload:
+    '''Zipfile being downloaded to disk.\n
+    Url, uuid, offset and the backend url came from are kept in a .json file next to it,
+    so an interrupted download can be resumed by the next attempt.'''
+
+    def __init__(self, path: str, url: str = "", uuid: str = "", offset: int = 0, backend: str = "") -> None:
+        self.path = path
+        self.url = url
+        self.uuid = uuid
+        self.offset = offset
+        self.backend = backend
+
+    @staticmethod
+    def pathFor(directory: str, item: WorkshopItem) -> str:
+        # lastUpdated is part of the name, so parts of an older version are never resumed
+        return f"{directory}/.{item.id}-{item.lastUpdated}.zip.part"
+
+    @classmethod
+    def load(cls, path: str):
+        '''Returns partial download stored at path, or an empty one if there is none'''
+        metadataPath = f"{path}.json"
+        if (not filemanager.doesFileExist(path) or not filemanager.doesFileExist(metadataPath)):
+            return cls(path)
+
+        try:
+            metadata = filemanager.readJsonFile(metadataPath)
+        except ValueError:
+            return cls(path)
+
+        # bytes are written in order, so whatever is in the file is valid,
+        # even if the process was killed before offset was saved
+        return cls(
+            path,
+            metadata.get("url", ""),
+            metadata.get("uuid", ""),
+            filemanager.getFileSize(path),
+            # downloads interrupted before there were other backends came from a node
+            metadata.get("backend", NodeBackend.name)
+        )
+
+    def save(self) -> None:
+        self.offset = filemanager.getFileSize(self.path)
+        filemanager.saveJsonFile(
+            f"{self.path}.json",
+            {"url": self.url, "uuid": self.uuid, "offset": self.offset, "backend": self.backend}
+        )
+
+    def forget(self) -> None:
+        '''Removes metadata, so the file is not resumed again'''
+        if (filemanager.doesFileExist(f"{self.path}.json")):
+            filemanager.deleteFile(f"{self.path}.json")
+
+    def delete(self) -> None:
+        self.forget()
+        if (filemanager.doesFileExist(self.path)):
+            filemanager.deleteFile(self.path)
 
 
 def IsDownloading() -> bool:
@@ -61,7 +517,11 @@ def onDownloadStopped() -> None:
     global _ongoingDownload
     global _ongoingDownloadDownloadedItems
     global _ongoingDownloadSaveDirectory
+    global _ongoingDownloadJournal
 
+    if (_ongoingDownloadJournal is not None):
+        _ongoingDownloadJournal.close()
+    _ongoingDownloadJournal = None
     _ongoingDownload = None
     _ongoingDownloadSaveDirectory = ""
     _ongoingDownloadDownloadedItems = []
@@ -79,15 +539,17 @@ def StopDownload() -> None:
             f"\n{logger.StartIndent()}Stopping download..."
         )
 
-        downloadedIds = WorkshopCollection.getItemIds(
+        downloadedIds = set(WorkshopCollection.getItemIds(
             _ongoingDownloadDownloadedItems
-        )
+        ))
         # add not downloaded items with lastUpdated = 0,
         # so thay will be "updated" the next time.
+        # Copies are saved, fetched items may still be used (by the watcher)
         for item in _ongoingDownload.fetchedItems:
             if (item.id not in downloadedIds):
-                item.lastUpdated = 0
-                _ongoingDownloadDownloadedItems.append(item)
+                notDownloadedItem = item.copy()
+                notDownloadedItem.lastUpdated = 0
+                _ongoingDownloadDownloadedItems.append(notDownloadedItem)
 
         filemanager.saveCollectionAsJson(
             f"{_ongoingDownloadSaveDirectory}/collection.json",
@@ -95,15 +557,231 @@ def StopDownload() -> None:
             _ongoingDownloadDownloadedItems,
             True
         )
+        if (_ongoingDownloadJournal is not None):
+            _ongoingDownloadJournal.delete()
 
+        _downloadStopEvent.set()
         onDownloadStopped()
         logger.LogMessage(
             f"{logger.StartIndent()}Download stopped"
         )
+        WriteMetrics()
+
 
+def PlanCollection(collection: WorkshopCollection, directory: str, redownload: bool = False) -> UpdatePlan:
+    '''Returns what UpdateCollection would add, update and remove, without changing anything.
+    With redownload, every item is downloaded again, like DownloadCollection does'''
+    AssertParameter(collection, WorkshopCollection, "collection")
+    AssertParameter(directory, str, "directory")
 
-def UpdateCollection(collection: WorkshopCollection, directory: str, removeOldItems: bool = True, removeDeletedItems: bool = True) -> None:
+    collectionDirectory = f"{directory}/{collection.name}"
+    existingFolders: list[str] = []
+    if (filemanager.doesDirectoryExist(collectionDirectory)):
+        existingFolders = filemanager.listDirsInDirectory(collectionDirectory)
+
+    localItems = [] if redownload else collection.localItems
+    journal = createJournal(collectionDirectory)
+    if (journal.exists):
+        localItems = mergeJournaledItems(localItems, readJournal(journal))
+
+    return UpdatePlan.fromItems(localItems, collection.fetchedItems, existingFolders)
+
+
+def loadPreviousMetrics() -> dict:
+    '''Returns metrics report of the previous run, or an empty dict if there is none'''
+    if (not Settings.metricsPath or not filemanager.doesFileExist(Settings.metricsPath)):
+        return {}
+    try:
+        report = filemanager.readJsonFile(Settings.metricsPath)
+    except ValueError:
+        return {}
+    return report if isinstance(report, dict) else {}
+
+
+def getPreviousThroughput(report: Optional[dict] = None) -> tuple[float, float]:
+    '''Returns download speed (bytes per second) and seconds to prepare an item,
+    measured by the previous run if its metrics were saved, estimated otherwise'''
+    if (report is None):
+        report = loadPreviousMetrics()
+
+    rate = Settings.estimatedRate
+    prepareTime = Settings.estimatedPrepareTime
+    try:
+        if (report.get("mbPerSecond", 0) > 0):
+            rate = report["mbPerSecond"] * 1024 * 1024
+        resolveStage = report.get("stages", {}).get("resolve", {})
+        if (resolveStage.get("p50", 0) > 0):
+            prepareTime = resolveStage["p50"]
+    except (TypeError, AttributeError):
+        pass
+    if (Settings.maxRate > 0):
+        rate = min(rate, Settings.maxRate)
+    return rate, prepareTime
+
+
+def getJobCosts(jobs: list[DownloadJob]) -> list[float]:
+    '''Returns estimated seconds every job takes: preparing the item, then downloading its file.
+    Preparation time of an item is taken from the previous run, if it was measured'''
+    report = loadPreviousMetrics()
+    rate, prepareTime = getPreviousThroughput(report)
+    previousItems = report.get("perItem", {}) if isinstance(report.get("perItem"), dict) else {}
+
+    knownSizes = sorted(job.item.fileSize for job in jobs if job.item.fileSize > 0)
+    # items of unknown size are as big as a typical one
+    typicalSize = knownSizes[len(knownSizes) // 2] if len(knownSizes) > 0 else 0
+
+    costs: list[float] = []
+    for job in jobs:
+        size = job.item.fileSize if job.item.fileSize > 0 else typicalSize
+        # file_url of legacy items is downloaded without preparation
+        itemPrepareTime = 0 if job.item.fileUrl and "direct" in Settings.backends else prepareTime
+        try:
+            previousResolve = previousItems[str(job.item.id)]["stages"]["resolve"]
+            if (previousResolve["succeeded"]):
+                itemPrepareTime = previousResolve["seconds"]
+        except (KeyError, TypeError):
+            pass
+        costs.append(itemPrepareTime + size / rate)
+    return costs
+
+
+def EstimateDuration(plan: UpdatePlan) -> float:
+    '''Returns rough amount of seconds downloading items of plan takes.\n
+    Items are prepared resolveWindow at a time while others are downloaded,
+    so the slower of the two decides'''
+    AssertParameter(plan, UpdatePlan, "plan")
+
+    items = len(plan.downloadedItems)
+    if (items == 0):
+        return 0
+    rate, prepareTime = getPreviousThroughput()
+    downloadTime = plan.totalBytes / rate
+    prepareTimeOfAll = prepareTime * items / Settings.resolveWindow
+    return prepareTime + max(downloadTime, prepareTimeOfAll)
+
+
+def SavePlan(path: str, collections: list[WorkshopCollection], plans: list[UpdatePlan], directory: str, removeDeletedItems: bool = True) -> None:
+    '''Saves plans of collections to a .json file, which ApplyPlan() runs later'''
+    AssertParameter(path, str, "path")
+    AssertParameter(collections, list, "collections")
+    AssertParameter(plans, list, "plans")
+    if (len(collections) != len(plans)):
+        raise ValueError(f"Every collection needs a plan: {len(collections)} collections, {len(plans)} plans")
+
+    filemanager.saveJsonFile(path, {
+        "createdAt": int(time.time()),
+        "directory": directory,
+        "removeDeletedItems": removeDeletedItems,
+        "totalBytes": sum(plan.totalBytes for plan in plans),
+        "estimatedSeconds": round(sum(EstimateDuration(plan) for plan in plans), 1),
+        "collections": [
+            {
+                "collection": collection.json(),
+                "totalBytes": plan.totalBytes,
+                "unknownSizeItems": plan.unknownSizeItems,
+                "estimatedSeconds": round(EstimateDuration(plan), 1),
+                "plan": plan.json()
+            } for collection, plan
+            in zip(collections, plans)
+        ]
+    })
+
+
+def LoadPlan(path: str) -> tuple[str, bool, list[WorkshopCollection], list[UpdatePlan]]:
+    '''Reads file saved by SavePlan().
+    Returns directory, removeDeletedItems, collections and their plans.
+    Collections without a steam id and without any items are left out, there is nothing to apply to them'''
+    AssertParameter(path, str, "path")
+
+    savedPlan = filemanager.readJsonFile(path)
+    collections: list[WorkshopCollection] = []
+    plans: list[UpdatePlan] = []
+    for savedCollection in savedPlan["collections"]:
+        plan = UpdatePlan.fromJson(savedCollection["plan"])
+        collectionJson = savedCollection["collection"]
+        localItems = list(plan.localItemsById.values())
+        if (not SteamAPI.Validator.ValidSteamItemId(collectionJson["collectionId"]) and
+                len(localItems) == 0 and len(plan.fetchedItems) == 0
+            ):
+            logger.LogWarning(
+                f"{logger.StartIndent()}Collection has no items, skipping its plan: "
+                f"{collectionJson['collectionName']}"
+            )
+            continue
+        # collections without a steam id are made of their items
+        collection = WorkshopCollection(
+            collectionJson["collectionId"],
+            collectionJson["appId"],
+            collectionJson["collectionName"],
+            localItems or plan.fetchedItems
+        )
+        collection.localItems = localItems
+        collection.fetchedItems = plan.fetchedItems
+        collections.append(collection)
+        plans.append(plan)
+
+    return savedPlan["directory"], savedPlan.get("removeDeletedItems", True), collections, plans
+
+
+def refreshPlan(plan: UpdatePlan, collectionDirectory: str) -> int:
+    '''Drops changes of a saved plan, which were made since it was saved
+    (by another run, or an earlier apply of the same plan). Returns amount of dropped changes'''
+    localItems: list[WorkshopItem] = []
+    collectionJsonPath = f"{collectionDirectory}/collection.json"
+    if (filemanager.doesFileExist(collectionJsonPath)):
+        try:
+            localItems = [
+                WorkshopItem.fromJson(item) for item
+                in filemanager.readJsonFile(collectionJsonPath).get("items", [])
+            ]
+        except ValueError:
+            pass
+    existingFolders: set[str] = set()
+    if (filemanager.doesDirectoryExist(collectionDirectory)):
+        existingFolders = set(filemanager.listDirsInDirectory(collectionDirectory))
+
+    changes = len(plan.downloadedItems) + len(plan.deletedItems) + len(plan.deletedFolders)
+    # items already in the planned version
+    plan.skipFinishedItems(localItems)
+    localItemIds = set(WorkshopCollection.getItemIds(localItems))
+    plan.deletedItems = [
+        item for item
+        in plan.deletedItems
+        if item.id in localItemIds or item.name in existingFolders
+    ]
+    plan.deletedFolders = [folder for folder in plan.deletedFolders if folder in existingFolders]
+    return changes - len(plan.downloadedItems) - len(plan.deletedItems) - len(plan.deletedFolders)
+
+
+def ApplyPlan(path: str, directory: str = "") -> None:
+    '''Runs plan saved by SavePlan(), without fetching anything from steam api.
+    directory overrides the one collections were planned for.
+    Changes made since the plan was saved are skipped'''
+    savedDirectory, removeDeletedItems, collections, plans = LoadPlan(path)
+    directory = directory or savedDirectory
+    if (len(collections) == 0):
+        logger.LogError(f"{logger.StartIndent()}Plan has no collections to apply: {path}")
+        return
+
+    logger.LogMessage(
+        f"{logger.StartIndent()}Applying plan of {len(collections)} collections: {path}"
+    )
+    for collection, plan in zip(collections, plans):
+        staleChanges = refreshPlan(plan, f"{directory}/{collection.name}")
+        if (staleChanges > 0):
+            logger.LogWarning(
+                f"{logger.Indent(1)}{collection.name}: skipping {staleChanges} changes "
+                "made since the plan was saved"
+            )
+    if (len(collections) == 1):
+        UpdateCollection(collections[0], directory, True, removeDeletedItems, plans[0])
+    else:
+        SyncCollections([], collections, directory, removeDeletedItems, plans)
+
+
+def UpdateCollection(collection: WorkshopCollection, directory: str, removeOldItems: bool = True, removeDeletedItems: bool = True, plan: Optional[UpdatePlan] = None) -> None:
     '''Checks all items in collection, and updates/adds/removes them as needed\n
+    plan made by PlanCollection() earlier is used as it is, instead of comparing items again.\n
     WARNING: collections maybe very big,
     so this command may generate a lot of internet traffic and take a while.'''
 
@@ -131,7 +809,7 @@ def UpdateCollection(collection: WorkshopCollection, directory: str, removeOldIt
         )
         return
 
-    if (len(collection.fetchedItems) == 0):
+    if (plan is None and len(collection.fetchedItems) == 0):
         queryResult = logger.YesOrNoQuery(
             "There are no fetched items. This means ALL items will be removed!\nAre you sure you have called WorkshopCollection.FetchNewItems()?",
             False,
@@ -144,63 +822,25 @@ def UpdateCollection(collection: WorkshopCollection, directory: str, removeOldIt
     collectionDirectory = f"{directory}/{collection.name}"
     if (not filemanager.doesDirectoryExist(collectionDirectory)):
         filemanager.createDirectory(collectionDirectory)
-
-    # Fetched items info
-    fetchedItemIdsList: list[int] = WorkshopCollection.getItemIds(
-        collection.fetchedItems
-    )
-    fetchedItemIdsSet: set[int] = set(fetchedItemIdsList)
-    fetchedItemsNameList: list[str] = WorkshopCollection.getItemNames(
-        collection.fetchedItems
-    )
-
-    # Local items info
-    localItemIdsList: list[int] = WorkshopCollection.getItemIds(
-        collection.localItems
-    )
-    localItemIdsSet: set[int] = set(localItemIdsList)
-
-    # Will be downloaded
-    willBeAddedIds: list[int] = list(
-        fetchedItemIdsSet - localItemIdsSet
-    )
-
-    # Will be deleted
-    willBeDeletedIdsSet: set[int] = set(
-        localItemIdsSet - fetchedItemIdsSet
-    )
-
-    # Will be updated
-    willBeUpdatedIds: list[int] = list(
-        item.id for item
-        in collection.localItems
-        if item.id in fetchedItemIdsList and
-        item.lastUpdated != collection.fetchedItems[
-            fetchedItemIdsList.index(item.id)
-        ].lastUpdated
-    )
-
-    # Will be skipped (they are up to date)
-    willBeIgnoredIds: list[int] = list(
-        (fetchedItemIdsSet - set(willBeUpdatedIds)) - set(willBeAddedIds)
-    )
-
-    # These are different from line 50.
-    # If you manually remove items from collection.json,
-    # then we do not longer have any info about them. So we scan for all folders,
-    # and delete all folders that are not in names list
-    # (folders are named using item names)
-    willBeDeletedFolders: list[str] = list(
-        dir for dir
-        in filemanager.listDirsInDirectory(collectionDirectory)
-        if (dir not in fetchedItemsNameList)
-    )
-
-    if (len(willBeUpdatedIds) == 0 and
-            len(willBeDeletedIdsSet) == 0 and
-            len(willBeAddedIds) == 0 and
-            len(willBeDeletedFolders) == 0
-        ):
+    # folders left by an update which was killed while swapping them
+    filemanager.recoverReplacedDirectories(collectionDirectory)
+    journal = createJournal(collectionDirectory)
+    if (plan is None):
+        replayJournal(collection, journal)
+        plan = UpdatePlan.fromCollection(
+            collection, filemanager.listDirsInDirectory(collectionDirectory)
+        )
+    elif (journal.exists):
+        # interrupted apply of the same plan
+        plan.skipFinishedItems(readJournal(journal))
+
+    if (plan.isEmpty):
+        if (journal.exists):
+            # interrupted download finished every item, only collection.json is missing
+            filemanager.saveCollectionAsJson(
+                f"{collectionDirectory}/collection.json", collection, plan.ignoredItems, True
+            )
+            journal.delete()
         logger.LogError(
             f"{logger.StartIndent()}Collection has no items to change.\n"
             f"{logger.Indent(1)}Called with collection: {collection}"
@@ -216,24 +856,22 @@ def UpdateCollection(collection: WorkshopCollection, directory: str, removeOldIt
     global _ongoingDownload
     _ongoingDownload = collection
     global _ongoingDownloadDownloadedItems
-    _ongoingDownloadDownloadedItems += [
-        item for item
-        in collection.fetchedItems
-        if item.id in willBeIgnoredIds
-    ]
+    _ongoingDownloadDownloadedItems += plan.ignoredItems
+    global _ongoingDownloadJournal
+    _ongoingDownloadJournal = journal
 
-    if len(willBeIgnoredIds) > 0:
+    if len(plan.ignoredItems) > 0:
         logger.LogMessage(
-            f"{logger.Indent(1)}Ignoring {len(willBeIgnoredIds)} up to date items"
+            f"{logger.Indent(1)}Ignoring {len(plan.ignoredItems)} up to date items"
         )
 
-    if ((len(willBeDeletedIdsSet) > 0 or len(willBeDeletedFolders)) and removeDeletedItems):
+    # folders actually deleted, items may already be gone
+    removedItems = 0
+    if ((len(plan.deletedItems) > 0 or len(plan.deletedFolders)) and removeDeletedItems):
         logger.LogMessage(
-            f"{logger.Indent(1)}Removing {len(willBeDeletedIdsSet) + len(willBeDeletedFolders)} items"
+            f"{logger.Indent(1)}Removing {len(plan.deletedItems) + len(plan.deletedFolders)} items"
         )
-        for index, itemId in enumerate(willBeDeletedIdsSet):
-            itemIndex = localItemIdsList.index(itemId)
-            item = collection.localItems[itemIndex]
+        for index, item in enumerate(plan.deletedItems):
             logger.LogError(
                 f"{logger.Indent(2)}"
                 f"{index}. "
@@ -242,8 +880,12 @@ def UpdateCollection(collection: WorkshopCollection, directory: str, removeOldIt
             itemDirectory = f"{_ongoingDownloadSaveDirectory}/{item.name}"
             if (filemanager.doesDirectoryExist(itemDirectory)):
                 filemanager.deleteDirectory(itemDirectory)
+                removedItems += 1
+            manifestPath = getManifestPath(_ongoingDownloadSaveDirectory, item)
+            if (filemanager.doesFileExist(manifestPath)):
+                filemanager.deleteFile(manifestPath)
 
-        for folder in willBeDeletedFolders:
+        for folder in plan.deletedFolders:
             logger.LogError(
                 f"{logger.Indent(2)}"
                 f"Deleting folder no longer associated with collection: "
@@ -253,147 +895,84 @@ def UpdateCollection(collection: WorkshopCollection, directory: str, removeOldIt
                 filemanager.deleteDirectory(
                     f"{_ongoingDownloadSaveDirectory}/{folder}"
                 )
+                removedItems += 1
 
-    failedToUpdateIds: list[int] = []
-    if len(willBeUpdatedIds) > 0:
-        logger.LogMessage(
-            f"{logger.Indent(1)}Updating {len(willBeUpdatedIds)} old items"
-        )
-
-        for index, itemId in enumerate(willBeUpdatedIds):
-            fetchedItemIndex = fetchedItemIdsList.index(itemId)
-            fetchedItem = collection.fetchedItems[fetchedItemIndex]
-            fetchedItemDirectory = f"{_ongoingDownloadSaveDirectory}/{fetchedItem.name}"
+    updateJobs: list[DownloadJob] = []
+    for fetchedItem in plan.updatedItems:
+        fetchedItemDirectory = f"{_ongoingDownloadSaveDirectory}/{fetchedItem.name}"
 
-            localItemIndex = localItemIdsList.index(itemId)
-            localItem = collection.localItems[localItemIndex]
-            localItemDirectory = f"{_ongoingDownloadSaveDirectory}/{localItem.name}"
-
-            logger.LogMessage(
-                f"{logger.Indent(1)}"
-                f"{index}. {fetchedItem.name}"
-            )
+        localItem = plan.localItemsById[fetchedItem.id]
+        localItemDirectory = f"{_ongoingDownloadSaveDirectory}/{localItem.name}"
 
-            if (filemanager.doesDirectoryExist(localItemDirectory) and removeOldItems):
-                logger.LogMessage(f"{logger.Indent(2)}Deleting old folder...")
-                filemanager.deleteDirectory(localItemDirectory)
+        oldDirectories = [fetchedItemDirectory]
+        if (removeOldItems and localItemDirectory != fetchedItemDirectory):
+            oldDirectories.insert(0, localItemDirectory)
 
-            if (filemanager.doesDirectoryExist(fetchedItemDirectory)):
-                logger.LogMessage(f"{logger.Indent(2)}Deleting old folder...")
-                filemanager.deleteDirectory(fetchedItemDirectory)
+        updateJobs.append(DownloadJob(
+            len(updateJobs), fetchedItem, fetchedItemDirectory, oldDirectories
+        ))
 
-            downloadedData = None
-            try:
-                downloadedData = downloadItem(fetchedItem)
-            except TimeoutError:
-                logger.LogError(
-                    f"{logger.Clear()}"
-                    f"{logger.Up()}"
-                    f"{logger.Indent(1)}{index}. {fetchedItem.name}: timeout reached"
-                )
-                failedToUpdateIds.append(fetchedItem.id)
-                continue
+    addJobs: list[DownloadJob] = []
+    for fetchedItem in plan.addedItems:
+        addJobs.append(DownloadJob(
+            len(updateJobs) + len(addJobs),
+            fetchedItem,
+            f"{_ongoingDownloadSaveDirectory}/{fetchedItem.name}"
+        ))
 
-            logger.LogMessage(f"{logger.Indent(2)}Extracting...", '\r')
-            try:
-                filemanager.saveZipFile(fetchedItemDirectory, downloadedData)
-                _ongoingDownloadDownloadedItems.append(fetchedItem)
-            except BadZipFile:
-                logger.LogError(
-                    f"{logger.Clear()}"
-                    f"{logger.Up()}"
-                    f"{logger.Indent(1)}{index}. {fetchedItem.name}: bad zip file"
-                )
-                failedToUpdateIds.append(fetchedItem.id)
-                continue
-
-            logger.LogSuccess(
-                f"{logger.Clear()}"
-                f"{logger.Up()}"
-                f"{logger.Indent(1)}{index}. {fetchedItem.name}"
-            )
-
-    failedToAddIds: list[int] = []
-    if len(willBeAddedIds) > 0:
+    if len(updateJobs) > 0:
         logger.LogMessage(
-            f"{logger.Indent(1)}Downloading {len(willBeAddedIds)} new items"
+            f"{logger.Indent(1)}Updating {len(updateJobs)} old items"
+        )
+    if len(addJobs) > 0:
+        logger.LogMessage(
+            f"{logger.Indent(1)}Downloading {len(addJobs)} new items"
         )
 
-        for index, itemId in enumerate(willBeAddedIds):
-            fetchedItemIndex = fetchedItemIdsList.index(itemId)
-            fetchedItem = collection.fetchedItems[fetchedItemIndex]
-            fetchedItemDirectory = f"{_ongoingDownloadSaveDirectory}/{fetchedItem.name}"
-
-            logger.LogMessage(
-                f"{logger.Indent(1)}"
-                f"{index}. {fetchedItem.name}"
-            )
-
-            downloadedData: bytes = None
-            try:
-                downloadedData = downloadItem(fetchedItem)
-            except TimeoutError:
-                logger.LogError(
-                    f"{logger.Clear()}"
-                    f"{logger.Up()}"
-                    f"{logger.Indent(1)}{index}. {fetchedItem.name}: timeout reached"
-                )
-                failedToAddIds.append(fetchedItem.id)
-                continue
-
-            if (filemanager.doesDirectoryExist(fetchedItemDirectory)):
-                filemanager.deleteDirectory(fetchedItemDirectory)
+    # updated and new items share one pipeline run,
+    # so workers do not wait for the last update before starting new items
+    results = downloadItems(updateJobs + addJobs)
+    updateResults = results[:len(updateJobs)]
+    addResults = results[len(updateJobs):]
 
-            logger.LogMessage(f"{logger.Indent(2)}Extracting...", '\r')
-            try:
-                filemanager.saveZipFile(fetchedItemDirectory, downloadedData)
-                _ongoingDownloadDownloadedItems.append(fetchedItem)
-            except BadZipFile:
-                logger.LogError(
-                    f"{logger.Clear()}"
-                    f"{logger.Up()}"
-                    f"{logger.Indent(1)}{index}. {fetchedItem.name}: bad zip file"
-                )
-                failedToAddIds.append(fetchedItem.id)
-                continue
+    failedToUpdateIds: set[int] = set(
+        result.job.item.id for result
+        in updateResults
+        if not result.succeeded
+    )
+    failedToAddIds: set[int] = set(
+        result.job.item.id for result
+        in addResults
+        if not result.succeeded
+    )
 
-            logger.LogSuccess(
-                f"{logger.Clear()}"
-                f"{logger.Up()}"
-                f"{logger.Indent(1)}{index}. {item.name}"
-            )
+    # keep the same order as if items were processed one by one
+    _ongoingDownloadDownloadedItems = plan.ignoredItems + [
+        result.job.item for result
+        in results
+        if result.succeeded
+    ]
 
     # this ensures we do not update old items which failed to download
-    for item in collection.fetchedItems:
+    for item in plan.updatedItems:
         failedToUpdate = item.id in failedToUpdateIds
 
         if (failedToUpdate):
             # If item failed to update, we get the old info for it
             # So basically we leave it untouched
-            localItemIndex = localItemIdsList.index(item.id)
-            localItem = collection.localItems[localItemIndex]
-            _ongoingDownloadDownloadedItems.append(localItem)
-
-    filemanager.saveCollectionAsJson(
-        f"{_ongoingDownloadSaveDirectory}/collection.json",
-        _ongoingDownload,
-        _ongoingDownloadDownloadedItems,
-        True
-    )
-    filemanager.saveCollectionAsJson(
-        f"{_ongoingDownloadSaveDirectory}/collection_backup.json",
-        _ongoingDownload,
-        _ongoingDownload.localItems,
-        True
-    )
+            _ongoingDownloadDownloadedItems.append(plan.localItemsById[item.id])
 
+    saveCollection(_ongoingDownloadDownloadedItems)
     onDownloadStopped()
     logger.LogSuccess(
         f"{logger.StartIndent()}Updated collection: {collection.name}.\n"
-        f"{logger.Indent(1)}New items:     {len(willBeAddedIds) - len(failedToAddIds)}/{len(willBeAddedIds)}\n"
-        f"{logger.Indent(1)}Updated items: {len(willBeUpdatedIds) - len(failedToUpdateIds)}/{len(willBeUpdatedIds)}\n"
-        f"{logger.Indent(1)}Removed items: {len(willBeDeletedIdsSet) + len(willBeDeletedFolders)}"
+        f"{logger.Indent(1)}New items:     {len(plan.addedItems) - len(failedToAddIds)}/{len(plan.addedItems)}\n"
+        f"{logger.Indent(1)}Updated items: {len(plan.updatedItems) - len(failedToUpdateIds)}/{len(plan.updatedItems)}\n"
+        f"{logger.Indent(1)}Removed items: {removedItems}"
     )
+    LogNodeStats()
+    LogBackendStats()
+    WriteMetrics()
 
 
 def DownloadCollection(collection: WorkshopCollection, directory: str, overrideExistingDirectory: bool = False) -> None:
@@ -403,7 +982,14 @@ def DownloadCollection(collection: WorkshopCollection, directory: str, overrideE
     collectionDirectory = f"{directory}/{collection.name}"
 
     if (filemanager.doesDirectoryExist(collectionDirectory)):
-        if (overrideExistingDirectory):
+        if (createJournal(collectionDirectory).exists and len(collection.fetchedItems) > 0):
+            # download was killed, items it finished are skipped by the update
+            logger.LogWarning(
+                f"{logger.StartIndent()}Resuming interrupted download of {collection.name}"
+            )
+            UpdateCollection(collection, directory, True, True)
+            return
+        elif (overrideExistingDirectory):
             filemanager.deleteDirectory(collectionDirectory)
         else:
             logger.LogError(
@@ -430,91 +1016,467 @@ def DownloadCollection(collection: WorkshopCollection, directory: str, overrideE
     logger.LogMessage(
         f"{logger.StartIndent()}Downloading collection: {collection.name}"
     )
+    # downloads are spooled inside collection directory
+    filemanager.createDirectory(collectionDirectory)
 
     global _ongoingDownload
     global _ongoingDownloadDownloadedItems
     global _ongoingDownloadSaveDirectory
+    global _ongoingDownloadJournal
     _ongoingDownloadSaveDirectory = collectionDirectory
     _ongoingDownload = collection
+    _ongoingDownloadJournal = createJournal(collectionDirectory)
 
     logger.LogMessage(
         f"{logger.Indent(1)}Downloading {len(collection.fetchedItems)} items"
     )
 
-    failedDownloadIds: list[int] = []
-    for index, item in enumerate(collection.fetchedItems):
-        itemDirectory = f"{_ongoingDownloadSaveDirectory}/{item.name}"
+    jobs: list[DownloadJob] = [
+        DownloadJob(index, item, f"{_ongoingDownloadSaveDirectory}/{item.name}")
+        for index, item
+        in enumerate(collection.fetchedItems)
+    ]
+    results = downloadItems(jobs)
+
+    # keep items in collection order, no matter in which order they finished
+    _ongoingDownloadDownloadedItems = [
+        result.job.item for result
+        in results
+        if result.succeeded
+    ]
+
+    saveCollection(_ongoingDownloadDownloadedItems)
+
+    downloadedItemsCount = len(_ongoingDownloadDownloadedItems)
+    onDownloadStopped()
+
+    logger.LogMessage(
+        f"{logger.StartIndent()}Downloaded collection: {collection.name}\n"
+        f"{logger.Indent(1)}Downloaded items: {downloadedItemsCount}/{len(collection.fetchedItems)}"
+    )
+    LogNodeStats()
+    LogBackendStats()
+    WriteMetrics()
+
+
+def SyncCollections(downloadedCollections: list[WorkshopCollection], updatedCollections: list[WorkshopCollection], directory: str, removeDeletedItems: bool = True, plans: list[UpdatePlan] = []) -> None:
+    '''Downloads and updates several collections one by one.\n
+    Items are extracted to the store and linked into collections,
+    so items shared by collections are downloaded only once.
+    Without a store, a temporary one is created in directory, if collections download the same items.
+    Otherwise items are extracted straight to collections, and delta updates are used.\n
+    plans are used for updatedCollections in the same order, if given'''
+    AssertParameter(downloadedCollections, list, "downloadedCollections")
+    AssertParameter(updatedCollections, list, "updatedCollections")
+    AssertParameter(directory, str, "directory")
+    AssertParameter(plans, list, "plans")
+
+    downloadedItems = [collection.fetchedItems for collection in downloadedCollections]
+    for index, collection in enumerate(updatedCollections):
+        plan = plans[index] if index < len(plans) else UpdatePlan.fromCollection(collection)
+        downloadedItems.append(plan.downloadedItems)
+
+    storePath = Settings.storePath
+    temporaryStorePath = f"{directory}/.store"
+    useTemporaryStore = not storePath and hasSharedItems(downloadedItems)
+    if (useTemporaryStore):
+        # next to collections, so items can be hardlinked
+        if (not filemanager.doesDirectoryExist(directory)):
+            filemanager.createDirectory(directory)
+        Settings.setStore(temporaryStorePath)
+
+    store = Store()
+    try:
+        for collection in downloadedCollections:
+            DownloadCollection(collection, directory, True)
+        for index, collection in enumerate(updatedCollections):
+            plan = plans[index] if index < len(plans) else None
+            UpdateCollection(collection, directory, True, removeDeletedItems, plan)
+    finally:
+        if (useTemporaryStore):
+            Settings.setStore("")
+            # linked files stay in collections
+            if (filemanager.doesDirectoryExist(temporaryStorePath)):
+                filemanager.deleteDirectory(temporaryStorePath)
 
+    logger.LogMessage(
+        f"{logger.StartIndent()}Synced {len(downloadedCollections) + len(updatedCollections)} collections"
+    )
+    if (store is not None):
         logger.LogMessage(
-            f"{logger.Indent(1)}"
-            f"{index}. {item.name}"
+            f"{logger.Indent(1)}Files linked from the store: {store.linkedFiles}, copied: {store.copiedFiles}"
         )
 
-        downloadedData = None
+
+def hasSharedItems(downloadedItems: list[list[WorkshopItem]]) -> bool:
+    '''Returns True if the same version of an item is downloaded for more than one collection'''
+    seenVersions: set[tuple[int, int]] = set()
+    for items in downloadedItems:
+        versions = set((item.id, item.lastUpdated) for item in items)
+        if (not seenVersions.isdisjoint(versions)):
+            return True
+        seenVersions |= versions
+    return False
+
+
+def getDownloadedSize(downloadedData: Union[bytes, str, None]) -> int:
+    '''Returns size of zipfile returned by downloadStage'''
+    if (isinstance(downloadedData, bytes)):
+        return len(downloadedData)
+    if (isinstance(downloadedData, str) and filemanager.doesFileExist(downloadedData)):
+        return filemanager.getFileSize(downloadedData)
+    return 0
+
+
+def measuredStage(name: str, function: Callable[[DownloadJob, Any], Any]) -> Callable[[DownloadJob, Any], Any]:
+    '''Returns pipeline stage function recording its duration and zipfile size for every item'''
+    def measured(job: DownloadJob, value: Any) -> Any:
+        with Metrics().timer(name, job.item.id) as sample:
+            # extracting removes the zipfile, so its size is taken first
+            if (name == "extract"):
+                sample.bytes = getDownloadedSize(value)
+            result = function(job, value)
+            if (name == "download"):
+                sample.bytes = getDownloadedSize(result)
+        return result
+    return measured
+
+
+def createBackends(resolver: "BatchResolver") -> list[DownloadBackend]:
+    '''Returns enabled download backends, in the order of Settings.backends'''
+    rate, prepareTime = getPreviousThroughput()
+    backends: list[DownloadBackend] = []
+    for name in Settings.backends:
+        if (name == "mirror" and Settings.mirrorLocation):
+            backends.append(MirrorBackend(Settings.mirrorLocation, 0, rate))
+        elif (name == "direct"):
+            backends.append(DirectBackend(0, rate))
+        elif (name == "node"):
+            backends.append(NodeBackend(resolver.resolve, prepareTime, rate))
+    return backends
+
+
+def backendErrors() -> tuple:
+    '''Returns errors of a backend after which the next backend is tried.
+    Other errors, like a full disk, fail the item'''
+    # requests is only imported once the first item is downloaded
+    return (DownloadBackendException, NodeManagerException, TimeoutError, requests.RequestException)
+
+
+def locateItem(job: DownloadJob) -> str:
+    '''Returns zipfile location from the first of job's remaining backends which has it'''
+    lastException: Exception = DownloadBackendException(
+        f"No download backend has item ({job.item})"
+    )
+    while (len(job.backends) > 0):
+        backend = job.backends.pop(0)
+        start = time.monotonic()
         try:
-            downloadedData = downloadItem(item)
-        except TimeoutError:
-            logger.LogError(
-                f"{logger.Clear()}"
-                f"{logger.Up()}"
-                f"{logger.Indent(1)}{index}. {item.name}: timeout reached"
+            location = backend.locate(job.item)
+        except backendErrors() as exception:
+            _backendRanking.recordFailure(backend.name, time.monotonic() - start)
+            lastException = exception
+            if (len(job.backends) > 0):
+                Metrics().count("backend_fallbacks", itemId=job.item.id)
+            continue
+
+        job.backend = backend
+        job.backendOverhead = time.monotonic() - start
+        return location
+    raise lastException
+
+
+def resolveStage(job: DownloadJob, _, backends: list[DownloadBackend]) -> Optional[str]:
+    '''Pipeline stage: returns zipfile url (or path, for a local mirror) from the fastest backend.
+    Returns None if item is already in the store'''
+    store = Store()
+    if (store is not None and store.contains(job.item)):
+        return None
+
+    job.backends = _backendRanking.rankedBackends(backends, job.item)
+
+    # an interrupted download is resumed from the same url and backend,
+    # without waiting for the item to be prepared again
+    if (Settings.spoolDownloads):
+        partialDownload = PartialDownload.load(job.partialDownloadPath())
+        if (partialDownload.url):
+            backend = next(
+                (backend for backend in job.backends if backend.name == partialDownload.backend), None
             )
-            failedDownloadIds.append(item.id)
+            if (backend is not None):
+                job.backends.remove(backend)
+                job.backend = backend
+                job.backendOverhead = 0
+                return partialDownload.url
+            # its backend is disabled now, and what it served is not known to be a zipfile
+            partialDownload.delete()
+
+    return locateItem(job)
+
+
+def downloadStage(job: DownloadJob, zipFileUrl: Optional[str]) -> Union[bytes, str, None]:
+    '''Pipeline stage: downloads zipfile, trying the next backend if it fails.
+    Returns path to the spooled zipfile, or its bytes when spooling is disabled'''
+    if (zipFileUrl is None):
+        return None
+
+    while True:
+        start = time.monotonic()
+        try:
+            downloadedData = fetchItem(job, zipFileUrl)
+        except StaleDownloadUrlException:
+            if (job.backend is None):
+                raise
+            # same backend locates the item again, a node through the batch resolver.
+            # Partial download is gone, so this happens once
+            job.backends.insert(0, job.backend)
+            zipFileUrl = locateItem(job)
+            continue
+        except backendErrors():
+            if (job.backend is not None):
+                _backendRanking.recordFailure(
+                    job.backend.name, job.backendOverhead + time.monotonic() - start
+                )
+            if (len(job.backends) == 0):
+                raise
+            Metrics().count("backend_fallbacks", itemId=job.item.id)
+            zipFileUrl = locateItem(job)
             continue
 
-        if (filemanager.doesDirectoryExist(itemDirectory)):
-            filemanager.deleteDirectory(itemDirectory)
+        if (job.backend is not None):
+            _backendRanking.recordSuccess(
+                job.backend.name, job.backendOverhead,
+                time.monotonic() - start, getDownloadedSize(downloadedData)
+            )
+            Metrics().count(f"backend_{job.backend.name}", itemId=job.item.id)
+        return downloadedData
+
+
+def fetchItem(job: DownloadJob, location: str) -> Union[bytes, str]:
+    '''Downloads (or copies, from a local mirror) zipfile of job's item'''
+    if (not isUrl(location)):
+        if (not Settings.spoolDownloads):
+            with open(location, "rb") as file:
+                return file.read()
+        return filemanager.copyFile(location, job.partialDownloadPath())
+
+    # progress of concurrent downloads is drawn together by the renderer
+    showProgress = Settings.showProgress
+
+    if (not Settings.spoolDownloads):
+        downloadedData = downloadItem(job.item, location, showProgress)
+    else:
+        downloadedData = downloadItemToFile(
+            job.item, job.partialDownloadPath(), location, showProgress,
+            job.backend.name if job.backend is not None else NodeBackend.name
+        )
 
-        logger.LogMessage(
-            f"{logger.Clear()}{logger.Indent(2)}Extracting...",
-            "\r"
+    # file_url of a legacy item is the file itself, not a zipfile of it
+    if (isinstance(job.backend, DirectBackend)):
+        downloadedData = filemanager.wrapInZipFile(
+            downloadedData, os.path.basename(job.item.fileName) or str(job.item.id)
         )
-        try:
-            filemanager.saveZipFile(itemDirectory, downloadedData)
-            _ongoingDownloadDownloadedItems.append(item)
-        except BadZipFile:
-            logger.LogError(
-                f"{logger.Clear()}"
-                f"{logger.Up()}"
-                f"{logger.Indent(1)}{index}. {item.name}: bad zip file"
+    return downloadedData
+
+
+def extractStage(job: DownloadJob, downloadedData: Union[bytes, str, None]) -> None:
+    '''Pipeline stage: extracts zipfile (or links it from the store) to a staging folder,
+    then swaps it with item directory. Old version stays in place until then.\n
+    With delta updates, only changed files of the existing directory are rewritten'''
+    manifest: Optional[dict[str, list[int]]] = None
+    try:
+        # manifests are only kept for delta updates
+        if (downloadedData is not None and Settings.deltaUpdates):
+            manifest = filemanager.getZipManifest(downloadedData)
+
+        oldManifest = job.loadManifest() if Settings.deltaUpdates else None
+        if (oldManifest is not None and manifest is not None and Store() is None):
+            applyDelta(job, downloadedData, manifest, oldManifest)
+        else:
+            extractToStagingDirectory(job, downloadedData)
+    finally:
+        if (isinstance(downloadedData, str)):
+            filemanager.deleteFile(downloadedData)
+
+    # items linked from the store have no zipfile to describe.
+    # Without delta updates, a manifest of an older version is removed, it no longer matches the files
+    job.saveManifest(manifest)
+
+    # folders of the previous version with a different name
+    for oldDirectory in job.oldDirectories:
+        if (oldDirectory != job.directory and filemanager.doesDirectoryExist(oldDirectory)):
+            logger.LogMessage(
+                f"{logger.Indent(2)}{job.index}. {job.item.name}: deleting old folder..."
             )
-            failedDownloadIds.append(item.id)
-            continue
+            filemanager.deleteDirectory(oldDirectory)
 
-        logger.LogSuccess(
+
+def applyDelta(job: DownloadJob, downloadedData: Union[bytes, str], manifest: dict[str, list[int]], oldManifest: dict[str, list[int]]) -> None:
+    '''Rewrites changed files of item directory. If that fails part way,
+    the whole zipfile is extracted to a staging folder and swapped in instead'''
+    try:
+        writtenFiles, removedFiles = filemanager.applyZipDelta(
+            job.directory, downloadedData, oldManifest
+        )
+    except (OSError, filemanager.zipfile.BadZipFile) as exception:
+        logger.LogWarning(
             f"{logger.Clear()}"
-            f"{logger.Up()}"
-            f"{logger.Indent(1)}{index}. {item.name}"
+            f"{logger.Indent(2)}{job.index}. {job.item.name}: delta update failed ({exception}), "
+            "extracting all files"
         )
+        Metrics().count("delta_fallbacks", itemId=job.item.id)
+        extractToStagingDirectory(job, downloadedData)
+        return
 
-    filemanager.saveCollectionAsJson(
-        f"{_ongoingDownloadSaveDirectory}/collection.json",
-        _ongoingDownload,
-        _ongoingDownloadDownloadedItems,
-        True
-    )
-    filemanager.saveCollectionAsJson(
-        f"{_ongoingDownloadSaveDirectory}/collection_backup.json",
-        _ongoingDownload,
-        _ongoingDownload.localItems,
-        True
+    logger.LogMessage(
+        f"{logger.Clear()}"
+        f"{logger.Indent(2)}{job.index}. {job.item.name}: "
+        f"{writtenFiles} files written, {removedFiles} removed, "
+        f"{len(manifest) - writtenFiles} unchanged"
     )
 
-    onDownloadStopped()
+
+def extractToStagingDirectory(job: DownloadJob, downloadedData: Union[bytes, str, None]) -> None:
+    stagingDirectory = filemanager.getStagingDirectory(job.directory)
+    if (filemanager.doesDirectoryExist(stagingDirectory)):
+        filemanager.deleteDirectory(stagingDirectory)
+
+    try:
+        extractToDirectory(job, downloadedData, stagingDirectory)
+    except BaseException:
+        if (filemanager.doesDirectoryExist(stagingDirectory)):
+            filemanager.deleteDirectory(stagingDirectory)
+        raise
+
+    filemanager.replaceDirectory(job.directory, stagingDirectory)
+
+
+def extractToDirectory(job: DownloadJob, downloadedData: Union[bytes, str, None], directory: str) -> None:
+    store = Store()
+    if (store is not None):
+        if (downloadedData is not None):
+            store.add(job.item, downloadedData)
+        store.materialize(job.item, directory)
+    elif (isinstance(downloadedData, bytes)):
+        filemanager.saveZipFile(directory, downloadedData)
+    else:
+        filemanager.extractZipFile(directory, downloadedData)
+
+
+def onItemProcessed(result: PipelineResult) -> None:
+    '''Reports finished item and marks it as downloaded'''
+    job: DownloadJob = result.job
+
+    if (result.succeeded):
+        _ongoingDownloadDownloadedItems.append(job.item)
+        if (_ongoingDownloadJournal is not None):
+            _ongoingDownloadJournal.append(job.item.json())
+        logger.LogSuccess(
+            f"{logger.Clear()}"
+            f"{logger.Indent(1)}{job.index}. {job.item.name}"
+        )
+    elif (isinstance(result.exception, TimeoutError)):
+        logger.LogError(
+            f"{logger.Clear()}"
+            f"{logger.Indent(1)}{job.index}. {job.item.name}: timeout reached"
+        )
+    elif (isinstance(result.exception, filemanager.zipfile.BadZipFile)):
+        logger.LogError(
+            f"{logger.Clear()}"
+            f"{logger.Indent(1)}{job.index}. {job.item.name}: bad zip file"
+        )
+    elif (isinstance(result.exception, DownloadBackendException)):
+        logger.LogError(
+            f"{logger.Clear()}"
+            f"{logger.Indent(1)}{job.index}. {job.item.name}: not available from any download backend"
+        )
+    elif (isinstance(result.exception, NodeManagerException)):
+        logger.LogError(
+            f"{logger.Clear()}"
+            f"{logger.Indent(1)}{job.index}. {job.item.name}: no steamworkshopdownloader.io node available"
+        )
+    elif (isinstance(result.exception, requests.RequestException)):
+        logger.LogError(
+            f"{logger.Clear()}"
+            f"{logger.Indent(1)}{job.index}. {job.item.name}: download failed ({result.exception})"
+        )
+    elif (not isinstance(result.exception, (DownloadStoppedException, PipelineStoppedException))):
+        # a single item (full disk, broken folder...) never aborts the run,
+        # items finished by others are still saved to collection.json
+        logger.LogError(
+            f"{logger.Clear()}"
+            f"{logger.Indent(1)}{job.index}. {job.item.name}: failed in {result.stage} stage "
+            f"({type(result.exception).__name__}: {result.exception})"
+        )
+
+
+def removeStalePartialDownloads(jobs: list[DownloadJob]) -> None:
+    '''Removes partial downloads which will not be resumed by any of the jobs'''
+    partialDownloadPaths = set(job.partialDownloadPath() for job in jobs)
+    directories = set(os.path.dirname(path) for path in partialDownloadPaths)
+
+    for directory in directories:
+        if (not filemanager.doesDirectoryExist(directory)):
+            continue
+        for file in filemanager.listFilesInDirectory(directory):
+            path = f"{directory}/{file}"
+            isPartialDownload = file.startswith(".") and (
+                file.endswith(".zip.part") or file.endswith(".zip.part.json")
+            )
+            if (isPartialDownload and path.removesuffix(".json") not in partialDownloadPaths):
+                filemanager.deleteFile(path)
+
+
+def downloadItems(jobs: list[DownloadJob]) -> list[PipelineResult]:
+    '''Resolves, downloads and extracts items concurrently.
+    Returns results in the same order as jobs.\n
+    Items are added to DownloadedItems() as soon as they are extracted.'''
+    _downloadStopEvent.clear()
+    if (Settings.spoolDownloads):
+        removeStalePartialDownloads(jobs)
+    if (_ongoingDownloadJournal is not None):
+        _ongoingDownloadJournal.open()
+
+    scheduler = Scheduler(Settings.schedulePolicy)
+    order = scheduler.order(getJobCosts(jobs))
+    Metrics().setInfo("schedule", scheduler.policy)
+
+    with BatchResolver() as resolver, Metrics().timer("pipeline") as sample:
+        pipeline = Pipeline(
+            [
+                # resolve workers mostly wait for the batch resolver,
+                # so there is one for every item in the window
+                PipelineStage(
+                    "resolve",
+                    measuredStage("resolve", functools.partial(resolveStage, backends=createBackends(resolver))),
+                    Settings.resolveWindow
+                ),
+                PipelineStage("download", measuredStage("download", downloadStage), Settings.networkJobs),
+                PipelineStage("extract", measuredStage("extract", extractStage), Settings.extractJobs)
+            ],
+            stopEvent=_downloadStopEvent
+        )
+        results = pipeline.run(jobs, onItemProcessed, order)
+        sample.bytes = sum(
+            job.item.fileSize for job
+            in jobs
+            if job.item.fileSize > 0
+        )
 
     logger.LogMessage(
-        f"{logger.StartIndent()}Downloaded collection: {collection.name}\n"
-        f"{logger.Indent(1)}Downloaded items: {len(_ongoingDownloadDownloadedItems)}/{len(collection.fetchedItems)}"
+        f"{logger.Indent(1)}Processed {len(jobs)} items in {sample.seconds:.1f}s, "
+        f"schedule: {scheduler.policy}"
     )
+    return results
 
 
-def getSteamDownloaderUrl(item: WorkshopItem):
-    '''Returns steamdownloader.io url for item'''
+def requestItemPreparation(item: WorkshopItem) -> tuple[str, int]:
+    '''Asks steamdownloader.io to prepare item.
+    Returns uuid of the request and id of the node preparing it'''
     AssertParameter(item, WorkshopItem, "item")
     if (not SteamAPI.Validator.ValidSteamItemId(item.id)):
         raise ValueError(f"item's ({item}) id is not valid")
 
-    requestUrl = Settings.getRequestUrl()
     requestData = {
         "publishedFileId": item.id,
         "collectionId": None,
@@ -526,36 +1488,246 @@ def getSteamDownloaderUrl(item: WorkshopItem):
         "Content-type": "application/json",
         "Accept": "application/json, text/plain, */*"
     }
-    requestResponse = requests.post(
-        requestUrl, json=requestData, headers=requestHeaders
+    requestResponse, nodeId = Nodes().postToBest(
+        "request", json=requestData, headers=requestHeaders
+    )
+    return json.loads(requestResponse.text)["uuid"], nodeId
+
+
+def fetchPreparationStatuses(uuids: list[str], nodeId: int) -> dict:
+    '''Returns steamdownloader.io status for every uuid, using a single request.
+    uuids must have been requested from nodeId'''
+    AssertParameter(uuids, list, "uuids")
+
+    statusData = {"uuids": uuids}
+    statusHeaders = {
+        "Content-type": "application/json"
+    }
+    statusResponse = Nodes().post(
+        nodeId, "status", json=statusData, headers=statusHeaders
     )
-    uuid = json.loads(requestResponse.text)["uuid"]
-    for _ in range(3):
-        time.sleep(2)
-        statusUrl = Settings.getStatusUrl()
-        statusData = f'''{{"uuids":["{uuid}"]}}'''
-        statusHeaders = {
-            "Content-type": "application/json"
-        }
-        statusResponse = requests.post(
-            statusUrl, data=statusData, headers=statusHeaders
-        )
-        jsonStatusResponse = json.loads(statusResponse.text)[uuid]
-        status = jsonStatusResponse["status"]
-        if (status == "prepared"):
-            storageHost = jsonStatusResponse["storageNode"]
-            storagePath = jsonStatusResponse["storagePath"]
-            zipFileUrl = f"https://{storageHost}/prod//storage//{storagePath}?uuid={uuid}"
+    return json.loads(statusResponse.text)
+
+
+def zipFileUrlFromStatus(uuid: str, status: dict) -> Optional[str]:
+    '''Returns zipfile url if item is prepared, None otherwise'''
+    if (status.get("status") != "prepared"):
+        return None
+
+    return Settings.storageUrl.format(
+        host=status["storageNode"], path=status["storagePath"], uuid=uuid
+    )
+
+
+def getSteamDownloaderUrl(item: WorkshopItem):
+    '''Returns steamdownloader.io url for item'''
+    uuid, nodeId = requestItemPreparation(item)
+    deadline = time.monotonic() + Settings.getPreparationTimeout(item)
+    attempt = 0
+    while True:
+        delay = Settings.getStatusPollDelay(attempt)
+        time.sleep(max(min(delay, deadline - time.monotonic()), 0))
+        statuses = fetchPreparationStatuses([uuid], nodeId)
+        zipFileUrl = zipFileUrlFromStatus(uuid, statuses[uuid])
+        if (zipFileUrl):
             return zipFileUrl
+        if (time.monotonic() >= deadline):
+            break
+        attempt += 1
     raise TimeoutError(
         f"Could not get item ({item}) steamdownloader.io url: timeout reached"
     )
 
 
-def downloadItem(item: WorkshopItem) -> bytes:
-    '''Downloads an item'''
-    chunkSize = 1024
+class PendingPreparation:
+    '''Item waiting for steamdownloader.io to prepare it'''
+
+    def __init__(self, item: WorkshopItem, uuid: str, nodeId: int) -> None:
+        now = time.monotonic()
+        self.item = item
+        self.uuid = uuid
+        # status of uuid is only known to the node it was requested from
+        self.nodeId = nodeId
+        self.deadline = now + Settings.getPreparationTimeout(item)
+        self.polls = 0
+        self.nextPoll = now + Settings.getStatusPollDelay(0)
+        self.zipFileUrl: str = ""
+        self.exception: Optional[Exception] = None
+        self.finished = threading.Event()
+
+    def scheduleNextPoll(self, now: float) -> None:
+        '''Backs off next status request, but never past the deadline'''
+        self.polls += 1
+        self.nextPoll = min(
+            now + Settings.getStatusPollDelay(self.polls),
+            self.deadline
+        )
+
+
+class BatchResolver:
+    '''Resolves zipfile urls of many items at once.\n
+    Every item is submitted for preparation as soon as resolve() is called.
+    A tick happens when the earliest item is due for a status request,
+    and statuses of all outstanding items are fetched with one request per tick.'''
+
+    def __init__(self) -> None:
+        self.statusRequests = 0
+
+        self._pending: dict[str, PendingPreparation] = {}
+        self._lock = threading.Lock()
+        self._stopEvent = threading.Event()
+        # set when an item is added, so its short first poll is not missed
+        self._wakeUpEvent = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exception, value, tb):
+        self.stop()
+
+    def start(self) -> None:
+        self._stopEvent.clear()
+        self._thread = threading.Thread(
+            target=self._pollTask, name="batch-resolver", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        '''Stops polling. Items still waiting are failed with DownloadStoppedException'''
+        self._stopEvent.set()
+        self._wakeUpEvent.set()
+        if (self._thread is not None):
+            self._thread.join()
+            self._thread = None
+
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for preparation in pending:
+            preparation.exception = DownloadStoppedException(
+                f"Preparation of item ({preparation.item}) was stopped"
+            )
+            preparation.finished.set()
+
+    def resolve(self, item: WorkshopItem) -> str:
+        '''Submits item for preparation and blocks until its zipfile url is known'''
+        uuid, nodeId = requestItemPreparation(item)
+        preparation = PendingPreparation(item, uuid, nodeId)
+        with self._lock:
+            # stop() sets the event before taking the lock,
+            # so items are never added after pending items were failed
+            if (self._stopEvent.is_set()):
+                raise DownloadStoppedException(
+                    f"Preparation of item ({item}) was stopped"
+                )
+            self._pending[uuid] = preparation
+        self._wakeUpEvent.set()
+
+        preparation.finished.wait()
+        if (preparation.exception is not None):
+            raise preparation.exception
+        return preparation.zipFileUrl
+
+    def _secondsUntilNextTick(self) -> Optional[float]:
+        with self._lock:
+            if (len(self._pending) == 0):
+                return None
+            nextPoll = min(
+                preparation.nextPoll for preparation
+                in self._pending.values()
+            )
+        return max(nextPoll - time.monotonic(), 0)
+
+    def _pollTask(self) -> None:
+        while (not self._stopEvent.is_set()):
+            self._wakeUpEvent.wait(self._secondsUntilNextTick())
+            self._wakeUpEvent.clear()
+            if (self._stopEvent.is_set()):
+                return
+
+            now = time.monotonic()
+            with self._lock:
+                isDue = any(
+                    preparation.nextPoll <= now for preparation
+                    in self._pending.values()
+                )
+                uuidsByNode: dict[int, list[str]] = {}
+                for preparation in self._pending.values():
+                    uuidsByNode.setdefault(preparation.nodeId, []).append(preparation.uuid)
+            if (not isDue):
+                continue
+
+            # one status request per node
+            statuses: dict = {}
+            for nodeId, uuids in uuidsByNode.items():
+                try:
+                    statuses.update(fetchPreparationStatuses(uuids, nodeId))
+                    self.statusRequests += 1
+                    Metrics().count("status_requests")
+                except (requests.RequestException, ValueError) as exception:
+                    Metrics().count("status_request_failures")
+                    # failed tick, items are checked again on the next one
+                    logger.LogWarning(
+                        f"{logger.Indent(2)}Could not fetch status of {len(uuids)} items from node {nodeId}: {exception}"
+                    )
+                    if (not Nodes().isHealthy(nodeId)):
+                        self._resubmit(uuids)
+
+            now = time.monotonic()
+            finished: list[PendingPreparation] = []
+            with self._lock:
+                for uuid in [uuid for uuids in uuidsByNode.values() for uuid in uuids]:
+                    preparation = self._pending.get(uuid)
+                    if (preparation is None):
+                        # resubmitted under a new uuid
+                        continue
+                    status = statuses.get(uuid)
+                    zipFileUrl = zipFileUrlFromStatus(uuid, status) if isinstance(status, dict) else None
+                    if (zipFileUrl):
+                        preparation.zipFileUrl = zipFileUrl
+                    elif (now >= preparation.deadline):
+                        preparation.exception = TimeoutError(
+                            f"Could not get item ({preparation.item}) steamdownloader.io url: timeout reached"
+                        )
+                    else:
+                        # items polled long before they were due keep their schedule
+                        if (preparation.nextPoll <= now + Settings.statusPollCoalesce):
+                            preparation.scheduleNextPoll(now)
+                        continue
+                    del self._pending[uuid]
+                    finished.append(preparation)
+
+            # prepared items are handed to downloaders right away
+            for preparation in finished:
+                preparation.finished.set()
+
+    def _resubmit(self, uuids: list[str]) -> None:
+        '''Asks another node to prepare items of a node which stopped answering'''
+        for uuid in uuids:
+            with self._lock:
+                preparation = self._pending.get(uuid)
+            if (preparation is None):
+                continue
 
+            try:
+                newUuid, nodeId = requestItemPreparation(preparation.item)
+            except (requests.RequestException, NodeManagerException, ValueError, KeyError):
+                # no better node right now, keep waiting for the old one
+                continue
+
+            with self._lock:
+                if (self._pending.pop(uuid, None) is None):
+                    continue
+                preparation.uuid = newUuid
+                preparation.nodeId = nodeId
+                self._pending[newUuid] = preparation
+            Metrics().count("preparation_resubmits", itemId=preparation.item.id)
+
+
+def resolveZipFileUrl(item: WorkshopItem, showProgress: bool = True) -> str:
+    '''Validates item and returns its zipfile url'''
     if (not SteamAPI.Validator.ValidSteamItemId(item.id) or
             not SteamAPI.Validator.ValidSteamItemId(item.appid)
         ):
@@ -563,34 +1735,145 @@ def downloadItem(item: WorkshopItem) -> bytes:
             "Can't download item without knowing its id or its app id."
         )
 
-    zipFileUrl: str = ""
+    if (not showProgress):
+        return getSteamDownloaderUrl(item)
+
     with Spinner(
         f"{logger.Indent(2)}Fetching zipfile location ",
         delay=0.5
     ):
-        zipFileUrl = getSteamDownloaderUrl(item)
+        return getSteamDownloaderUrl(item)
+
+
+def streamItem(item: WorkshopItem, zipFileUrl: str, outputFile: BinaryIO, showProgress: bool = True, offset: int = 0) -> int:
+    '''Writes zipfile to outputFile chunk by chunk.\n
+    If offset is given, outputFile must already contain that many bytes,
+    and only the rest is requested. When the server does not support ranges,
+    outputFile is truncated and written from the start.
+    Returns size of the whole zipfile'''
+    headers = {"Range": f"bytes={offset}-"} if offset > 0 else {}
+    downloadResponse = transport.get(zipFileUrl, stream=True, headers=headers)
+    if (offset > 0 and downloadResponse.status_code == 416):
+        # range does not fit (file changed?), download everything again
+        downloadResponse.close()
+        offset = 0
+        downloadResponse = transport.get(zipFileUrl, stream=True)
+    downloadResponse.raise_for_status()
+
+    contentRange = downloadResponse.headers.get("content-range", "")
+    if (offset > 0 and (
+            downloadResponse.status_code != 206 or
+            not contentRange.startswith(f"bytes {offset}-")
+    )):
+        offset = 0
+    if (offset == 0):
+        outputFile.seek(0)
+        outputFile.truncate()
+
+    contentLength = downloadResponse.headers.get('content-length')
+    filesize = offset + int(contentLength) if contentLength is not None else None
+    downloadedBytes = offset
+
+    def writeChunks(onChunk=None):
+        nonlocal downloadedBytes
+        for chunk in downloadResponse.iter_content(Settings.chunkSize):
+            # next chunk is read only when the limit allows it,
+            # so the server is slowed down by tcp flow control
+            _rateLimiter.consume(len(chunk), _downloadStopEvent)
+            if (_downloadStopEvent.is_set()):
+                downloadResponse.close()
+                raise DownloadStoppedException(
+                    f"Download of item ({item}) was stopped"
+                )
+            outputFile.write(chunk)
+            downloadedBytes += len(chunk)
+            if (onChunk is not None):
+                onChunk(len(chunk))
+
+    if (not showProgress):
+        writeChunks()
+    else:
+        # renderer thread draws the progress, chunks only count bytes
+        with logger.Progress().task(
+            f"{logger.Indent(2)}{item.name} ", filesize, downloadedBytes
+        ) as task:
+            writeChunks(task.advance)
+
+    return downloadedBytes
+
+
+def downloadItem(item: WorkshopItem, zipFileUrl: str = "", showProgress: bool = True) -> bytes:
+    '''Downloads an item into memory. Fetches zipfile url if it is not specified'''
+    if (not zipFileUrl):
+        zipFileUrl = resolveZipFileUrl(item, showProgress)
 
     with io.BytesIO() as memoryFile:
-        downloadResponse = requests.get(zipFileUrl, stream=True)
-        filesize = downloadResponse.headers.get('content-length')
-        if filesize is None:
-            with Spinner(
-                f"{logger.Indent(2)}Downloading ",
-                delay=0.3
-            ):
-                memoryFile.write(downloadResponse.content)
-        else:
-            logger.LogMessage(
-                f"{logger.Indent(2)}Downloading {logger.ProgressBar(30, 0)}",
-                end="\r"
-            )
-            for chunk in downloadResponse.iter_content(chunkSize):
-                memoryFile.write(chunk)
-                fillPercentage = memoryFile.getbuffer().nbytes / int(filesize) * 100
-                logger.LogMessage(
-                    f"{logger.Indent(2)}Downloading {logger.ProgressBar(30, fillPercentage)}",
-                    end='\r'
+        streamItem(item, zipFileUrl, memoryFile, showProgress)
+        return memoryFile.getvalue()
+
+
+def downloadItemToFile(item: WorkshopItem, path: str, zipFileUrl: str = "", showProgress: bool = True, backend: str = NodeBackend.name) -> str:
+    '''Downloads an item straight to a file, so it is never held in memory.
+    Fetches zipfile url if it is not specified. Returns path\n
+    Download interrupted by a previous attempt is resumed,
+    if it was downloaded from the same url.
+    backend is the name of the download backend url came from.
+    Raises StaleDownloadUrlException if a node no longer serves url of the interrupted download'''
+    AssertParameter(path, str, "path")
+
+    partialDownload = PartialDownload.load(path)
+    if (not zipFileUrl):
+        zipFileUrl = partialDownload.url or resolveZipFileUrl(item, showProgress)
+
+    if (partialDownload.url and partialDownload.url != zipFileUrl):
+        # a different url may serve a differently packed zipfile
+        partialDownload.delete()
+        partialDownload = PartialDownload(path)
+
+    if (partialDownload.url):
+        offset = partialDownload.offset
+        Metrics().count("resumed_downloads", itemId=item.id)
+        try:
+            return resumeDownload(item, partialDownload, showProgress)
+        except requests.RequestException:
+            # keep what was received, so the next attempt continues from there
+            if (filemanager.getFileSize(path) > offset):
+                raise
+            partialDownload.delete()
+            partialDownload = PartialDownload(path)
+            # storage node no longer serves this url, the item is prepared again by the caller.
+            # Other backends serve the same url every time, it is downloaded from the start
+            if (backend == NodeBackend.name):
+                Metrics().count("download_reresolves", itemId=item.id)
+                raise StaleDownloadUrlException(
+                    f"Url of interrupted download of item ({item}) is no longer served: {zipFileUrl}"
                 )
 
-        memoryFile.seek(0)
-        return memoryFile.read()
+    partialDownload.url = zipFileUrl
+    partialDownload.backend = backend
+    partialDownload.uuid = urllib.parse.parse_qs(
+        urllib.parse.urlparse(zipFileUrl).query
+    ).get("uuid", [""])[0]
+    try:
+        return resumeDownload(item, partialDownload, showProgress)
+    except requests.HTTPError:
+        partialDownload.delete()
+        raise
+
+
+def resumeDownload(item: WorkshopItem, partialDownload: PartialDownload, showProgress: bool = True) -> str:
+    '''Downloads the rest of a partial download. Keeps it on disk if download fails'''
+    try:
+        with open(partialDownload.path, "ab+") as outputFile:
+            # append mode ignores seek() for writes, truncating is enough
+            outputFile.truncate(partialDownload.offset)
+            streamItem(
+                item, partialDownload.url, outputFile,
+                showProgress, partialDownload.offset
+            )
+    except BaseException:
+        partialDownload.save()
+        raise
+
+    partialDownload.forget()
+    return partialDownload.path
@@ -0,0 +1,161 @@
+'''Measures DownloadCollection and UpdateCollection against local stand-ins of steam api
+and steamworkshopdownloader.io, so no live service is needed.\n
+Every collection size runs in its own process, so peak RSS is not carried over.
+Run from repository root: python -m benchmarks.endToEnd'''
+import argparse
+import resource
+import tempfile
+import subprocess
+import json
+import time
+import sys
+
+from benchmarks.stubServices import StubServices
+
+
+# line of worker output carrying its result
+resultPrefix = "BENCHMARK RESULT "
+
+
+def peakRssMB() -> float:
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def runWorker(args: argparse.Namespace) -> dict:
+    '''Downloads a collection of args.run items, then updates a fraction of it'''
+    from api import SteamAPI, SteamDownloaderAPI
+    from classes import WorkshopCollection
+    from utils import filemanager
+    from utils.metrics import Metrics
+
+    with StubServices(args.run, args.itemSize, args.prepareDelay, args.prepareJitter) as stub, \
+            tempfile.TemporaryDirectory(prefix="wcd-benchmark-", dir=args.directory) as directory:
+        SteamAPI.Settings.apiUrl = stub.url
+        SteamDownloaderAPI.Settings.nodeUrl = f"{stub.url}/node{{nodeId}}/"
+        SteamDownloaderAPI.Settings.storageUrl = "http://{host}/storage/{path}?uuid={uuid}"
+        SteamDownloaderAPI.Settings.showProgress = False
+        SteamDownloaderAPI.Settings.setNetworkJobs(args.jobs)
+        SteamDownloaderAPI.Settings.setExtractJobs(args.extractJobs)
+        SteamDownloaderAPI.Settings.setResolveWindow(args.resolveWindow)
+        # slow preparations of the stand-in are measured, not timed out
+        SteamDownloaderAPI.Settings.setPreparationTimeout(args.prepareDelay + args.prepareJitter + 60)
+
+        phases: dict[str, dict] = {}
+
+        start = time.perf_counter()
+        collection = WorkshopCollection(stub.collectionId)
+        collection.FetchNewItems()
+        metadataSeconds = time.perf_counter() - start
+        SteamDownloaderAPI.DownloadCollection(collection, directory, True)
+        phases["download"] = {
+            "items": len(collection.fetchedItems),
+            "seconds": time.perf_counter() - start,
+            "metadataSeconds": metadataSeconds
+        }
+
+        updatedItems = stub.updateItems(args.updateFraction)
+        collectionPath = f"{directory}/{collection.name}/collection.json"
+        start = time.perf_counter()
+        collection = WorkshopCollection.fromJson(filemanager.readJsonFile(collectionPath))
+        collection.FetchNewItems()
+        metadataSeconds = time.perf_counter() - start
+        if (updatedItems > 0):
+            SteamDownloaderAPI.UpdateCollection(collection, directory, True, True)
+        phases["update"] = {
+            "items": updatedItems,
+            "seconds": time.perf_counter() - start,
+            "metadataSeconds": metadataSeconds
+        }
+
+        zipFileSize = len(stub.zipFile(next(iter(stub.items))))
+        for phase in phases.values():
+            phase["bytes"] = phase["items"] * zipFileSize
+
+        return {
+            "size": args.run,
+            "phases": phases,
+            "requests": stub.requests,
+            "stages": Metrics().report()["stages"],
+            "peakRssMB": peakRssMB()
+        }
+
+
+def runSize(size: int, args: argparse.Namespace) -> dict:
+    command = [
+        sys.executable, "-m", "benchmarks.endToEnd",
+        "--run", str(size),
+        "--itemSize", str(args.itemSize),
+        "--prepareDelay", str(args.prepareDelay),
+        "--prepareJitter", str(args.prepareJitter),
+        "--updateFraction", str(args.updateFraction),
+        "--jobs", str(args.jobs),
+        "--extractJobs", str(args.extractJobs),
+        "--resolveWindow", str(args.resolveWindow)
+    ]
+    if (args.directory):
+        command += ["--directory", args.directory]
+
+    process = subprocess.run(command, capture_output=True, text=True)
+    for line in process.stdout.splitlines():
+        if (line.startswith(resultPrefix)):
+            return json.loads(line[len(resultPrefix):])
+    raise RuntimeError(
+        f"Benchmark of {size} items failed with exit code {process.returncode}:\n"
+        f"{process.stdout[-2000:]}{process.stderr[-2000:]}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of downloading and updating collections")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000],
+                        help="Amounts of items in collection. Defaults to 10 100 1000 10000")
+    parser.add_argument("--itemSize", type=int, default=256 * 1024,
+                        help="Bytes in zipfile of every item. Defaults to 262144")
+    parser.add_argument("--prepareDelay", type=float, default=0.5,
+                        help="Seconds every item takes to prepare. Defaults to 0.5")
+    parser.add_argument("--prepareJitter", type=float, default=0.5,
+                        help="Random extra seconds of preparation, up to this. Defaults to 0.5")
+    parser.add_argument("--updateFraction", type=float, default=0.1,
+                        help="Fraction of items changed before the update. Defaults to 0.1")
+    parser.add_argument("--jobs", type=int, default=4,
+                        help="Amount of items resolved and downloaded at the same time. Defaults to 4")
+    parser.add_argument("--extractJobs", type=int, default=2,
+                        help="Amount of items extracted at the same time. Defaults to 2")
+    parser.add_argument("--resolveWindow", type=int, default=16,
+                        help="Amount of items prepared at the same time. Defaults to 16")
+    parser.add_argument("--directory", type=str, default="",
+                        help="Folder collections are downloaded to. Defaults to the temporary folder")
+    parser.add_argument("--json", action="store_true",
+                        help="Print results as json instead of a table.")
+    # internal: runs a single size in this process
+    parser.add_argument("--run", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if (args.run > 0):
+        print(resultPrefix + json.dumps(runWorker(args)))
+        return
+
+    results = []
+    if (not args.json):
+        print(f"{'items':>7} {'phase':>9} {'seconds':>9} {'items/s':>9} {'MB/s':>8} {'peak RSS MB':>12}")
+    for size in args.sizes:
+        result = runSize(size, args)
+        results.append(result)
+        if (args.json):
+            continue
+        for name, phase in result["phases"].items():
+            seconds = phase["seconds"]
+            print(
+                f"{size:>7} {name:>9} {seconds:>9.2f} "
+                f"{phase['items'] / seconds if seconds > 0 else 0:>9.1f} "
+                f"{phase['bytes'] / 1024 / 1024 / seconds if seconds > 0 else 0:>8.2f} "
+                f"{result['peakRssMB']:>12.1f}"
+            )
+
+    if (args.json):
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
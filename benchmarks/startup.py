@@ -0,0 +1,104 @@
+'''Measures how long wcd.py takes to start, and which modules it imports on the way.\n
+Heavy modules (requests, zipfile, concurrent.futures, termcolor) are imported on first use,
+so they must not show up before anything is downloaded.
+Run from repository root: python -m benchmarks.startup'''
+import argparse
+import statistics
+import subprocess
+import time
+import sys
+import os
+
+
+# imported on first use, never by --help
+deferredModules: list[str] = ["requests", "urllib3", "zipfile", "concurrent.futures", "termcolor"]
+
+scenarios: dict[str, list[str]] = {
+    "interpreter": ["-c", "pass"],
+    "--help": ["wcd.py", "--help"],
+    "import": ["-c", "import wcd"]
+}
+
+
+def runTimes(arguments: list[str], repeats: int) -> list[float]:
+    '''Returns wall time in seconds of every run of python with arguments'''
+    # bytecode is cached, so compiling does not count as startup
+    environment = dict(os.environ)
+    environment.pop("PYTHONDONTWRITEBYTECODE", None)
+
+    times: list[float] = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable] + arguments,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            check=True, env=environment
+        )
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def importTimes(arguments: list[str]) -> dict[str, int]:
+    '''Returns cumulative import time in microseconds of every module, from python -X importtime'''
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime"] + arguments,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    modules: dict[str, int] = {}
+    for line in process.stderr.splitlines():
+        if (not line.startswith("import time:") or "cumulative" in line):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of wcd.py startup")
+    parser.add_argument("--repeats", type=int, default=10,
+                        help="Runs per scenario, median is reported. Defaults to 10")
+    parser.add_argument("--top", type=int, default=10,
+                        help="Slowest modules imported by --help to list. Defaults to 10")
+    parser.add_argument("--budget", type=float, default=100,
+                        help="Milliseconds --help may take on top of the interpreter starting. "
+                        "Exits with 1 if it takes longer. Defaults to 100")
+    args = parser.parse_args()
+
+    # warm up, and write bytecode caches
+    runTimes(scenarios["--help"], 1)
+
+    medians: dict[str, float] = {}
+    print(f"{'scenario':>12} {'median ms':>10} {'min ms':>8} {'max ms':>8}")
+    for name, arguments in scenarios.items():
+        times = runTimes(arguments, args.repeats)
+        medians[name] = statistics.median(times)
+        print(f"{name:>12} {medians[name] * 1000:>10.1f} {min(times) * 1000:>8.1f} {max(times) * 1000:>8.1f}")
+
+    # modules of the interpreter itself (site, .pth files) are not ours to defer
+    interpreterModules = importTimes(scenarios["interpreter"])
+    modules = {
+        name: microseconds for name, microseconds
+        in importTimes(scenarios["--help"]).items()
+        if name not in interpreterModules
+    }
+    # the interpreter itself is as slow as the machine, only what wcd.py adds to it is measured
+    overhead = (medians["--help"] - medians["interpreter"]) * 1000
+    print(f"\n--help takes {overhead:.1f} ms more than the interpreter")
+    print("\nslowest imports of --help (cumulative ms):")
+    for name, microseconds in sorted(modules.items(), key=lambda module: -module[1])[:args.top]:
+        print(f"{microseconds / 1000:>10.1f}  {name}")
+
+    failed = False
+    importedDeferred = [module for module in deferredModules if module in modules]
+    if (len(importedDeferred) > 0):
+        print(f"\nimported by --help, but should be deferred: {', '.join(importedDeferred)}")
+        failed = True
+    if (overhead > args.budget):
+        print(f"\n--help is over budget of {args.budget:g} ms on top of the interpreter")
+        failed = True
+    if (failed):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+'''Local stand-in for steam web api and steamworkshopdownloader.io nodes, used by benchmarks.\n
+Serves ISteamRemoteStorage (GetCollectionDetails, GetPublishedFileDetails),
+node request and status endpoints, and storage with synthetic zipfiles.'''
+from typing import Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import urllib.parse
+import threading
+import zipfile
+import random
+import json
+import time
+import uuid
+import io
+
+
+class StubServices:
+    '''Steam api, nodes and storage on one local http server.\n
+    Every item is a zipfile of itemSize bytes, prepared prepareDelay seconds
+    (plus up to prepareJitter) after it was requested.'''
+
+    def __init__(self, itemCount: int, itemSize: int, prepareDelay: float = 0.5, prepareJitter: float = 0, collectionId: int = 1000, appId: int = 4000) -> None:
+        self.itemSize = itemSize
+        self.prepareDelay = prepareDelay
+        self.prepareJitter = prepareJitter
+        self.collectionId = collectionId
+        self.appId = appId
+        # item id: time_updated
+        self.items: dict[int, int] = {
+            collectionId + 1 + index: 1 for index
+            in range(itemCount)
+        }
+        self.requests: dict[str, int] = {}
+
+        # uuid: (item id, monotonic time it is prepared at)
+        self._preparations: dict[str, tuple[int, float]] = {}
+        self._lock = threading.Lock()
+        self._random = random.Random(0)
+        self._zipFile = createZipFile(itemSize)
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exception, value, tb):
+        self.stop()
+
+    def start(self) -> None:
+        services = self
+
+        class Handler(StubRequestHandler):
+            stub = services
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="stub-services", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if (self._server is None):
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+
+    def updateItems(self, fraction: float) -> int:
+        '''Bumps time_updated of a fraction of items. Returns amount of updated items'''
+        ids = list(self.items)
+        updatedIds = self._random.sample(ids, round(len(ids) * fraction))
+        for id in updatedIds:
+            self.items[id] += 1
+        return len(updatedIds)
+
+    def countRequest(self, endpoint: str) -> None:
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def collectionDetails(self, collectionIds: list[int]) -> list[dict]:
+        return [
+            {
+                "publishedfileid": str(collectionId),
+                "result": 1,
+                "children": [
+                    {"publishedfileid": str(id), "sortorder": index, "filetype": 0}
+                    for index, id
+                    in enumerate(self.items)
+                ]
+            } if collectionId == self.collectionId else
+            {"publishedfileid": str(collectionId), "result": 9}
+            for collectionId
+            in collectionIds
+        ]
+
+    def publishedFileDetails(self, fileIds: list[int]) -> list[dict]:
+        details: list[dict] = []
+        for id in fileIds:
+            if (id == self.collectionId):
+                details.append(self._fileDetails(id, "Benchmark collection", 1, 0))
+            elif (id in self.items):
+                details.append(self._fileDetails(id, f"Item {id}", self.items[id], len(self._zipFile)))
+            else:
+                details.append({"publishedfileid": str(id), "result": 9})
+        return details
+
+    def _fileDetails(self, id: int, title: str, timeUpdated: int, fileSize: int) -> dict:
+        return {
+            "publishedfileid": str(id),
+            "result": 1,
+            "consumer_app_id": self.appId,
+            "title": title,
+            "time_updated": timeUpdated,
+            "file_size": str(fileSize)
+        }
+
+    def requestPreparation(self, itemId: int) -> str:
+        preparationUuid = str(uuid.uuid4())
+        with self._lock:
+            delay = self.prepareDelay + self._random.uniform(0, self.prepareJitter)
+            self._preparations[preparationUuid] = (itemId, time.monotonic() + delay)
+        return preparationUuid
+
+    def preparationStatuses(self, uuids: list[str]) -> dict[str, dict]:
+        now = time.monotonic()
+        statuses: dict[str, dict] = {}
+        with self._lock:
+            for preparationUuid in uuids:
+                preparation = self._preparations.get(preparationUuid)
+                if (preparation is None):
+                    statuses[preparationUuid] = {"status": "failed"}
+                elif (now < preparation[1]):
+                    statuses[preparationUuid] = {"status": "preparing"}
+                else:
+                    statuses[preparationUuid] = {
+                        "status": "prepared",
+                        "storageNode": f"127.0.0.1:{self.port}",
+                        "storagePath": str(preparation[0])
+                    }
+        return statuses
+
+    def zipFile(self, itemId: int) -> Optional[bytes]:
+        # every item has the same content, only its size matters
+        return self._zipFile if itemId in self.items else None
+
+
+def createZipFile(size: int) -> bytes:
+    '''Returns zipfile of about size bytes. Content is random, so it does not compress'''
+    contentSize = max(size - 200, 0)
+    data = random.Random(size).randbytes(contentSize)
+    with io.BytesIO() as memoryFile:
+        with zipfile.ZipFile(memoryFile, "w", zipfile.ZIP_STORED) as zipFile:
+            zipFile.writestr("data.bin", data)
+            zipFile.writestr("mod/info.txt", "benchmark item\n")
+        return memoryFile.getvalue()
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    stub: StubServices = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        path = self.path.split("?")[0].rstrip("/")
+        self.stub.countRequest(path.split("/")[-1] if "/node" in path else path.split("/")[-2])
+
+        if (path.endswith("/GetCollectionDetails/v1")):
+            form = urllib.parse.parse_qs(body.decode())
+            ids = indexedValues(form, "publishedfileids")
+            self.sendJson({"response": {
+                "result": 1,
+                "resultcount": len(ids),
+                "collectiondetails": self.stub.collectionDetails(ids)
+            }})
+        elif (path.endswith("/GetPublishedFileDetails/v1")):
+            form = urllib.parse.parse_qs(body.decode())
+            ids = indexedValues(form, "publishedfileids")
+            self.sendJson({"response": {
+                "result": 1,
+                "resultcount": len(ids),
+                "publishedfiledetails": self.stub.publishedFileDetails(ids)
+            }})
+        elif (path.endswith("/request")):
+            itemId = int(json.loads(body)["publishedFileId"])
+            self.sendJson({"uuid": self.stub.requestPreparation(itemId)})
+        elif (path.endswith("/status")):
+            self.sendJson(self.stub.preparationStatuses(json.loads(body)["uuids"]))
+        else:
+            self.sendEmpty(404)
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if ("/storage/" not in path):
+            self.sendEmpty(404)
+            return
+        self.stub.countRequest("storage")
+        data = self.stub.zipFile(int(path.rsplit("/", 1)[-1]))
+        if (data is None):
+            self.sendEmpty(404)
+            return
+
+        offset = 0
+        requestedRange = self.headers.get("Range", "")
+        if (requestedRange.startswith("bytes=")):
+            offset = int(requestedRange[len("bytes="):].split("-")[0])
+            if (offset >= len(data)):
+                self.sendEmpty(416)
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {offset}-{len(data) - 1}/{len(data)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/zip")
+        self.send_header("Content-Length", str(len(data) - offset))
+        self.end_headers()
+        try:
+            self.wfile.write(memoryview(data)[offset:])
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def sendJson(self, value) -> None:
+        data = json.dumps(value).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def sendEmpty(self, status: int) -> None:
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+def indexedValues(form: dict[str, list[str]], name: str) -> list[int]:
+    '''Returns name[0], name[1]... of a steam api form, in order'''
+    values: list[int] = []
+    while (f"{name}[{len(values)}]" in form):
+        values.append(int(form[f"{name}[{len(values)}]"][0]))
+    return values
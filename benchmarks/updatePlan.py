@@ -0,0 +1,62 @@
+'''Measures how long UpdatePlan takes for collections of different sizes.\n
+Run from repository root: python -m benchmarks.updatePlan'''
+import argparse
+import random
+import time
+
+from classes import WorkshopItem
+from classes import UpdatePlan
+
+
+def createItems(count: int, seed: int = 0) -> tuple[list[WorkshopItem], list[WorkshopItem], list[str]]:
+    '''Returns local items, fetched items and folders of a synthetic collection.
+    A tenth of items is added, a tenth updated and a tenth deleted'''
+    rng = random.Random(seed)
+    localItems: list[WorkshopItem] = []
+    fetchedItems: list[WorkshopItem] = []
+    for index in range(count):
+        id = 100000000 + index
+        kind = rng.random()
+        if (kind < 0.1):
+            fetchedItems.append(WorkshopItem(id, 0, f"item{id}", 2))
+        elif (kind < 0.2):
+            localItems.append(WorkshopItem(id, 0, f"item{id}", 1))
+            fetchedItems.append(WorkshopItem(id, 0, f"item{id}", 2))
+        elif (kind < 0.3):
+            localItems.append(WorkshopItem(id, 0, f"item{id}", 1))
+        else:
+            localItems.append(WorkshopItem(id, 0, f"item{id}", 1))
+            fetchedItems.append(WorkshopItem(id, 0, f"item{id}", 1))
+
+    rng.shuffle(fetchedItems)
+    folders = [item.name for item in localItems]
+    return localItems, fetchedItems, folders
+
+
+def measure(count: int, repeats: int) -> float:
+    '''Returns best time in seconds of planning a collection with count items'''
+    localItems, fetchedItems, folders = createItems(count)
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        UpdatePlan.fromItems(localItems, fetchedItems, folders)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of update planning")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="Amounts of items in collection. Defaults to 1000 10000 100000")
+    parser.add_argument("--repeats", type=int, default=5,
+                        help="Runs per size, best one is reported. Defaults to 5")
+    args = parser.parse_args()
+
+    print(f"{'items':>10} {'total ms':>10} {'us/item':>10}")
+    for count in args.sizes:
+        seconds = measure(count, args.repeats)
+        print(f"{count:>10} {seconds * 1000:>10.2f} {seconds / count * 1e6:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
 from .workshopItemBase import WorkshopItemBase
 from .workshopItem import WorkshopItem
 from .workshopCollection import WorkshopCollection
+from .updatePlan import UpdatePlan
@@ -0,0 +1,155 @@
+from classes import WorkshopItem
+from classes import WorkshopCollection
+
+
+class UpdatePlan:
+    '''Difference between local and fetched items of a collection.\n
+    Built with dict and set lookups, so it takes linear time in the amount of items.'''
+
+    def __init__(self) -> None:
+        # fetched items, which are not downloaded yet
+        self.addedItems: list[WorkshopItem] = []
+        # fetched items with a different lastUpdated than their local version
+        self.updatedItems: list[WorkshopItem] = []
+        # fetched items, which are up to date
+        self.ignoredItems: list[WorkshopItem] = []
+        # local items, which are no longer in the collection
+        self.deletedItems: list[WorkshopItem] = []
+        # folders not associated with any fetched item
+        self.deletedFolders: list[str] = []
+        # local version of every local item, by id
+        self.localItemsById: dict[int, WorkshopItem] = {}
+
+    @classmethod
+    def fromItems(cls, localItems: list[WorkshopItem], fetchedItems: list[WorkshopItem], existingFolders: list[str] = []):
+        '''Compares local and fetched items. existingFolders are names of folders in collection directory'''
+        plan = cls()
+
+        for item in localItems:
+            # first occurrence wins, same as list.index()
+            plan.localItemsById.setdefault(item.id, item)
+
+        fetchedItemIds: set[int] = set()
+        fetchedItemNames: set[str] = set()
+        for item in fetchedItems:
+            if (item.id in fetchedItemIds):
+                continue
+            fetchedItemIds.add(item.id)
+            fetchedItemNames.add(item.name)
+
+            localItem = plan.localItemsById.get(item.id)
+            if (localItem is None):
+                plan.addedItems.append(item)
+            elif (localItem.lastUpdated != item.lastUpdated):
+                plan.updatedItems.append(item)
+            else:
+                plan.ignoredItems.append(item)
+
+        plan.deletedItems = [
+            item for item
+            in plan.localItemsById.values()
+            if item.id not in fetchedItemIds
+        ]
+
+        # If you manually remove items from collection.json,
+        # then we do not longer have any info about them. So we scan for all folders,
+        # and delete all folders that are not in names list
+        # (folders are named using item names)
+        plan.deletedFolders = [
+            folder for folder
+            in existingFolders
+            if folder not in fetchedItemNames
+        ]
+
+        return plan
+
+    @classmethod
+    def fromCollection(cls, collection: WorkshopCollection, existingFolders: list[str] = []):
+        return cls.fromItems(collection.localItems, collection.fetchedItems, existingFolders)
+
+    @classmethod
+    def fromJson(cls, json: dict):
+        '''Reads plan saved with json()'''
+        plan = cls()
+        plan.addedItems = [WorkshopItem.fromJson(item) for item in json.get("addedItems", [])]
+        plan.updatedItems = [WorkshopItem.fromJson(item) for item in json.get("updatedItems", [])]
+        plan.ignoredItems = [WorkshopItem.fromJson(item) for item in json.get("ignoredItems", [])]
+        plan.deletedItems = [WorkshopItem.fromJson(item) for item in json.get("deletedItems", [])]
+        plan.deletedFolders = list(json.get("deletedFolders", []))
+        for item in json.get("localItems", []):
+            localItem = WorkshopItem.fromJson(item)
+            plan.localItemsById.setdefault(localItem.id, localItem)
+        return plan
+
+    def json(self) -> dict:
+        '''Returns dict with all item lists, file sizes and direct file urls included'''
+        def itemsJson(items: list[WorkshopItem]) -> list[dict]:
+            return [
+                dict(item.json(), fileSize=item.fileSize, fileUrl=item.fileUrl, fileName=item.fileName)
+                for item in items
+            ]
+
+        return {
+            "addedItems": itemsJson(self.addedItems),
+            "updatedItems": itemsJson(self.updatedItems),
+            "ignoredItems": itemsJson(self.ignoredItems),
+            "deletedItems": itemsJson(self.deletedItems),
+            "deletedFolders": self.deletedFolders,
+            "localItems": itemsJson(list(self.localItemsById.values()))
+        }
+
+    @property
+    def fetchedItems(self) -> list[WorkshopItem]:
+        '''Items which stay in the collection'''
+        return self.ignoredItems + self.updatedItems + self.addedItems
+
+    @property
+    def downloadedItems(self) -> list[WorkshopItem]:
+        '''Items which have to be downloaded'''
+        return self.updatedItems + self.addedItems
+
+    @property
+    def totalBytes(self) -> int:
+        '''Bytes to download, items of unknown size are not counted'''
+        return sum(item.fileSize for item in self.downloadedItems if item.fileSize > 0)
+
+    @property
+    def unknownSizeItems(self) -> int:
+        return len([item for item in self.downloadedItems if item.fileSize <= 0])
+
+    def skipFinishedItems(self, finishedItems: list[WorkshopItem]) -> None:
+        '''Moves items, which were already downloaded in the same version, to ignored items'''
+        finishedVersions: set[tuple[int, int]] = set(
+            (item.id, item.lastUpdated) for item
+            in finishedItems
+        )
+
+        def isFinished(item: WorkshopItem) -> bool:
+            return (item.id, item.lastUpdated) in finishedVersions
+
+        finished = [item for item in self.downloadedItems if isFinished(item)]
+        self.addedItems = [item for item in self.addedItems if not isFinished(item)]
+        self.updatedItems = [item for item in self.updatedItems if not isFinished(item)]
+        self.ignoredItems += finished
+        for item in finished:
+            self.localItemsById[item.id] = item
+
+    @property
+    def isEmpty(self) -> bool:
+        '''True if there is nothing to add, update or delete'''
+        return (
+            len(self.addedItems) == 0 and
+            len(self.updatedItems) == 0 and
+            len(self.deletedItems) == 0 and
+            len(self.deletedFolders) == 0
+        )
+
+    def __str__(self) -> str:
+        return (
+            f"{{UpdatePlan - added: {len(self.addedItems)} | updated: {len(self.updatedItems)} | "
+            f"ignored: {len(self.ignoredItems)} | deleted: {len(self.deletedItems)} | "
+            f"deleted folders: {len(self.deletedFolders)}}}"
+        )
+
+    def __repr__(self) -> str:
+        return self.__str__()
@@ -116,6 +116,43 @@ class WorkshopCollection(WorkshopItemBase):
                 self.localItems
             )
 
+    @staticmethod
+    def FetchNewItemsBatch(collections: list) -> list:
+        '''Fetches new items of several collections at once.
+        Items shared by collections are asked for only once.
+        Returns collections which do not exist on steam workshop'''
+        remoteCollections = [
+            collection for collection
+            in collections
+            if SteamAPI.Validator.ValidSteamItemId(collection.id)
+        ]
+        localCollections = [
+            collection for collection
+            in collections
+            if not SteamAPI.Validator.ValidSteamItemId(collection.id)
+        ]
+
+        collectionsInfo, itemsById = SteamAPI.GetWorkshopCollectionsInfo(
+            [collection.id for collection in remoteCollections],
+            [item.id for collection in localCollections for item in collection.localItems]
+        )
+
+        missingCollections = []
+        for collection in remoteCollections:
+            if (collection.id not in collectionsInfo):
+                missingCollections.append(collection)
+                continue
+            collection.name, collection.appid, collection.fetchedItems = collectionsInfo[collection.id]
+
+        for collection in localCollections:
+            collection.fetchedItems = [
+                itemsById[item.id].copy() for item
+                in collection.localItems
+                if item.id in itemsById
+            ]
+
+        return missingCollections
+
     @staticmethod
     def getItemsByName(items: list[WorkshopItem], name: str) -> list[WorkshopItem]:
         result = [item for item in items if item.name == name]
@@ -1,13 +1,57 @@
 from classes import WorkshopItemBase
+from utils import AssertParameter
 
 
 class WorkshopItem(WorkshopItemBase):
-    def __init__(self, id: int, appid: int = -1, name: str = "", lastUpdated: int = -1) -> None:
+    # size of item's file in bytes, as reported by steam api (-1 if unknown)
+    _fileSize: int = -1
+    # direct download of item's file, only given by steam api for legacy items ("" if there is none)
+    _fileUrl: str = ""
+    # name of that file
+    _fileName: str = ""
+
+    def __init__(self, id: int, appid: int = -1, name: str = "", lastUpdated: int = -1, fileSize: int = -1, fileUrl: str = "", fileName: str = "") -> None:
         super().__init__(id, appid, name, lastUpdated)
+        self.fileSize = fileSize
+        self.fileUrl = fileUrl
+        self.fileName = fileName
+
+    @property
+    def fileSize(self) -> int:
+        return self._fileSize
+
+    @fileSize.setter
+    def fileSize(self, value: int) -> None:
+        AssertParameter(value, int, "fileSize.value")
+        self._fileSize = value
+
+    @property
+    def fileUrl(self) -> str:
+        return self._fileUrl
+
+    @fileUrl.setter
+    def fileUrl(self, value: str) -> None:
+        AssertParameter(value, str, "fileUrl.value")
+        self._fileUrl = value
+
+    @property
+    def fileName(self) -> str:
+        return self._fileName
+
+    @fileName.setter
+    def fileName(self, value: str) -> None:
+        AssertParameter(value, str, "fileName.value")
+        self._fileName = value
+
+    def copy(self):
+        return WorkshopItem(self.id, self.appid, self.name, self.lastUpdated, self.fileSize, self.fileUrl, self.fileName)
 
     @classmethod
     def fromJson(cls, json):
-        return cls(json.get("itemId"), json.get("appId"), json.get("itemName"), json.get("lastUpdated"))
+        return cls(
+            json.get("itemId"), json.get("appId"), json.get("itemName"), json.get("lastUpdated"),
+            json.get("fileSize", -1), json.get("fileUrl", ""), json.get("fileName", "")
+        )
 
     def json(self):
         '''Returns dict with id, appid, and lastUpdated vars.'''
@@ -0,0 +1,60 @@
+import tempfile
+import unittest
+import os
+
+from utils.cache import DiskCache
+
+
+class SaveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "cache.json")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def newCache(self) -> DiskCache:
+        return DiskCache(self.path, 600, 100)
+
+    def testSkipsWriteWhenNothingChanged(self):
+        cache = self.newCache()
+        cache.setMany({"1": {"title": "one"}})
+        cache.save()
+        modifiedAt = os.stat(self.path).st_mtime_ns
+        os.remove(self.path)
+
+        # repeated lookups and unchanged fresh values leave the file alone
+        cache.getMany(["1", "2"])
+        cache.setMany({"1": {"title": "one"}})
+        cache.save()
+        self.assertFalse(os.path.exists(self.path))
+
+        cache.setMany({"1": {"title": "renamed"}})
+        cache.save()
+        self.assertNotEqual(os.stat(self.path).st_mtime_ns, modifiedAt)
+        self.assertEqual(self.newCache().get("1"), {"title": "renamed"})
+
+    def testMergesEntriesSavedByOthers(self):
+        first = self.newCache()
+        second = self.newCache()
+        self.assertIsNone(second.get("2"))
+        first.set("1", "one")
+        first.save()
+        second.set("2", "two")
+        second.save()
+
+        saved = self.newCache()
+        self.assertEqual(saved.getMany(["1", "2"]), {"1": "one", "2": "two"})
+
+    def testClearIsSaved(self):
+        cache = self.newCache()
+        cache.set("1", "one")
+        cache.save()
+        cache.clear()
+        cache.save()
+        self.assertEqual(len(self.newCache()), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
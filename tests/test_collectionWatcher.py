@@ -0,0 +1,79 @@
+from unittest import mock
+import tempfile
+import unittest
+
+from classes import WorkshopCollection, WorkshopItem
+from utils import filemanager
+from api import SteamDownloaderAPI
+from api.CollectionWatcher import CollectionWatcher, WatchedCollection
+
+
+def item(id: int, lastUpdated: int) -> WorkshopItem:
+    return WorkshopItem(id, 4000, f"item{id}", lastUpdated)
+
+
+class SyncTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.watcher = CollectionWatcher(self.directory.name)
+        self.collection = WorkshopCollection(123456, 4000, "watched")
+        self.watched = WatchedCollection(self.collection, 60)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def saveDownloadedItems(self, items: list[WorkshopItem]) -> None:
+        collectionDirectory = f"{self.directory.name}/watched"
+        filemanager.createDirectory(collectionDirectory)
+        for downloadedItem in items:
+            filemanager.createDirectory(f"{collectionDirectory}/{downloadedItem.name}")
+        filemanager.saveCollectionAsJson(
+            f"{collectionDirectory}/collection.json", self.collection, items, True
+        )
+
+    def sync(self) -> tuple[bool, mock.Mock]:
+        with mock.patch.object(SteamDownloaderAPI, "UpdateCollection") as updateCollection, \
+                mock.patch.object(SteamDownloaderAPI, "DownloadCollection") as downloadCollection:
+            changed = self.watcher.sync(self.watched)
+        downloadCollection.assert_not_called()
+        return changed, updateCollection
+
+    def testCollectionWithoutItemsIsNotUpdated(self):
+        self.collection.fetchedItems = []
+
+        changed, updateCollection = self.sync()
+
+        self.assertFalse(changed)
+        updateCollection.assert_not_called()
+        self.assertTrue(self.watched.synced)
+
+    def testRestartedWatcherReadsCollectionJson(self):
+        self.saveDownloadedItems([item(1, 100), item(2, 100)])
+        self.collection.fetchedItems = [item(1, 100), item(2, 100)]
+
+        changed, updateCollection = self.sync()
+
+        self.assertFalse(changed)
+        updateCollection.assert_not_called()
+        self.assertEqual(sorted(i.id for i in self.collection.localItems), [1, 2])
+
+    def testChangedItemsAreUpdatedWithPlan(self):
+        self.saveDownloadedItems([item(1, 100), item(2, 100)])
+        self.collection.fetchedItems = [item(1, 200), item(2, 100)]
+
+        changed, updateCollection = self.sync()
+
+        self.assertTrue(changed)
+        plan = updateCollection.call_args.args[4]
+        self.assertEqual([i.id for i in plan.updatedItems], [1])
+
+        # nothing new since the last poll
+        self.collection.localItems = [item(1, 200), item(2, 100)]
+        changed, updateCollection = self.sync()
+        self.assertFalse(changed)
+        updateCollection.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
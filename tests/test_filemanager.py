@@ -0,0 +1,123 @@
+import tempfile
+import unittest
+import zipfile
+import io
+import os
+
+from utils import filemanager
+
+
+def makeZipFile(files: dict) -> bytes:
+    '''Returns zipfile with files (path: content), paths ending with / are folders'''
+    with io.BytesIO() as memoryFile:
+        with zipfile.ZipFile(memoryFile, "w") as zipFile:
+            for path, content in files.items():
+                zipFile.writestr(path, content)
+        return memoryFile.getvalue()
+
+
+class ApplyZipDeltaTest(unittest.TestCase):
+    oldFiles = {
+        "keep.txt": "unchanged",
+        "change.txt": "old version",
+        "nested/deep/removed.txt": "removed"
+    }
+    newFiles = {
+        "keep.txt": "unchanged",
+        "change.txt": "new version, longer",
+        "added/new.txt": "brand new"
+    }
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.itemDirectory = f"{self.directory.name}/item"
+        oldZipFile = makeZipFile(self.oldFiles)
+        filemanager.saveZipFile(self.itemDirectory, oldZipFile)
+        self.manifest = filemanager.getZipManifest(oldZipFile)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def listItemDirectory(self) -> tuple[set, set]:
+        '''Returns relative paths of folders and files in item directory'''
+        directories, files = set(), set()
+        for path, directoryNames, fileNames in os.walk(self.itemDirectory):
+            relativePath = os.path.relpath(path, self.itemDirectory).replace(os.sep, "/")
+            prefix = "" if relativePath == "." else f"{relativePath}/"
+            directories.update(prefix + name for name in directoryNames)
+            files.update(prefix + name for name in fileNames)
+        return directories, files
+
+    def testWritesOnlyChangedFiles(self):
+        keptPath = f"{self.itemDirectory}/keep.txt"
+        keptInode = os.stat(keptPath).st_ino
+
+        writtenFiles, removedFiles = filemanager.applyZipDelta(
+            self.itemDirectory, makeZipFile(self.newFiles), self.manifest
+        )
+
+        self.assertEqual((writtenFiles, removedFiles), (2, 1))
+        self.assertEqual(os.stat(keptPath).st_ino, keptInode)
+        for path, content in self.newFiles.items():
+            with open(f"{self.itemDirectory}/{path}", "r") as file:
+                self.assertEqual(file.read(), content)
+
+    def testMatchesFullExtraction(self):
+        newZipFile = makeZipFile(self.newFiles)
+        filemanager.applyZipDelta(self.itemDirectory, newZipFile, self.manifest)
+        deltaResult = self.listItemDirectory()
+
+        filemanager.deleteDirectory(self.itemDirectory)
+        filemanager.saveZipFile(self.itemDirectory, newZipFile)
+        self.assertEqual(deltaResult, self.listItemDirectory())
+
+    def testRemovesFoldersLeftEmpty(self):
+        filemanager.applyZipDelta(self.itemDirectory, makeZipFile(self.newFiles), self.manifest)
+
+        directories, _ = self.listItemDirectory()
+        self.assertNotIn("nested", directories)
+        self.assertTrue(os.path.isdir(self.itemDirectory))
+
+    def testKeepsFoldersMadeByUser(self):
+        os.makedirs(f"{self.itemDirectory}/userFolder/empty")
+        filemanager.applyZipDelta(self.itemDirectory, makeZipFile(self.newFiles), self.manifest)
+
+        directories, _ = self.listItemDirectory()
+        self.assertIn("userFolder/empty", directories)
+
+    def testBrokenZipFileLeavesFolderUntouched(self):
+        before = self.listItemDirectory()
+        newZipFile = makeZipFile(self.newFiles)
+        # added file is extracted after the changed one, its content no longer matches CRC32
+        brokenZipFile = newZipFile.replace(b"brand new", b"brand old")
+
+        with self.assertRaises(zipfile.BadZipFile):
+            filemanager.applyZipDelta(self.itemDirectory, brokenZipFile, self.manifest)
+
+        self.assertEqual(self.listItemDirectory(), before)
+        with open(f"{self.itemDirectory}/change.txt", "r") as file:
+            self.assertEqual(file.read(), "old version")
+        self.assertFalse(os.path.exists(filemanager.getStagingDirectory(self.itemDirectory)))
+
+    def testKeepsEmptyFoldersOfNewVersion(self):
+        newFiles = dict(self.newFiles, **{"emptyInNew/": ""})
+        filemanager.applyZipDelta(self.itemDirectory, makeZipFile(newFiles), self.manifest)
+
+        directories, _ = self.listItemDirectory()
+        self.assertIn("emptyInNew", directories)
+
+    def testRewritesFilesChangedOnDisk(self):
+        with open(f"{self.itemDirectory}/keep.txt", "w") as file:
+            file.write("edited by user")
+
+        writtenFiles, _ = filemanager.applyZipDelta(
+            self.itemDirectory, makeZipFile(self.newFiles), self.manifest
+        )
+
+        self.assertEqual(writtenFiles, 3)
+        with open(f"{self.itemDirectory}/keep.txt", "r") as file:
+            self.assertEqual(file.read(), "unchanged")
+
+
+if __name__ == "__main__":
+    unittest.main()
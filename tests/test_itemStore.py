@@ -0,0 +1,56 @@
+from unittest import mock
+import tempfile
+import unittest
+import errno
+import os
+
+from utils.itemStore import ItemStore
+
+
+class LinkFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ItemStore(f"{self.directory.name}/store", "hardlink")
+        self.sources = []
+        for index in range(2):
+            path = f"{self.directory.name}/source{index}"
+            with open(path, "w") as file:
+                file.write(f"file {index}")
+            self.sources.append(path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def linkFiles(self, linkErrors: list):
+        '''Links every source, os.link raises the next of linkErrors, None links the file'''
+        link = os.link
+
+        def failingLink(source, destination):
+            error = linkErrors.pop(0)
+            if (error is not None):
+                raise OSError(error, os.strerror(error))
+            link(source, destination)
+
+        with mock.patch("os.link", failingLink), mock.patch("utils.itemStore.reflinkFile", side_effect=OSError(errno.EOPNOTSUPP, "")):
+            for index, source in enumerate(self.sources):
+                self.store.linkFile(source, f"{self.directory.name}/linked{index}")
+
+    def testTemporaryErrorFallsBackForOneFile(self):
+        self.linkFiles([errno.EMLINK, None])
+
+        self.assertEqual((self.store.linkedFiles, self.store.copiedFiles), (1, 1))
+        self.assertNotIn("hardlink", self.store._unsupportedModes)
+        self.assertTrue(os.path.samefile(self.sources[1], f"{self.directory.name}/linked1"))
+
+    def testUnsupportedModeIsNotTriedAgain(self):
+        self.linkFiles([errno.EXDEV])
+
+        self.assertEqual((self.store.linkedFiles, self.store.copiedFiles), (0, 2))
+        self.assertEqual(self.store._unsupportedModes, {"hardlink", "reflink"})
+        with open(f"{self.directory.name}/linked1", "r") as file:
+            self.assertEqual(file.read(), "file 1")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import tempfile
+import unittest
+import os
+
+from utils.journal import Journal
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = f"{self.directory.name}/collection.journal"
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def writeJournal(self, records):
+        journal = Journal(self.path, "never")
+        journal.open()
+        for record in records:
+            journal.append(record)
+        journal.close()
+        return journal
+
+    def testReplaysRecordsInOrder(self):
+        records = [{"itemId": 1}, {"itemId": 2}, {"itemId": 3}]
+        self.assertEqual(self.writeJournal(records).replay(), records)
+
+    def testIgnoresTruncatedLastLine(self):
+        journal = self.writeJournal([{"itemId": 1}, {"itemId": 2}])
+        # process was killed while writing the third record
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write('{"itemId": 3, "lastUp')
+
+        self.assertEqual(journal.replay(), [{"itemId": 1}, {"itemId": 2}])
+
+    def testAppendsAfterTruncatedLastLine(self):
+        journal = self.writeJournal([{"itemId": 1}])
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write('{"itemId": 2')
+
+        journal.open()
+        journal.append({"itemId": 3})
+        journal.close()
+        self.assertEqual(journal.replay(), [{"itemId": 1}, {"itemId": 3}])
+
+    def testMissingJournalHasNoRecords(self):
+        journal = Journal(self.path)
+        self.assertFalse(journal.exists)
+        self.assertEqual(journal.replay(), [])
+
+    def testDeleteRemovesFile(self):
+        journal = self.writeJournal([{"itemId": 1}])
+        journal.delete()
+        self.assertFalse(os.path.exists(self.path))
+
+    def testRejectsUnknownFsyncPolicy(self):
+        with self.assertRaises(ValueError):
+            Journal(self.path, "sometimes")
+
+
+if __name__ == "__main__":
+    unittest.main()
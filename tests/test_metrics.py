@@ -0,0 +1,50 @@
+import unittest
+
+from utils.metrics import MetricsRegistry, StageSample, percentile
+
+
+def sample(stage: str, itemId: int, seconds: float, bytes: int = 0, succeeded: bool = True) -> StageSample:
+    measured = StageSample(stage, itemId)
+    measured.seconds = seconds
+    measured.bytes = bytes
+    measured.succeeded = succeeded
+    return measured
+
+
+class ReportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = MetricsRegistry()
+        # first backend failed, the second one served the item
+        self.metrics.record(sample("download", 1, 2, 100, False))
+        self.metrics.record(sample("download", 1, 3, 1000))
+        self.metrics.record(sample("download", 2, 1, 500))
+        self.metrics.record(sample("resolve", 1, 4))
+        self.metrics.count("backend_fallbacks", itemId=1)
+
+    def testSumsAttemptsOfItem(self):
+        report = self.metrics.report()
+        download = report["perItem"]["1"]["stages"]["download"]
+        self.assertEqual(download, {"seconds": 5, "bytes": 1100, "attempts": 2, "succeeded": True})
+        self.assertEqual(report["perItem"]["1"]["counters"], {"backend_fallbacks": 1})
+
+    def testItemsAddUpToStageTotals(self):
+        report = self.metrics.report()
+        for stage, summary in report["stages"].items():
+            itemStages = [item["stages"][stage] for item in report["perItem"].values() if stage in item["stages"]]
+            self.assertEqual(sum(itemStage["seconds"] for itemStage in itemStages), summary["seconds"])
+            self.assertEqual(sum(itemStage["bytes"] for itemStage in itemStages), summary["bytes"])
+            self.assertEqual(sum(itemStage["attempts"] for itemStage in itemStages), summary["count"])
+
+    def testStageSummary(self):
+        summary = self.metrics.stageSummary("download")
+        self.assertEqual((summary["count"], summary["failed"], summary["seconds"]), (3, 1, 6))
+        self.assertEqual((summary["p50"], summary["max"]), (2, 3))
+
+    def testPercentile(self):
+        self.assertEqual(percentile([], 50), 0)
+        self.assertEqual(percentile([5, 1, 3, 2, 4], 95), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import http.server
+import threading
+import tempfile
+import unittest
+import zipfile
+import os
+
+from classes import WorkshopItem
+from api import SteamDownloaderAPI
+from api.SteamDownloaderAPI import DownloadJob, PartialDownload
+from api.DownloadBackends import DirectBackend, NodeBackend
+
+
+class FileHandler(http.server.BaseHTTPRequestHandler):
+    '''Serves server.content at any path, with ranges'''
+
+    def do_GET(self):
+        self.server.ranges.append(self.headers.get("Range", ""))
+        if (self.path in self.server.missingPaths):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        content = self.server.content
+        offset = 0
+        rangeHeader = self.headers.get("Range", "")
+        if (rangeHeader.startswith("bytes=")):
+            offset = int(rangeHeader.removeprefix("bytes=").split("-")[0])
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {offset}-{len(content) - 1}/{len(content)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(content) - offset))
+        self.end_headers()
+        self.wfile.write(content[offset:])
+
+    def log_message(self, *args):
+        pass
+
+
+class PartialDownloadTest(unittest.TestCase):
+    content = b"GMAD" + bytes(range(256)) * 64
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FileHandler)
+        self.server.content = self.content
+        self.server.ranges = []
+        self.server.missingPaths = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.settings = (SteamDownloaderAPI.Settings.spoolDownloads, SteamDownloaderAPI.Settings.showProgress)
+        SteamDownloaderAPI.Settings.spoolDownloads = True
+        SteamDownloaderAPI.Settings.showProgress = False
+
+        url = f"http://127.0.0.1:{self.server.server_address[1]}/legacy.gma"
+        item = WorkshopItem(123, 4000, "Legacy", 1000, len(self.content), url, "legacy.gma")
+        self.job = DownloadJob(1, item, f"{self.directory.name}/Legacy")
+        # first half was downloaded by an interrupted run
+        self.half = len(self.content) // 2
+        with open(self.job.partialDownloadPath(), "wb") as file:
+            file.write(self.content[:self.half])
+        self.partialDownload = PartialDownload(self.job.partialDownloadPath(), url, backend=DirectBackend.name)
+        self.partialDownload.save()
+
+    def tearDown(self):
+        SteamDownloaderAPI.Settings.spoolDownloads, SteamDownloaderAPI.Settings.showProgress = self.settings
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def nodeBackend(self):
+        def resolve(item):
+            raise AssertionError("node must not be asked for a resumed download")
+        return NodeBackend(resolve, 10, 1024)
+
+    def testResumesDirectDownload(self):
+        backends = [DirectBackend(0, 1024), self.nodeBackend()]
+
+        location = SteamDownloaderAPI.resolveStage(self.job, None, backends)
+        self.assertEqual(location, self.partialDownload.url)
+        self.assertIsInstance(self.job.backend, DirectBackend)
+
+        path = SteamDownloaderAPI.downloadStage(self.job, location)
+        self.assertEqual(self.server.ranges, [f"bytes={self.half}-"])
+        with zipfile.ZipFile(path) as zipFile:
+            self.assertEqual(zipFile.read("legacy.gma"), self.content)
+        self.assertFalse(os.path.exists(f"{path}.json"))
+
+    def testDiscardsPartialDownloadOfDisabledBackend(self):
+        def resolve(item):
+            return self.partialDownload.url.replace("legacy.gma", "node.zip")
+        backends = [NodeBackend(resolve, 10, 1024)]
+
+        location = SteamDownloaderAPI.resolveStage(self.job, None, backends)
+        self.assertTrue(location.endswith("node.zip"))
+        self.assertFalse(os.path.exists(self.job.partialDownloadPath()))
+
+    def testLocatesItemAgainWhenNodeUrlIsStale(self):
+        # interrupted download came from a node, whose storage no longer has it
+        self.partialDownload.backend = NodeBackend.name
+        self.partialDownload.save()
+        self.server.missingPaths.add("/legacy.gma")
+        resolved = []
+
+        def resolve(item):
+            resolved.append(item.id)
+            return self.partialDownload.url.replace("legacy.gma", "prepared.zip")
+        backends = [NodeBackend(resolve, 10, 1024)]
+
+        location = SteamDownloaderAPI.resolveStage(self.job, None, backends)
+        self.assertEqual(resolved, [])
+        path = SteamDownloaderAPI.downloadStage(self.job, location)
+
+        self.assertEqual(resolved, [self.job.item.id])
+        self.assertEqual(self.server.ranges, [f"bytes={self.half}-", ""])
+        with open(path, "rb") as file:
+            self.assertEqual(file.read(), self.content)
+
+    def testSavesBackendOfInterruptedDownload(self):
+        loaded = PartialDownload.load(self.job.partialDownloadPath())
+        self.assertEqual(loaded.backend, DirectBackend.name)
+        self.assertEqual(loaded.offset, self.half)
+
+
+if __name__ == "__main__":
+    unittest.main()
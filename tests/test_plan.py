@@ -0,0 +1,98 @@
+import tempfile
+import unittest
+
+from classes import WorkshopCollection, WorkshopItem, UpdatePlan
+from utils import filemanager
+from api import SteamDownloaderAPI
+
+
+def item(id: int, lastUpdated: int, fileSize: int = -1, fileUrl: str = "") -> WorkshopItem:
+    return WorkshopItem(id, 4000, f"item{id}", lastUpdated, fileSize, fileUrl, "item.gma" if fileUrl else "")
+
+
+def versions(items: list[WorkshopItem]) -> list[tuple]:
+    return [(item.id, item.name, item.lastUpdated, item.fileSize, item.fileUrl, item.fileName) for item in items]
+
+
+class SavedPlanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = f"{self.directory.name}/plan.json"
+
+        self.collection = WorkshopCollection(123456, 4000, "steam")
+        self.collection.fetchedItems = [item(1, 100, 2048), item(2, 200, -1, "http://example.com/item.gma")]
+        localItems = [item(1, 50), item(3, 100)]
+        self.localCollection = WorkshopCollection(-1, 4000, "local", localItems)
+        self.localCollection.fetchedItems = [item(1, 100, 2048)]
+
+        self.plans = [
+            UpdatePlan.fromItems([], self.collection.fetchedItems),
+            UpdatePlan.fromItems(localItems, self.localCollection.fetchedItems, ["item1", "stray"])
+        ]
+        SteamDownloaderAPI.SavePlan(
+            self.path, [self.collection, self.localCollection], self.plans, self.directory.name, False
+        )
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def testRoundTrip(self):
+        directory, removeDeletedItems, collections, plans = SteamDownloaderAPI.LoadPlan(self.path)
+
+        self.assertEqual(directory, self.directory.name)
+        self.assertFalse(removeDeletedItems)
+        self.assertEqual([collection.json() for collection in collections], [
+            self.collection.json(), self.localCollection.json()
+        ])
+        for savedPlan, plan in zip(self.plans, plans):
+            self.assertEqual(plan.json(), savedPlan.json())
+            self.assertEqual(versions(plan.addedItems), versions(savedPlan.addedItems))
+            self.assertEqual(versions(plan.updatedItems), versions(savedPlan.updatedItems))
+        self.assertEqual(versions(collections[1].localItems), versions(self.localCollection.localItems))
+        self.assertEqual(plans[1].deletedFolders, ["stray"])
+
+    def testSavesSizeOfDownloads(self):
+        savedPlan = filemanager.readJsonFile(self.path)
+        self.assertEqual(savedPlan["totalBytes"], 4096)
+        self.assertEqual(savedPlan["collections"][0]["unknownSizeItems"], 1)
+
+    def testSkipsLocalCollectionWithoutItems(self):
+        savedPlan = filemanager.readJsonFile(self.path)
+        savedPlan["collections"][1]["plan"] = {}
+        filemanager.saveJsonFile(self.path, savedPlan)
+
+        _, _, collections, plans = SteamDownloaderAPI.LoadPlan(self.path)
+
+        self.assertEqual([collection.name for collection in collections], ["steam"])
+        self.assertEqual(len(plans), 1)
+
+    def testRefreshSkipsAppliedChanges(self):
+        # item 1 was downloaded by another run since the plan was saved
+        collectionDirectory = f"{self.directory.name}/steam"
+        filemanager.createDirectory(f"{collectionDirectory}/item1")
+        filemanager.saveCollectionAsJson(
+            f"{collectionDirectory}/collection.json", self.collection, [item(1, 100)], True
+        )
+        _, _, _, plans = SteamDownloaderAPI.LoadPlan(self.path)
+
+        staleChanges = SteamDownloaderAPI.refreshPlan(plans[0], collectionDirectory)
+
+        self.assertEqual(staleChanges, 1)
+        self.assertEqual([item.id for item in plans[0].addedItems], [2])
+        self.assertEqual([item.id for item in plans[0].ignoredItems], [1])
+
+    def testRefreshSkipsDeletedFolders(self):
+        _, _, _, plans = SteamDownloaderAPI.LoadPlan(self.path)
+
+        # neither item3 nor stray exist any more
+        staleChanges = SteamDownloaderAPI.refreshPlan(plans[1], f"{self.directory.name}/local")
+
+        self.assertEqual(staleChanges, 2)
+        self.assertEqual(plans[1].deletedItems, [])
+        self.assertEqual(plans[1].deletedFolders, [])
+        self.assertEqual([item.id for item in plans[1].updatedItems], [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
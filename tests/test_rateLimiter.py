@@ -0,0 +1,75 @@
+import datetime
+import threading
+import unittest
+import time
+
+from utils.rateLimiter import RateLimiter, RateWindow, parseRate
+
+
+class RateLimiterTest(unittest.TestCase):
+    rate = 100 * 1024
+    chunk = 8 * 1024
+
+    def consumeFor(self, limiter: RateLimiter, amount: int) -> float:
+        '''Returns seconds it took to consume amount bytes in chunks'''
+        start = time.monotonic()
+        for _ in range(amount // self.chunk):
+            limiter.consume(self.chunk)
+        return time.monotonic() - start
+
+    def testLimitsRate(self):
+        limiter = RateLimiter(self.rate)
+        # half a second of traffic, the bucket starts empty
+        seconds = self.consumeFor(limiter, self.rate // 2)
+        self.assertGreaterEqual(seconds, 0.4)
+        self.assertLess(seconds, 1)
+
+    def testSharedByThreads(self):
+        limiter = RateLimiter(self.rate)
+        start = time.monotonic()
+        threads = [
+            threading.Thread(target=self.consumeFor, args=(limiter, self.rate // 4))
+            for _ in range(2)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # two quarters of a second, one after the other
+        self.assertGreaterEqual(time.monotonic() - start, 0.4)
+
+    def testUnlimited(self):
+        self.assertFalse(RateLimiter(0).enabled)
+        self.assertLess(self.consumeFor(RateLimiter(0), self.rate * 10), 0.1)
+
+    def testStopEventEndsWait(self):
+        limiter = RateLimiter(1024)
+        stopEvent = threading.Event()
+        stopEvent.set()
+        start = time.monotonic()
+        limiter.consume(1024 * 1024, stopEvent)
+        self.assertLess(time.monotonic() - start, 0.1)
+
+    def testScheduleWindowOverridesMaxRate(self):
+        limiter = RateLimiter(self.rate, [RateWindow.fromString("22:00-06:00=0")])
+        self.assertEqual(limiter.rateAt(datetime.datetime(2024, 1, 1, 23, 30)), 0)
+        self.assertEqual(limiter.rateAt(datetime.datetime(2024, 1, 1, 5, 59)), 0)
+        self.assertEqual(limiter.rateAt(datetime.datetime(2024, 1, 1, 6, 0)), self.rate)
+
+
+class ParseRateTest(unittest.TestCase):
+
+    def testUnits(self):
+        self.assertEqual(parseRate("500"), 500)
+        self.assertEqual(parseRate("500K"), 500 * 1024)
+        self.assertEqual(parseRate("1.5MB/s"), 1.5 * 1024 * 1024)
+        self.assertEqual(parseRate("0"), 0)
+
+    def testInvalid(self):
+        for rate in ["", "fast", "-1M", "1T"]:
+            with self.assertRaises(ValueError):
+                parseRate(rate)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+
+from classes import WorkshopItem
+from utils.pipeline import PipelineResult, PipelineStoppedException
+from api import SteamDownloaderAPI
+from api.SteamDownloaderAPI import DownloadJob
+
+
+class OnItemProcessedTest(unittest.TestCase):
+
+    def setUp(self):
+        SteamDownloaderAPI.onDownloadStopped()
+        self.job = DownloadJob(0, WorkshopItem(1, 4000, "item1", 100), "/nonexistent/item1")
+
+    def tearDown(self):
+        SteamDownloaderAPI.onDownloadStopped()
+
+    def testRecordsSucceededItem(self):
+        SteamDownloaderAPI.onItemProcessed(PipelineResult(0, self.job))
+        self.assertEqual(SteamDownloaderAPI.DownloadedItems(), [self.job.item])
+
+    def testFailedItemDoesNotAbortRun(self):
+        for exception in [OSError(28, "No space left on device"), PipelineStoppedException(), ValueError("bad")]:
+            SteamDownloaderAPI.onItemProcessed(PipelineResult(0, self.job, None, exception, "extract"))
+        self.assertEqual(SteamDownloaderAPI.DownloadedItems(), [])
+
+
+
+class HasSharedItemsTest(unittest.TestCase):
+
+    def testSameVersionInTwoCollections(self):
+        downloadedItems = [
+            [WorkshopItem(1, 4000, "item1", 100)],
+            [WorkshopItem(2, 4000, "item2", 100), WorkshopItem(1, 4000, "item1", 100)]
+        ]
+        self.assertTrue(SteamDownloaderAPI.hasSharedItems(downloadedItems))
+
+    def testDifferentItemsOrVersions(self):
+        downloadedItems = [
+            [WorkshopItem(1, 4000, "item1", 100), WorkshopItem(1, 4000, "item1", 100)],
+            [WorkshopItem(1, 4000, "item1", 200), WorkshopItem(2, 4000, "item2", 100)],
+            []
+        ]
+        self.assertFalse(SteamDownloaderAPI.hasSharedItems(downloadedItems))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+
+from classes import WorkshopItem, UpdatePlan
+
+
+def item(id: int, lastUpdated: int, name: str = "") -> WorkshopItem:
+    return WorkshopItem(id, 4000, name or f"item{id}", lastUpdated)
+
+
+def ids(items: list[WorkshopItem]) -> list[int]:
+    return [item.id for item in items]
+
+
+class UpdatePlanFromItemsTest(unittest.TestCase):
+
+    def testSortsItemsByChange(self):
+        localItems = [item(1, 100), item(2, 100), item(3, 100)]
+        fetchedItems = [item(1, 100), item(2, 200), item(4, 100)]
+
+        plan = UpdatePlan.fromItems(localItems, fetchedItems)
+
+        self.assertEqual(ids(plan.ignoredItems), [1])
+        self.assertEqual(ids(plan.updatedItems), [2])
+        self.assertEqual(ids(plan.addedItems), [4])
+        self.assertEqual(ids(plan.deletedItems), [3])
+        self.assertEqual(plan.localItemsById[2].lastUpdated, 100)
+
+    def testKeepsOrderOfFetchedItems(self):
+        fetchedItems = [item(id, 100) for id in [5, 3, 9, 1]]
+        plan = UpdatePlan.fromItems([], fetchedItems)
+        self.assertEqual(ids(plan.addedItems), [5, 3, 9, 1])
+
+    def testFirstOccurrenceOfDuplicateWins(self):
+        localItems = [item(1, 100), item(1, 200)]
+        fetchedItems = [item(1, 100), item(1, 300)]
+
+        plan = UpdatePlan.fromItems(localItems, fetchedItems)
+
+        self.assertEqual(ids(plan.ignoredItems), [1])
+        self.assertEqual(plan.updatedItems, [])
+        self.assertEqual(plan.localItemsById[1].lastUpdated, 100)
+
+    def testDeletesFoldersOfNoFetchedItem(self):
+        fetchedItems = [item(1, 100, "kept"), item(2, 100, "renamed")]
+        plan = UpdatePlan.fromItems([], fetchedItems, ["kept", "old name", "stray"])
+        self.assertEqual(plan.deletedFolders, ["old name", "stray"])
+
+    def testEmptyWhenNothingChanged(self):
+        items = [item(1, 100), item(2, 100)]
+        plan = UpdatePlan.fromItems(items, [i.copy() for i in items], ["item1", "item2"])
+        self.assertTrue(plan.isEmpty)
+        self.assertEqual(plan.downloadedItems, [])
+
+    def testSkipsFinishedItems(self):
+        plan = UpdatePlan.fromItems([item(1, 100)], [item(1, 200), item(2, 100)])
+
+        plan.skipFinishedItems([item(1, 200), item(2, 50)])
+
+        self.assertEqual(ids(plan.updatedItems), [])
+        self.assertEqual(ids(plan.addedItems), [2])
+        self.assertEqual(ids(plan.ignoredItems), [1])
+        self.assertEqual(plan.localItemsById[1].lastUpdated, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
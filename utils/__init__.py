@@ -1,4 +1,6 @@
 from typing import Type
+import importlib
+import threading
 
 
 def AssertParameter(param, paramTypes: Type, paramName):
@@ -7,3 +9,27 @@ def AssertParameter(param, paramTypes: Type, paramName):
             f"{paramName} must be of type {paramTypes}\n"
             f"{paramName}: {param}, type: {type(param)}"
         )
+
+
+class LazyModule:
+    '''Module imported on first attribute access.\n
+    Keeps heavy modules (requests, zipfile...) out of startup,
+    so --help and checks which do not download anything start fast.'''
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attribute: str):
+        # only called for attributes of the module, own ones are found first
+        module = self._module
+        if (module is None):
+            with self._lock:
+                if (self._module is None):
+                    self._module = importlib.import_module(self._name)
+                module = self._module
+        return getattr(module, attribute)
+
+    def __repr__(self) -> str:
+        return f"{{LazyModule - name: {self._name} | imported: {self._module is not None}}}"
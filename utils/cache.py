@@ -0,0 +1,175 @@
+from typing import Any, Optional
+import contextlib
+import threading
+import json
+import time
+import os
+
+from utils import AssertParameter
+
+
+class DiskCache:
+    '''Key-value cache kept in a .json file.\n
+    Entries older than ttl seconds are ignored,
+    least recently used entries are evicted when there are more than maxEntries.\n
+    Several processes may share the file: save() merges entries saved by the others,
+    while holding a lock file next to it.
+    The file is only written when values were added, changed or cleared since the last save.'''
+    # seconds after which a lock file is taken over, it was left by a killed process
+    lockTimeout: float = 10
+    # seconds between attempts to take the lock file
+    lockPollDelay: float = 0.02
+
+    def __init__(self, path: str, ttl: float, maxEntries: int) -> None:
+        AssertParameter(path, str, "path")
+        AssertParameter(ttl, (int, float), "ttl")
+        AssertParameter(maxEntries, int, "maxEntries")
+        if (maxEntries < 1):
+            raise ValueError(f"Cache must fit at least one entry: {maxEntries}")
+
+        self.path = path
+        self.ttl = ttl
+        self.maxEntries = maxEntries
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: Optional[dict[str, dict]] = None
+        # entries stored before clear() are not merged back from the file
+        self._clearedAt: float = 0
+        # whether entries differ from the ones written by the last save()
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict[str, dict]:
+        if (self._entries is None):
+            self._entries = self._read()
+        return self._entries
+
+    def _read(self) -> dict[str, dict]:
+        '''Returns entries currently in the file'''
+        if (not os.path.isfile(self.path)):
+            return {}
+        try:
+            with open(self.path, "r") as file:
+                entries = json.load(file).get("entries", {})
+        except (ValueError, AttributeError):
+            # corrupted cache is as good as no cache
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def _merge(self, entries: dict[str, dict], savedEntries: dict[str, dict]) -> None:
+        '''Adds entries saved by other processes to entries. Newer value of a key wins'''
+        for key, savedEntry in savedEntries.items():
+            if (not isinstance(savedEntry, dict) or savedEntry.get("storedAt", 0) <= self._clearedAt):
+                continue
+            entry = entries.get(key)
+            if (entry is None or savedEntry.get("storedAt", 0) > entry.get("storedAt", 0)):
+                entries[key] = savedEntry
+            else:
+                entry["usedAt"] = max(entry.get("usedAt", 0), savedEntry.get("usedAt", 0))
+
+    @contextlib.contextmanager
+    def _fileLock(self):
+        '''Holds {path}.lock, so processes sharing the cache save it one at a time'''
+        lockPath = f"{self.path}.lock"
+        while True:
+            try:
+                # O_EXCL fails if another process holds the lock, on every platform
+                os.close(os.open(lockPath, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                pass
+            try:
+                if (time.time() - os.path.getmtime(lockPath) > self.lockTimeout):
+                    os.remove(lockPath)
+                    continue
+            except FileNotFoundError:
+                # released in the meantime
+                continue
+            time.sleep(self.lockPollDelay)
+        try:
+            yield
+        finally:
+            try:
+                os.remove(lockPath)
+            except FileNotFoundError:
+                pass
+
+    def _isFresh(self, entry: dict, now: float) -> bool:
+        return now - entry.get("storedAt", 0) < self.ttl
+
+    def get(self, key: str) -> Optional[Any]:
+        '''Returns cached value, or None if it is missing or expired'''
+        return self.getMany([key]).get(key)
+
+    def getMany(self, keys: list[str]) -> dict[str, Any]:
+        '''Returns dict of keys found in cache and their values'''
+        now = time.time()
+        result = {}
+        with self._lock:
+            entries = self._load()
+            for key in keys:
+                entry = entries.get(key)
+                if (entry is None or not self._isFresh(entry, now)):
+                    self.misses += 1
+                    continue
+                entry["usedAt"] = now
+                result[key] = entry["value"]
+                self.hits += 1
+        return result
+
+    def set(self, key: str, value: Any) -> None:
+        self.setMany({key: value})
+
+    def setMany(self, values: dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            entries = self._load()
+            for key, value in values.items():
+                entry = entries.get(key)
+                # unchanged values are only refreshed in memory, so repeated checks do not rewrite the file
+                if (entry is None or entry.get("value") != value or not self._isFresh(entry, now)):
+                    self._dirty = True
+                entries[key] = {"storedAt": now, "usedAt": now, "value": value}
+
+    def save(self) -> None:
+        '''Merges entries saved by other processes, drops expired entries,
+        evicts least recently used ones and writes cache to disk.
+        Does nothing if no values changed since the last save'''
+        with self._lock:
+            if (not self._dirty):
+                return
+        now = time.time()
+        directory = os.path.dirname(self.path)
+        if (directory):
+            os.makedirs(directory, exist_ok=True)
+        with self._lock, self._fileLock():
+            entries = self._load()
+            # file may have changed since it was loaded
+            self._merge(entries, self._read())
+            freshEntries = [
+                (key, entry) for key, entry
+                in entries.items()
+                if self._isFresh(entry, now)
+            ]
+            if (len(freshEntries) > self.maxEntries):
+                freshEntries.sort(key=lambda pair: pair[1].get("usedAt", 0), reverse=True)
+                freshEntries = freshEntries[:self.maxEntries]
+            self._entries = dict(freshEntries)
+
+            # readers do not take the lock, so the file is replaced atomically
+            temporaryPath = f"{self.path}.{os.getpid()}.tmp"
+            with open(temporaryPath, "w") as file:
+                json.dump({"entries": self._entries}, file)
+            os.replace(temporaryPath, self.path)
+            self._dirty = False
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries = {}
+            self._clearedAt = time.time()
+            self._dirty = True
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._load())
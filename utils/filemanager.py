@@ -1,12 +1,30 @@
+from typing import BinaryIO, Union
 import os
 import shutil
 import io
-import zipfile
 import json
+import threading
 
 from classes import WorkshopCollection
 from classes import WorkshopItem
-from utils import AssertParameter
+from utils import AssertParameter, LazyModule
+
+# only needed once something is extracted
+zipfile = LazyModule("zipfile")
+futures = LazyModule("concurrent.futures")
+
+
+class Settings:
+    # threads extracting members of a single zipfile
+    extractThreads: int = min(4, os.cpu_count() or 1)
+    # zipfiles with less uncompressed bytes are extracted by one thread
+    parallelExtractMinSize: int = 16 * 1024 * 1024
+
+    def setExtractThreads(threads: int):
+        AssertParameter(threads, int, "threads")
+        if (threads < 1):
+            raise ValueError(f"Amount of extract threads must be greater than 0: {threads}")
+        Settings.extractThreads = threads
 
 
 def doesDirectoryExist(path: str) -> bool:
@@ -56,6 +74,66 @@ def listDirsInDirectory(directory: str) -> list[str]:
     ]
 
 
+def getStagingDirectory(directory: str) -> str:
+    '''Returns hidden folder next to directory, where its new version is prepared'''
+    AssertParameter(directory, str, "directory")
+    head, tail = os.path.split(os.path.normpath(directory))
+    return os.path.join(head, f".{tail}.staging")
+
+
+def getReplacedDirectory(directory: str) -> str:
+    '''Returns hidden folder next to directory, where its old version is kept while being replaced'''
+    AssertParameter(directory, str, "directory")
+    head, tail = os.path.split(os.path.normpath(directory))
+    return os.path.join(head, f".{tail}.old")
+
+
+def replaceDirectory(directory: str, newDirectory: str) -> None:
+    '''Replaces directory with newDirectory using renames,
+    so directory is missing only between two renames'''
+    AssertParameter(directory, str, "directory")
+    AssertParameter(newDirectory, str, "newDirectory")
+
+    if (not doesDirectoryExist(newDirectory)):
+        raise Exception(f"{newDirectory} does not exist!")
+
+    if (not doesDirectoryExist(directory)):
+        os.rename(newDirectory, directory)
+        return
+
+    replacedDirectory = getReplacedDirectory(directory)
+    if (doesDirectoryExist(replacedDirectory)):
+        shutil.rmtree(replacedDirectory)
+
+    os.rename(directory, replacedDirectory)
+    try:
+        os.rename(newDirectory, directory)
+    except OSError:
+        os.rename(replacedDirectory, directory)
+        raise
+    shutil.rmtree(replacedDirectory)
+
+
+def recoverReplacedDirectories(directory: str) -> None:
+    '''Finishes or rolls back replaceDirectory() calls interrupted inside directory.
+    Old versions are restored, unfinished new versions are removed'''
+    AssertParameter(directory, str, "directory")
+
+    for dir in listDirsInDirectory(directory):
+        if (not dir.startswith(".")):
+            continue
+
+        path = os.path.join(directory, dir)
+        if (dir.endswith(".staging")):
+            shutil.rmtree(path)
+        elif (dir.endswith(".old")):
+            liveDirectory = os.path.join(directory, dir[1:-len(".old")])
+            if (doesDirectoryExist(liveDirectory)):
+                shutil.rmtree(path)
+            else:
+                os.rename(path, liveDirectory)
+
+
 def listFilesInDirectory(directory: str) -> list[str]:
     '''Lists files in directory'''
     AssertParameter(directory, str, "directory")
@@ -66,16 +144,275 @@ def listFilesInDirectory(directory: str) -> list[str]:
     ]
 
 
+def deleteFile(path: str) -> None:
+    AssertParameter(path, str, "path")
+
+    if (not doesFileExist(path)):
+        raise Exception(f"{path} does not exist!")
+
+    os.remove(path)
+
+
+def getFileSize(path: str) -> int:
+    '''Returns size of a file in bytes, 0 if it does not exist'''
+    AssertParameter(path, str, "path")
+
+    if (not doesFileExist(path)):
+        return 0
+
+    return os.path.getsize(path)
+
+
+def saveJsonFile(path: str, data: dict, sync: bool = False) -> None:
+    '''Writes dict to a .json file, replacing it atomically.
+    With sync, the file is flushed to disk before it replaces the old one'''
+    AssertParameter(path, str, "path")
+    AssertParameter(data, dict, "data")
+
+    temporaryPath = f"{path}.tmp"
+    with open(temporaryPath, "w") as file:
+        file.write(json.dumps(data))
+        if (sync):
+            file.flush()
+            os.fsync(file.fileno())
+    os.replace(temporaryPath, path)
+
+
+def copyFile(source: str, destination: str) -> str:
+    '''Copies a file, replacing destination. Returns destination'''
+    AssertParameter(source, str, "source")
+    AssertParameter(destination, str, "destination")
+
+    shutil.copyfile(source, destination)
+    return destination
+
+
+def readJsonFile(path: str) -> dict:
+    AssertParameter(path, str, "path")
+
+    with open(path, "r") as file:
+        return json.load(file)
+
+
 def saveZipFile(directory: str, zipFileBytes: bytes):
     '''Extracts bytes of a zipfile to a folder'''
     AssertParameter(directory, str, "directory")
     AssertParameter(zipFileBytes, bytes, "zipFileBytes")
 
+    extractZipFile(directory, io.BytesIO(zipFileBytes))
+
+
+def extractZipFile(directory: str, zipFileSource: Union[str, BinaryIO]):
+    '''Extracts a zipfile (path or file object) to a folder.
+    Members are read one by one, so the archive is never loaded into memory.\n
+    Big zipfiles are extracted by several threads, the result is the same as extractall()'''
+    AssertParameter(directory, str, "directory")
+
     if (doesDirectoryExist(directory)):
         raise Exception(f"Directory already exists: {directory}")
 
-    zipFile = zipfile.ZipFile(io.BytesIO(zipFileBytes))
-    zipFile.extractall(directory)
+    with zipfile.ZipFile(zipFileSource) as zipFile:
+        uncompressedSize = sum(member.file_size for member in zipFile.infolist())
+        if (Settings.extractThreads == 1 or uncompressedSize < Settings.parallelExtractMinSize):
+            zipFile.extractall(directory)
+            return
+
+        extractZipFileMembers(directory, zipFile, zipFileSource)
+
+
+def getZipMemberPath(directory: str, member: "zipfile.ZipInfo") -> str:
+    '''Returns path member is extracted to, sanitized the same way as in ZipFile.extract()'''
+    arcname = member.filename.replace("/", os.path.sep)
+    if (os.path.altsep):
+        arcname = arcname.replace(os.path.altsep, os.path.sep)
+    # absolute paths, drive letters, "." and ".." are dropped
+    arcname = os.path.splitdrive(arcname)[1]
+    arcname = os.path.sep.join(
+        part for part
+        in arcname.split(os.path.sep)
+        if part not in ("", os.path.curdir, os.path.pardir)
+    )
+    if (os.path.sep == "\\"):
+        arcname = zipfile.ZipFile._sanitize_windows_name(arcname, os.path.sep)
+
+    return os.path.normpath(os.path.join(directory, arcname))
+
+
+def extractZipFileMembers(directory: str, zipFile: "zipfile.ZipFile", zipFileSource: Union[str, BinaryIO]):
+    '''Creates all folders first, then extracts files on a thread pool, biggest first'''
+    os.makedirs(directory)
+
+    directories, files = getZipFileMembers(directory, zipFile)
+    for path in directories:
+        os.makedirs(path, exist_ok=True)
+    for path in files:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # threads reading the same file object take turns,
+    # so with a path every thread opens its own handle
+    threadZipFiles = threading.local()
+
+    def openZipFile() -> "zipfile.ZipFile":
+        if (not isinstance(zipFileSource, str)):
+            return zipFile
+        if (not hasattr(threadZipFiles, "zipFile")):
+            threadZipFiles.zipFile = zipfile.ZipFile(zipFileSource)
+            openedZipFiles.append(threadZipFiles.zipFile)
+        return threadZipFiles.zipFile
+
+    def extractMember(pathAndMember: tuple[str, "zipfile.ZipInfo"]):
+        path, member = pathAndMember
+        with openZipFile().open(member) as source, open(path, "wb") as target:
+            shutil.copyfileobj(source, target)
+
+    openedZipFiles: list["zipfile.ZipFile"] = []
+    # biggest members first, so one huge member does not start last
+    jobs = sorted(files.items(), key=lambda pair: pair[1].compress_size, reverse=True)
+    try:
+        with futures.ThreadPoolExecutor(max_workers=Settings.extractThreads) as executor:
+            list(executor.map(extractMember, jobs))
+    finally:
+        for openedZipFile in openedZipFiles:
+            openedZipFile.close()
+
+
+def getZipFileMembers(directory: str, zipFile: "zipfile.ZipFile") -> tuple[list[str], dict[str, "zipfile.ZipInfo"]]:
+    '''Returns folders and files (path: member) a zipfile is extracted to.
+    With duplicate names the last member wins, as with extractall()'''
+    directories: list[str] = []
+    files: dict[str, "zipfile.ZipInfo"] = {}
+    for member in zipFile.infolist():
+        path = getZipMemberPath(directory, member)
+        if (member.is_dir()):
+            directories.append(path)
+        else:
+            files[path] = member
+    return directories, files
+
+
+def wrapInZipFile(source: Union[str, bytes], name: str) -> Union[str, bytes]:
+    '''Returns source (path or bytes) unchanged if it is a zipfile.
+    Otherwise it is stored as the only file of a new zipfile, named name,
+    which replaces the file at path, or is returned as bytes'''
+    AssertParameter(name, str, "name")
+
+    if (isinstance(source, bytes)):
+        if (zipfile.is_zipfile(io.BytesIO(source))):
+            return source
+        with io.BytesIO() as memoryFile:
+            with zipfile.ZipFile(memoryFile, "w", zipfile.ZIP_STORED) as zipFile:
+                zipFile.writestr(name, source)
+            return memoryFile.getvalue()
+
+    AssertParameter(source, str, "source")
+    if (zipfile.is_zipfile(source)):
+        return source
+    temporaryPath = f"{source}.tmp"
+    try:
+        with zipfile.ZipFile(temporaryPath, "w", zipfile.ZIP_STORED, allowZip64=True) as zipFile:
+            zipFile.write(source, name)
+        os.replace(temporaryPath, source)
+    finally:
+        if (doesFileExist(temporaryPath)):
+            os.remove(temporaryPath)
+    return source
+
+
+def getZipManifest(zipFileSource: Union[str, BinaryIO, bytes]) -> dict[str, list[int]]:
+    '''Returns size and CRC32 of every file in a zipfile, read from its central directory.
+    Keys are paths relative to the folder it is extracted to'''
+    if (isinstance(zipFileSource, bytes)):
+        zipFileSource = io.BytesIO(zipFileSource)
+
+    with zipfile.ZipFile(zipFileSource) as zipFile:
+        _, files = getZipFileMembers(os.sep, zipFile)
+        return {
+            os.path.relpath(path, os.sep).replace(os.sep, "/"): [member.file_size, member.CRC]
+            for path, member
+            in files.items()
+        }
+
+
+def applyZipDelta(directory: str, zipFileSource: Union[str, BinaryIO, bytes], manifest: dict[str, list[int]]) -> tuple[int, int]:
+    '''Updates folder extracted from a zipfile with manifest to a new version of that zipfile.
+    Only files with a different size or CRC32 are written, files missing from the new version are removed,
+    and so are folders of the manifest left empty by them.\n
+    Changed files are extracted to a staging folder first, so a broken zipfile fails before the folder
+    is touched. Then every file is moved in with a rename, so it is never seen half-written.\n
+    Returns amount of written and removed files'''
+    AssertParameter(directory, str, "directory")
+    AssertParameter(manifest, dict, "manifest")
+
+    if (not doesDirectoryExist(directory)):
+        raise Exception(f"{directory} does not exist!")
+
+    if (isinstance(zipFileSource, bytes)):
+        zipFileSource = io.BytesIO(zipFileSource)
+
+    directory = os.path.normpath(directory)
+    stagingDirectory = getStagingDirectory(directory)
+    if (doesDirectoryExist(stagingDirectory)):
+        deleteDirectory(stagingDirectory)
+    os.makedirs(stagingDirectory)
+
+    writtenFiles = 0
+    removedFiles = 0
+    try:
+        with zipfile.ZipFile(zipFileSource) as zipFile:
+            directories, files = getZipFileMembers(directory, zipFile)
+
+            # staged path and path in directory of every changed file
+            stagedFiles: list[tuple[str, str]] = []
+            newPaths: set[str] = set()
+            for path, member in files.items():
+                relativePath = os.path.relpath(path, directory).replace(os.sep, "/")
+                newPaths.add(relativePath)
+
+                # files changed on disk since the last update are rewritten too
+                isUnchanged = (
+                    manifest.get(relativePath) == [member.file_size, member.CRC] and
+                    doesFileExist(path) and
+                    getFileSize(path) == member.file_size
+                )
+                if (isUnchanged):
+                    continue
+
+                # reading a member to its end checks its CRC32
+                stagedPath = os.path.join(stagingDirectory, str(len(stagedFiles)))
+                with zipFile.open(member) as source, open(stagedPath, "wb") as target:
+                    shutil.copyfileobj(source, target)
+                stagedFiles.append((stagedPath, path))
+
+        for path in directories:
+            os.makedirs(path, exist_ok=True)
+        for stagedPath, path in stagedFiles:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(stagedPath, path)
+            writtenFiles += 1
+    finally:
+        deleteDirectory(stagingDirectory)
+
+    oldDirectories: set[str] = set()
+    for relativePath in manifest:
+        if (relativePath in newPaths):
+            continue
+        path = os.path.normpath(os.path.join(directory, relativePath))
+        if (doesFileExist(path)):
+            os.remove(path)
+            removedFiles += 1
+        parent = os.path.dirname(path)
+        while (len(parent) > len(directory) and parent not in oldDirectories):
+            oldDirectories.add(parent)
+            parent = os.path.dirname(parent)
+
+    # folders of removed files left empty, deepest first, so their parents can be empty too.
+    # Folders of the new version, and folders made by the user, stay
+    newDirectories: set[str] = set(os.path.normpath(path) for path in directories)
+    for path in sorted(oldDirectories, key=len, reverse=True):
+        if (path not in newDirectories and doesDirectoryExist(path) and len(os.listdir(path)) == 0):
+            os.rmdir(path)
+
+    return writtenFiles, removedFiles
 
 
 def saveCollectionAsJson(path: str, collection: WorkshopCollection, items: list[WorkshopItem], overrideFile: bool = False):
@@ -92,10 +429,10 @@ def saveCollectionAsJson(path: str, collection: WorkshopCollection, items: list[
     if (doesFileExist(path) and not overrideFile):
         raise FileExistsError(f"{path} already exists!")
 
-    with open(f"{path}", "w") as file:
-        data = collection.json()
-        data["items"] = [
-            item.json() for item
-            in items
-        ]
-        file.write(json.dumps(data))
+    data = collection.json()
+    data["items"] = [
+        item.json() for item
+        in items
+    ]
+    # a crash while writing must not destroy the previous version
+    saveJsonFile(path, data, True)
@@ -0,0 +1,154 @@
+from typing import BinaryIO, Union
+import threading
+import shutil
+import errno
+import os
+
+from classes import WorkshopItem
+from utils import AssertParameter, filemanager
+
+
+# ioctl request cloning a whole file on linux (btrfs, xfs, bcachefs...)
+FICLONE = 0x40049409
+
+# errors meaning a link mode can not work for any file of the store:
+# different filesystems, links not permitted, not supported by the filesystem.
+# None is a platform without reflinks
+unsupportedLinkErrors: dict[str, set] = {
+    "hardlink": {errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP},
+    "reflink": {errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EINVAL, errno.ENOTTY, None}
+}
+
+
+def reflinkFile(source: str, destination: str) -> None:
+    '''Creates a copy-on-write clone of source. Raises OSError if filesystem does not support it'''
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError(f"reflinks are not supported on this platform: {destination}")
+
+    with open(source, "rb") as sourceFile, open(destination, "wb") as destinationFile:
+        try:
+            fcntl.ioctl(destinationFile.fileno(), FICLONE, sourceFile.fileno())
+        except OSError:
+            destinationFile.close()
+            os.remove(destination)
+            raise
+    shutil.copystat(source, destination)
+
+
+class ItemStore:
+    '''Extracted items shared by all collections, keyed by item id and lastUpdated.\n
+    Items are extracted to the store once, then linked into collection folders.
+    Hardlinked files are the same file in every collection, so changing one changes all of them.'''
+    # tried in this order, starting from linkMode
+    linkModes: list[str] = ["hardlink", "reflink", "copy"]
+
+    def __init__(self, root: str, linkMode: str = "hardlink") -> None:
+        AssertParameter(root, str, "root")
+        AssertParameter(linkMode, str, "linkMode")
+        if (linkMode not in ItemStore.linkModes):
+            raise ValueError(f"linkMode must be one of {ItemStore.linkModes}: {linkMode}")
+
+        self.root = root
+        self.linkMode = linkMode
+        self.linkedFiles = 0
+        self.copiedFiles = 0
+        # link modes the store can not use, so they are not tried for every file
+        self._unsupportedModes: set[str] = set()
+        self._lock = threading.Lock()
+
+    def pathFor(self, item: WorkshopItem) -> str:
+        return f"{self.root}/{item.id}/{item.lastUpdated}"
+
+    def contains(self, item: WorkshopItem) -> bool:
+        # items are renamed into place when fully extracted,
+        # so an existing folder is always complete
+        return filemanager.doesDirectoryExist(self.pathFor(item))
+
+    def add(self, item: WorkshopItem, zipFileSource: Union[str, BinaryIO, bytes]) -> None:
+        '''Extracts zipfile (path, file object or bytes) to the store.
+        Other versions of the item are removed, collections linking them keep their files'''
+        AssertParameter(item, WorkshopItem, "item")
+
+        path = self.pathFor(item)
+        temporaryPath = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if (filemanager.doesDirectoryExist(temporaryPath)):
+            filemanager.deleteDirectory(temporaryPath)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            if (isinstance(zipFileSource, bytes)):
+                filemanager.saveZipFile(temporaryPath, zipFileSource)
+            else:
+                filemanager.extractZipFile(temporaryPath, zipFileSource)
+            os.rename(temporaryPath, path)
+        except OSError:
+            # another process stored the same version first
+            if (not self.contains(item)):
+                raise
+        finally:
+            if (filemanager.doesDirectoryExist(temporaryPath)):
+                filemanager.deleteDirectory(temporaryPath)
+
+        self.removeOtherVersions(item)
+
+    def removeOtherVersions(self, item: WorkshopItem) -> None:
+        itemDirectory = os.path.dirname(self.pathFor(item))
+        for version in filemanager.listDirsInDirectory(itemDirectory):
+            if (version != str(item.lastUpdated) and not version.endswith(".tmp")):
+                shutil.rmtree(f"{itemDirectory}/{version}", ignore_errors=True)
+
+    def materialize(self, item: WorkshopItem, directory: str) -> None:
+        '''Recreates stored item in directory, linking files instead of copying them when possible'''
+        AssertParameter(item, WorkshopItem, "item")
+        AssertParameter(directory, str, "directory")
+
+        if (filemanager.doesDirectoryExist(directory)):
+            raise Exception(f"Directory already exists: {directory}")
+
+        source = self.pathFor(item)
+        if (not filemanager.doesDirectoryExist(source)):
+            raise FileNotFoundError(f"{item} is not in the store: {source}")
+
+        for root, dirs, files in os.walk(source):
+            relativeRoot = os.path.relpath(root, source)
+            targetRoot = os.path.normpath(os.path.join(directory, relativeRoot))
+            os.makedirs(targetRoot, exist_ok=True)
+            for file in files:
+                self.linkFile(os.path.join(root, file), os.path.join(targetRoot, file))
+
+    def linkFile(self, source: str, destination: str) -> None:
+        '''Links file using linkMode, falling back to the next mode (hardlink, reflink, copy)'''
+        for mode in self.linkModes[self.linkModes.index(self.linkMode):]:
+            if (mode in self._unsupportedModes):
+                continue
+
+            if (mode == "copy"):
+                shutil.copy2(source, destination)
+                with self._lock:
+                    self.copiedFiles += 1
+                return
+
+            try:
+                if (mode == "hardlink"):
+                    os.link(source, destination)
+                else:
+                    reflinkFile(source, destination)
+            except OSError as exception:
+                # other errors (link limit of a file reached, file exists...)
+                # only make this file fall back to the next mode
+                if (exception.errno in unsupportedLinkErrors[mode]):
+                    with self._lock:
+                        self._unsupportedModes.add(mode)
+                continue
+
+            with self._lock:
+                self.linkedFiles += 1
+            return
+
+    def __str__(self) -> str:
+        return f"{{ItemStore - root: {self.root} | linkMode: {self.linkMode}}}"
+
+    def __repr__(self) -> str:
+        return self.__str__()
@@ -0,0 +1,127 @@
+from typing import Optional, TextIO
+import threading
+import json
+import time
+import os
+
+from utils import AssertParameter
+
+
+class Journal:
+    '''Append-only file of json records, one per line.\n
+    Records written before a crash are read back with replay().
+    A line cut off by the crash is ignored.'''
+    # always: fsync after every record
+    # interval: fsync at most every fsyncInterval seconds
+    # never: leave it to the operating system
+    fsyncPolicies: list[str] = ["always", "interval", "never"]
+
+    def __init__(self, path: str, fsyncPolicy: str = "interval", fsyncInterval: float = 1) -> None:
+        AssertParameter(path, str, "path")
+        AssertParameter(fsyncPolicy, str, "fsyncPolicy")
+        AssertParameter(fsyncInterval, (int, float), "fsyncInterval")
+        if (fsyncPolicy not in Journal.fsyncPolicies):
+            raise ValueError(f"fsyncPolicy must be one of {Journal.fsyncPolicies}: {fsyncPolicy}")
+
+        self.path = path
+        self.fsyncPolicy = fsyncPolicy
+        self.fsyncInterval = fsyncInterval
+
+        self._file: Optional[TextIO] = None
+        self._lastSync: float = 0
+        self._lock = threading.Lock()
+
+    @property
+    def exists(self) -> bool:
+        return os.path.isfile(self.path)
+
+    def replay(self) -> list[dict]:
+        '''Returns all complete records in the order they were appended'''
+        if (not self.exists):
+            return []
+
+        records: list[dict] = []
+        with open(self.path, "r", encoding="utf-8") as file:
+            for line in file:
+                # last line has no newline if the process died while writing it
+                if (not line.endswith("\n")):
+                    break
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+        return records
+
+    def open(self) -> None:
+        with self._lock:
+            if (self._file is not None):
+                return
+
+            isNew = not self.exists
+            if (not isNew):
+                self._truncateCutOffLine()
+            self._file = open(self.path, "a", encoding="utf-8")
+            if (isNew):
+                self._syncDirectory()
+            self._lastSync = time.monotonic()
+
+    def append(self, record: dict) -> None:
+        AssertParameter(record, dict, "record")
+
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            if (self._file is None):
+                raise Exception(f"Journal is not open: {self.path}")
+
+            self._file.write(line)
+            self._file.flush()
+
+            now = time.monotonic()
+            if (self.fsyncPolicy == "always" or
+                    (self.fsyncPolicy == "interval" and now - self._lastSync >= self.fsyncInterval)):
+                os.fsync(self._file.fileno())
+                self._lastSync = now
+
+    def close(self) -> None:
+        with self._lock:
+            if (self._file is None):
+                return
+            self._file.flush()
+            if (self.fsyncPolicy != "never"):
+                os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+    def delete(self) -> None:
+        '''Closes and removes journal, once its records are saved somewhere else'''
+        self.close()
+        if (self.exists):
+            os.remove(self.path)
+
+    def _truncateCutOffLine(self) -> None:
+        '''Removes a line cut off by a crash, so the next record starts on its own line'''
+        with open(self.path, "rb+") as file:
+            content = file.read()
+            if (len(content) == 0 or content.endswith(b"\n")):
+                return
+            file.truncate(content.rfind(b"\n") + 1)
+
+    def _syncDirectory(self) -> None:
+        # new file is not durable until the directory entry pointing to it is
+        try:
+            directory = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        except OSError:
+            # directories can not be opened on windows
+            return
+        try:
+            os.fsync(directory)
+        except OSError:
+            pass
+        finally:
+            os.close(directory)
+
+    def __str__(self) -> str:
+        return f"{{Journal - path: {self.path} | fsyncPolicy: {self.fsyncPolicy}}}"
+
+    def __repr__(self) -> str:
+        return self.__str__()
@@ -1,65 +1,188 @@
-from typing import Iterable
-from termcolor import colored
+from typing import Optional
+import contextlib
 import os
 import sys
-import itertools
 import time
 import threading
 
-from utils import AssertParameter
-
-os.system("")
+from utils import AssertParameter, LazyModule
+
+termcolor = LazyModule("termcolor")
+
+
+def enableAnsiEscapes() -> None:
+    '''Turns on colors and cursor movement in windows console, without starting a shell'''
+    if (os.name != "nt"):
+        return
+    try:
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        # STD_OUTPUT_HANDLE, ENABLE_VIRTUAL_TERMINAL_PROCESSING
+        handle = kernel32.GetStdHandle(-11)
+        mode = ctypes.c_uint32()
+        if (kernel32.GetConsoleMode(handle, ctypes.byref(mode))):
+            kernel32.SetConsoleMode(handle, mode.value | 0x0004)
+    except (ImportError, AttributeError, OSError):
+        pass
+
+
+enableAnsiEscapes()
+
+
+class ProgressTask:
+    '''Progress of a single operation, drawn by ProgressRenderer.
+    total of None shows a spinner instead of a progress bar'''
+
+    def __init__(self, label: str, total: Optional[int] = None, completed: int = 0) -> None:
+        self.label = label
+        self.total = total
+        self.completed = completed
+        self.startedAt = time.monotonic()
+        # last quarter (or time) reported in sparse output
+        self.reportedQuarter = -1
+        self.reportedAt = self.startedAt
+
+    @property
+    def percentage(self) -> float:
+        if (not self.total):
+            return 0
+        return min(self.completed / self.total * 100, 100)
+
+    def advance(self, amount: int) -> None:
+        # every task is advanced by a single thread, so no lock is needed
+        self.completed += amount
+
+    def render(self, frame: int) -> str:
+        if (self.total is None):
+            spinner = ['-', '/', '|', '\\'][frame % 4]
+            return f"{self.label}{spinner}"
+
+        return (
+            f"{self.label}{ProgressBar(30, self.percentage)} "
+            f"{self.percentage:3.0f}% "
+            f"{self.completed / 1024 / 1024:.1f}/{self.total / 1024 / 1024:.1f} MB"
+        )
+
+
+class ProgressRenderer:
+    '''Draws progress of all running tasks from one thread, at most fps times per second.\n
+    On a terminal, tasks are redrawn in place below printed messages.
+    Otherwise a line is printed for every quarter of a task, or every sparseInterval seconds.'''
+    fps: float = 10
+    sparseInterval: float = 10
+
+    def __init__(self, interactive: Optional[bool] = None) -> None:
+        self.interactive = sys.stdout.isatty() if interactive is None else interactive
+        self.tasks: list[ProgressTask] = []
+        self._drawnLines = 0
+        self._frame = 0
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.RLock()
+
+    @property
+    def active(self) -> bool:
+        return len(self.tasks) > 0
+
+    def add(self, label: str, total: Optional[int] = None, completed: int = 0) -> ProgressTask:
+        task = ProgressTask(label, total, completed)
+        with self._lock:
+            self.tasks.append(task)
+            if (self._thread is None):
+                self._thread = threading.Thread(
+                    target=self._renderTask, name="progress-renderer", daemon=True
+                )
+                self._thread.start()
+        return task
+
+    def remove(self, task: ProgressTask) -> None:
+        with self._lock:
+            if (task in self.tasks):
+                self.tasks.remove(task)
+            self._draw()
+
+    @contextlib.contextmanager
+    def task(self, label: str, total: Optional[int] = None, completed: int = 0):
+        '''Shows progress while the block runs'''
+        task = self.add(label, total, completed)
+        try:
+            yield task
+        finally:
+            self.remove(task)
+
+    def write(self, text: str) -> None:
+        '''Prints text above progress of running tasks'''
+        with self._lock:
+            self._erase()
+            sys.stdout.write(text)
+            self._draw()
+
+    def _renderTask(self) -> None:
+        while (True):
+            time.sleep(1 / self.fps)
+            with self._lock:
+                if (not self.active):
+                    self._thread = None
+                    return
+                self._frame += 1
+                self._draw()
+
+    def _erase(self) -> None:
+        if (self._drawnLines > 0):
+            # move to the first drawn line and clear everything below
+            sys.stdout.write(f"\x1B[{self._drawnLines}F\x1B[0J")
+            self._drawnLines = 0
+
+    def _draw(self) -> None:
+        if (not self.interactive):
+            self._drawSparse()
+            return
+
+        self._erase()
+        for task in self.tasks:
+            sys.stdout.write(f"{task.render(self._frame)}\n")
+        self._drawnLines = len(self.tasks)
+        sys.stdout.flush()
+
+    def _drawSparse(self) -> None:
+        now = time.monotonic()
+        for task in self.tasks:
+            quarter = int(task.percentage // 25) if task.total else -1
+            if (quarter > task.reportedQuarter or now - task.reportedAt >= self.sparseInterval):
+                task.reportedQuarter = max(quarter, task.reportedQuarter)
+                task.reportedAt = now
+                if (task.total):
+                    sys.stdout.write(f"{task.label.rstrip()} {task.percentage:.0f}%\n")
+                elif (now > task.startedAt):
+                    sys.stdout.write(f"{task.label.rstrip()} ({now - task.startedAt:.0f}s)\n")
+        sys.stdout.flush()
+
+
+_renderer: Optional[ProgressRenderer] = None
+_rendererLock: threading.Lock = threading.Lock()
+
+
+def Progress() -> ProgressRenderer:
+    '''Returns renderer shared by all progress bars and spinners'''
+    global _renderer
+
+    with _rendererLock:
+        if (_renderer is None):
+            _renderer = ProgressRenderer()
+        return _renderer
 
 
 class Spinner:
-    spinner: Iterable = []
-    delay: float = 0
-    busy: bool = False
-    spinner_visible: bool = False
+    '''Shows message with a spinner while the block runs'''
 
     def __init__(self, message: str, delay: float = 0.1):
-        self.spinner = itertools.cycle(['-', '/', '|', '\\'])
-        self.delay = delay
-        self.busy = False
-        self.spinner_visible = False
-        sys.stdout.write(message)
-
-    def write_next(self):
-        with self._screen_lock:
-            if not self.spinner_visible:
-                sys.stdout.write(next(self.spinner))
-                self.spinner_visible = True
-                sys.stdout.flush()
-
-    def remove_spinner(self, cleanup=False):
-        with self._screen_lock:
-            if self.spinner_visible:
-                sys.stdout.write('\b')
-                self.spinner_visible = False
-                if cleanup:
-                    sys.stdout.write(' ')       # overwrite spinner with blank
-                    sys.stdout.write('\r')      # move to next line
-                sys.stdout.flush()
-
-    def spinner_task(self):
-        while self.busy:
-            self.write_next()
-            time.sleep(self.delay)
-            self.remove_spinner()
+        self.message = message
+        self.task: Optional[ProgressTask] = None
 
     def __enter__(self):
-        if sys.stdout.isatty():
-            self._screen_lock = threading.Lock()
-            self.busy = True
-            self.thread = threading.Thread(target=self.spinner_task)
-            self.thread.start()
+        self.task = Progress().add(self.message)
 
     def __exit__(self, exception, value, tb):
-        if sys.stdout.isatty():
-            self.busy = False
-            self.remove_spinner(cleanup=True)
-        else:
-            sys.stdout.write('\r')
+        Progress().remove(self.task)
 
 
 def ProgressBar(length: int, percentage: float) -> str:
@@ -121,6 +244,9 @@ def Up() -> str:
 
 
 def Clear() -> str:
+    # escape codes would end up in log files
+    if (not sys.stdout.isatty()):
+        return ""
     return '\x1B[0K'
 
 
@@ -135,21 +261,29 @@ def Indent(level: int) -> str:
     return "   " * level
 
 
+def write(text: str) -> None:
+    '''Prints text, keeping progress of running tasks below it'''
+    if (_renderer is not None and _renderer.active):
+        _renderer.write(text)
+    else:
+        sys.stdout.write(text)
+
+
 def LogSuccess(message: str) -> None:
     '''Prints green-colored success message'''
-    print(colored(message, "green"))
+    write(f"{termcolor.colored(str(message), 'green')}\n")
 
 
 def LogMessage(message: str, end: str = "\n") -> None:
     '''Prints message'''
-    print(message, end=end)
+    write(f"{message}{end}")
 
 
 def LogWarning(warning: str, end: str = "\n") -> None:
     '''Prints yellow-colored warning message'''
-    print(colored(warning, "yellow"), end=end)
+    write(f"{termcolor.colored(str(warning), 'yellow')}{end}")
 
 
 def LogError(error: str, end: str = "\n") -> None:
     '''Prints red-colored error message'''
-    print(colored(error, "red"), end=end)
+    write(f"{termcolor.colored(str(error), 'red')}{end}")
@@ -0,0 +1,233 @@
+from typing import Optional
+import contextlib
+import threading
+import json
+import math
+import time
+import os
+
+from utils import AssertParameter
+
+
+class StageSample:
+    '''Single measured run of a stage'''
+
+    def __init__(self, stage: str, itemId: Optional[int] = None) -> None:
+        self.stage = stage
+        self.itemId = itemId
+        self.seconds: float = 0
+        self.bytes: int = 0
+        self.succeeded = True
+
+
+def percentile(values: list[float], percent: float) -> float:
+    '''Returns nearest-rank percentile of values, 0 if there are none'''
+    if (len(values) == 0):
+        return 0
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+class MetricsRegistry:
+    '''Timings, byte counts and retry counters of a run, per stage and per item'''
+
+    def __init__(self) -> None:
+        self.startedAt = time.time()
+        self._startedAtMonotonic = time.monotonic()
+        self.samples: dict[str, list[StageSample]] = {}
+        self.counters: dict[str, int] = {}
+        # item id: counter name: value
+        self.itemCounters: dict[int, dict[str, int]] = {}
+        # settings the run was measured with, for example scheduling policy
+        self.info: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def record(self, sample: StageSample) -> None:
+        with self._lock:
+            self.samples.setdefault(sample.stage, []).append(sample)
+
+    @contextlib.contextmanager
+    def timer(self, stage: str, itemId: Optional[int] = None):
+        '''Measures the block as one sample of stage. Set sample.bytes inside the block'''
+        sample = StageSample(stage, itemId)
+        start = time.monotonic()
+        try:
+            yield sample
+        except BaseException:
+            sample.succeeded = False
+            raise
+        finally:
+            sample.seconds = time.monotonic() - start
+            self.record(sample)
+
+    def count(self, name: str, amount: int = 1, itemId: Optional[int] = None) -> None:
+        '''Adds amount to a counter, for example retries. With itemId it is also counted for the item'''
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+            if (itemId is not None):
+                itemCounters = self.itemCounters.setdefault(itemId, {})
+                itemCounters[name] = itemCounters.get(name, 0) + amount
+
+    def setInfo(self, name: str, value: str) -> None:
+        '''Records a setting of the run, for example scheduling policy, so runs can be compared by it'''
+        AssertParameter(name, str, "name")
+        AssertParameter(value, str, "value")
+        with self._lock:
+            self.info[name] = value
+
+    def stageSummary(self, stage: str) -> dict:
+        with self._lock:
+            samples = list(self.samples.get(stage, []))
+
+        seconds = [sample.seconds for sample in samples]
+        totalBytes = sum(sample.bytes for sample in samples)
+        totalSeconds = sum(seconds)
+        return {
+            "count": len(samples),
+            "failed": len([sample for sample in samples if not sample.succeeded]),
+            "seconds": totalSeconds,
+            "p50": percentile(seconds, 50),
+            "p95": percentile(seconds, 95),
+            "max": max(seconds) if len(seconds) > 0 else 0,
+            "bytes": totalBytes,
+            # speed of a single worker, not of the whole stage
+            "mbPerSecond": totalBytes / 1024 / 1024 / totalSeconds if totalSeconds > 0 else 0
+        }
+
+    def report(self, items: int = 0, bytes: int = 0) -> dict:
+        '''Returns aggregates of the run. items and bytes are what the run produced'''
+        AssertParameter(items, int, "items")
+        AssertParameter(bytes, int, "bytes")
+
+        wallSeconds = time.monotonic() - self._startedAtMonotonic
+        with self._lock:
+            stages = list(self.samples)
+            counters = dict(self.counters)
+            info = dict(self.info)
+            perItem: dict[int, dict] = {
+                itemId: {"counters": dict(itemCounters)} for itemId, itemCounters
+                in self.itemCounters.items()
+            }
+            for samples in self.samples.values():
+                for sample in samples:
+                    if (sample.itemId is None):
+                        continue
+                    itemStages = perItem.setdefault(sample.itemId, {}).setdefault("stages", {})
+                    # retries, backend fallbacks and resumed downloads run a stage more than once,
+                    # all attempts are summed, so items add up to stage totals
+                    itemStage = itemStages.setdefault(
+                        sample.stage, {"seconds": 0, "bytes": 0, "attempts": 0, "succeeded": False}
+                    )
+                    itemStage["seconds"] += sample.seconds
+                    itemStage["bytes"] += sample.bytes
+                    itemStage["attempts"] += 1
+                    # samples are recorded in the order attempts finished, the last one decides
+                    itemStage["succeeded"] = sample.succeeded
+            for itemValue in perItem.values():
+                for itemStage in itemValue.get("stages", {}).values():
+                    itemStage["seconds"] = round(itemStage["seconds"], 4)
+
+        return {
+            "startedAt": self.startedAt,
+            "info": info,
+            "wallSeconds": wallSeconds,
+            "items": items,
+            "bytes": bytes,
+            "itemsPerMinute": items / wallSeconds * 60 if wallSeconds > 0 else 0,
+            "mbPerSecond": bytes / 1024 / 1024 / wallSeconds if wallSeconds > 0 else 0,
+            "stages": {stage: self.stageSummary(stage) for stage in stages},
+            "counters": counters,
+            "perItem": {str(itemId): value for itemId, value in perItem.items()}
+        }
+
+    def writeJson(self, path: str, report: dict) -> None:
+        writeFileAtomically(path, json.dumps(report, indent=2))
+
+    def writePrometheus(self, path: str, report: dict) -> None:
+        '''Writes report in the format of node_exporter textfile collector'''
+        lines = [
+            "# HELP wcd_run_seconds Wall time of the last run.",
+            "# TYPE wcd_run_seconds gauge",
+            f"wcd_run_seconds {report['wallSeconds']:.3f}",
+            "# HELP wcd_run_items Items downloaded by the last run.",
+            "# TYPE wcd_run_items gauge",
+            f"wcd_run_items {report['items']}",
+            "# HELP wcd_run_bytes Bytes downloaded by the last run.",
+            "# TYPE wcd_run_bytes gauge",
+            f"wcd_run_bytes {report['bytes']}",
+            "# HELP wcd_run_timestamp_seconds When the last run started.",
+            "# TYPE wcd_run_timestamp_seconds gauge",
+            f"wcd_run_timestamp_seconds {report['startedAt']:.0f}",
+            "# HELP wcd_run_info Settings the last run was measured with.",
+            "# TYPE wcd_run_info gauge",
+            "wcd_run_info{" + ",".join(f'{name}="{value}"' for name, value in report["info"].items()) + "} 1",
+            "# HELP wcd_stage_seconds Latency of a single run of a stage.",
+            "# TYPE wcd_stage_seconds summary"
+        ]
+        for stage, summary in report["stages"].items():
+            lines += [
+                f'wcd_stage_seconds{{stage="{stage}",quantile="0.5"}} {summary["p50"]:.4f}',
+                f'wcd_stage_seconds{{stage="{stage}",quantile="0.95"}} {summary["p95"]:.4f}',
+                f'wcd_stage_seconds_sum{{stage="{stage}"}} {summary["seconds"]:.4f}',
+                f'wcd_stage_seconds_count{{stage="{stage}"}} {summary["count"]}'
+            ]
+        lines += [
+            "# HELP wcd_stage_failures Failed runs of a stage.",
+            "# TYPE wcd_stage_failures gauge"
+        ]
+        for stage, summary in report["stages"].items():
+            lines.append(f'wcd_stage_failures{{stage="{stage}"}} {summary["failed"]}')
+        lines += [
+            "# HELP wcd_stage_bytes Bytes processed by a stage.",
+            "# TYPE wcd_stage_bytes gauge"
+        ]
+        for stage, summary in report["stages"].items():
+            lines.append(f'wcd_stage_bytes{{stage="{stage}"}} {summary["bytes"]}')
+        lines += [
+            "# HELP wcd_events Retries, failovers and other events of the last run.",
+            "# TYPE wcd_events gauge"
+        ]
+        for name, value in report["counters"].items():
+            lines.append(f'wcd_events{{event="{name}"}} {value}')
+
+        writeFileAtomically(path, "\n".join(lines) + "\n")
+
+    def __str__(self) -> str:
+        return f"{{MetricsRegistry - stages: {list(self.samples)} | counters: {self.counters}}}"
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+def writeFileAtomically(path: str, content: str) -> None:
+    # textfile collectors may read the file at any moment
+    directory = os.path.dirname(path)
+    if (directory):
+        os.makedirs(directory, exist_ok=True)
+    temporaryPath = f"{path}.{os.getpid()}.tmp"
+    with open(temporaryPath, "w") as file:
+        file.write(content)
+    os.replace(temporaryPath, path)
+
+
+_metrics: Optional[MetricsRegistry] = None
+_metricsLock: threading.Lock = threading.Lock()
+
+
+def Metrics() -> MetricsRegistry:
+    '''Returns metrics of the current run, shared by all modules'''
+    global _metrics
+
+    with _metricsLock:
+        if (_metrics is None):
+            _metrics = MetricsRegistry()
+        return _metrics
+
+
+def ResetMetrics() -> None:
+    '''Starts a new run'''
+    global _metrics
+
+    with _metricsLock:
+        _metrics = None
@@ -0,0 +1,179 @@
+from typing import Any, Callable, Optional
+import queue
+import threading
+
+from utils import AssertParameter, LazyModule
+
+futures = LazyModule("concurrent.futures")
+
+
+class PipelineStoppedException(Exception):
+    pass
+
+
+class PipelineStage:
+    '''Single step of a pipeline, executed by its own pool of workers'''
+    name: str = ""
+    function: Callable[[Any, Any], Any] = None
+    workers: int = 1
+
+    def __init__(self, name: str, function: Callable[[Any, Any], Any], workers: int = 1) -> None:
+        AssertParameter(name, str, "name")
+        AssertParameter(workers, int, "workers")
+        if (not callable(function)):
+            raise TypeError(f"function of stage {name} must be callable")
+        if (workers < 1):
+            raise ValueError(f"Stage {name} must have at least 1 worker: {workers}")
+
+        self.name = name
+        self.function = function
+        self.workers = workers
+
+
+class PipelineResult:
+    '''Outcome of a single job: value of the last stage, or exception and the stage that raised it'''
+
+    def __init__(self, index: int, job: Any, value: Any = None, exception: Optional[BaseException] = None, stage: str = "") -> None:
+        self.index = index
+        self.job = job
+        self.value = value
+        self.exception = exception
+        self.stage = stage
+
+    @property
+    def succeeded(self) -> bool:
+        return self.exception is None
+
+    def __str__(self) -> str:
+        return f"{{PipelineResult - index: {self.index} | stage: {self.stage} | exception: {self.exception}}}"
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+class Pipeline:
+    '''Runs jobs through stages. Each stage has its own worker pool,
+    so different jobs can be in different stages at the same time.\n
+    Stage functions are called as function(job, value),
+    where value is the return value of the previous stage (None for the first one).'''
+    stages: list[PipelineStage] = []
+    maxInFlight: int = 0
+
+    def __init__(self, stages: list[PipelineStage], maxInFlight: int = 0, stopEvent: Optional[threading.Event] = None) -> None:
+        AssertParameter(stages, list, "stages")
+        AssertParameter(maxInFlight, int, "maxInFlight")
+        if (len(stages) == 0):
+            raise ValueError("Pipeline must have at least one stage")
+        for stage in stages:
+            AssertParameter(stage, PipelineStage, f"stages.{stage}")
+
+        self.stages = stages
+        # Limits amount of jobs admitted at once, so finished
+        # work does not pile up in front of a slow stage.
+        # Defaults to twice the amount of all workers.
+        self.maxInFlight = maxInFlight if maxInFlight > 0 else 2 * sum(
+            stage.workers for stage in stages
+        )
+        self._stopEvent = stopEvent if stopEvent is not None else threading.Event()
+
+    @property
+    def stopped(self) -> bool:
+        return self._stopEvent.is_set()
+
+    def stop(self) -> None:
+        '''Stops admitting new jobs and moving jobs to next stages'''
+        self._stopEvent.set()
+
+    def run(self, jobs: list, onResult: Optional[Callable[[PipelineResult], None]] = None, order: Optional[list[int]] = None) -> list[PipelineResult]:
+        '''Runs all jobs through all stages.
+        Returns results in the same order as jobs.\n
+        order lists indexes of jobs in the order they are admitted, by default the order of jobs.\n
+        onResult is called from the calling thread as soon as a job finishes or fails.
+        Exceptions raised by onResult stop the pipeline and are propagated.'''
+        AssertParameter(jobs, list, "jobs")
+        if (order is None):
+            order = list(range(len(jobs)))
+        elif (sorted(order) != list(range(len(jobs)))):
+            raise ValueError("order must contain index of every job exactly once")
+
+        results: list[PipelineResult] = [None] * len(jobs)
+        finishedResults: queue.Queue = queue.Queue()
+        executors = [
+            futures.ThreadPoolExecutor(
+                max_workers=stage.workers,
+                thread_name_prefix=f"pipeline-{stage.name}"
+            ) for stage
+            in self.stages
+        ]
+
+        def submit(stageIndex: int, index: int, value: Any) -> None:
+            try:
+                executors[stageIndex].submit(runStage, stageIndex, index, value)
+            except RuntimeError:
+                # executor was shut down, pipeline is being stopped
+                finishedResults.put(PipelineResult(
+                    index, jobs[index], None,
+                    PipelineStoppedException(), self.stages[stageIndex].name
+                ))
+
+        def runStage(stageIndex: int, index: int, value: Any) -> None:
+            stage = self.stages[stageIndex]
+            if (self.stopped):
+                finishedResults.put(PipelineResult(
+                    index, jobs[index], None, PipelineStoppedException(), stage.name
+                ))
+                return
+
+            try:
+                value = stage.function(jobs[index], value)
+            except Exception as exception:
+                finishedResults.put(PipelineResult(
+                    index, jobs[index], None, exception, stage.name
+                ))
+                return
+
+            if (stageIndex + 1 < len(self.stages)):
+                submit(stageIndex + 1, index, value)
+            else:
+                finishedResults.put(PipelineResult(
+                    index, jobs[index], value, None, stage.name
+                ))
+
+        nextJob = 0
+        inFlight = 0
+        interrupted = True
+        try:
+            while (nextJob < len(jobs) or inFlight > 0):
+                while (nextJob < len(jobs) and inFlight < self.maxInFlight and not self.stopped):
+                    submit(0, order[nextJob], None)
+                    nextJob += 1
+                    inFlight += 1
+
+                if (self.stopped and inFlight == 0):
+                    break
+
+                # timeout keeps the calling thread responsive to KeyboardInterrupt
+                try:
+                    result: PipelineResult = finishedResults.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+
+                inFlight -= 1
+                results[result.index] = result
+                if (onResult is not None):
+                    onResult(result)
+            interrupted = False
+        finally:
+            if (interrupted):
+                self.stop()
+            for executor in executors:
+                executor.shutdown(wait=not interrupted, cancel_futures=interrupted)
+
+        # jobs which were never admitted because pipeline was stopped
+        for index, result in enumerate(results):
+            if (result is None):
+                results[index] = PipelineResult(
+                    index, jobs[index], None, PipelineStoppedException(), self.stages[0].name
+                )
+
+        return results
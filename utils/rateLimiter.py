@@ -0,0 +1,144 @@
+from typing import Optional
+import datetime
+import threading
+import time
+import re
+
+from utils import AssertParameter
+
+
+def parseRate(rate: str) -> float:
+    '''Returns bytes per second from strings like 500K, 2M, 1.5MB/s or 0 (unlimited)'''
+    AssertParameter(rate, str, "rate")
+
+    match = re.fullmatch(r"\s*([0-9]*\.?[0-9]+)\s*([kKmMgG]?)[bB]?(?:/s)?\s*", rate)
+    if (match is None):
+        raise ValueError(f"Invalid rate: {rate}. Examples: 500K, 2M, 1.5MB/s, 0 for unlimited")
+
+    multiplier = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}[match.group(2).lower()]
+    return float(match.group(1)) * multiplier
+
+
+def parseTime(value: str) -> int:
+    '''Returns minutes since midnight from HH:MM'''
+    match = re.fullmatch(r"([0-9]{1,2}):([0-9]{2})", value.strip())
+    if (match is None or int(match.group(1)) > 24 or int(match.group(2)) > 59):
+        raise ValueError(f"Invalid time: {value}. Expected HH:MM")
+    return (int(match.group(1)) * 60 + int(match.group(2))) % (24 * 60)
+
+
+class RateWindow:
+    '''Rate used between two times of day. Windows ending before they start go over midnight'''
+
+    def __init__(self, start: int, end: int, rate: float) -> None:
+        AssertParameter(start, int, "start")
+        AssertParameter(end, int, "end")
+        AssertParameter(rate, (int, float), "rate")
+        if (rate < 0):
+            raise ValueError(f"Rate must not be negative: {rate}")
+
+        self.start = start
+        self.end = end
+        self.rate = rate
+
+    @classmethod
+    def fromString(cls, window: str):
+        '''Parses HH:MM-HH:MM=RATE, for example 08:00-20:00=1M'''
+        AssertParameter(window, str, "window")
+        try:
+            times, rate = window.split("=")
+            start, end = times.split("-")
+        except ValueError:
+            raise ValueError(f"Invalid rate window: {window}. Expected HH:MM-HH:MM=RATE")
+        return cls(parseTime(start), parseTime(end), parseRate(rate))
+
+    def contains(self, minute: int) -> bool:
+        if (self.start <= self.end):
+            return self.start <= minute < self.end
+        return minute >= self.start or minute < self.end
+
+    def __str__(self) -> str:
+        return (
+            f"{{RateWindow - {self.start // 60:02}:{self.start % 60:02}-"
+            f"{self.end // 60:02}:{self.end % 60:02} | rate: {self.rate}}}"
+        )
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+class RateLimiter:
+    '''Token bucket shared by all downloads.\n
+    Every chunk takes its size in tokens, tokens are refilled at the current rate.
+    Rate is taken from the first schedule window containing the current time, or maxRate.
+    Rate 0 means unlimited.'''
+    # seconds of traffic which may be sent at once after being idle
+    burstSeconds: float = 0.1
+    # seconds between schedule checks
+    scheduleCheckInterval: float = 1
+
+    def __init__(self, maxRate: float = 0, schedule: list[RateWindow] = []) -> None:
+        self._lock = threading.Lock()
+        self._tokens: float = 0
+        self._lastRefill: float = time.monotonic()
+        self._nextScheduleCheck: float = 0
+        self._rate: float = 0
+        self.configure(maxRate, schedule)
+
+    def configure(self, maxRate: float, schedule: list[RateWindow] = []) -> None:
+        AssertParameter(maxRate, (int, float), "maxRate")
+        AssertParameter(schedule, list, "schedule")
+        if (maxRate < 0):
+            raise ValueError(f"Rate must not be negative: {maxRate}")
+        for window in schedule:
+            AssertParameter(window, RateWindow, f"schedule.{window}")
+
+        with self._lock:
+            self.maxRate = maxRate
+            self.schedule = schedule
+            self._nextScheduleCheck = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxRate > 0 or len(self.schedule) > 0
+
+    def rateAt(self, now: datetime.datetime) -> float:
+        minute = now.hour * 60 + now.minute
+        for window in self.schedule:
+            if (window.contains(minute)):
+                return window.rate
+        return self.maxRate
+
+    def consume(self, amount: int, stopEvent: Optional[threading.Event] = None) -> None:
+        '''Waits until amount bytes may be sent. Returns early if stopEvent is set'''
+        if (not self.enabled):
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            if (now >= self._nextScheduleCheck):
+                self._rate = self.rateAt(datetime.datetime.now())
+                self._nextScheduleCheck = now + self.scheduleCheckInterval
+            if (self._rate <= 0):
+                return
+
+            burst = self._rate * self.burstSeconds
+            self._tokens = min(self._tokens + (now - self._lastRefill) * self._rate, burst)
+            self._lastRefill = now
+            # tokens may go below zero, the debt is paid by waiting,
+            # so concurrent downloads queue up behind each other
+            self._tokens -= amount
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0
+
+        if (wait <= 0):
+            return
+        if (stopEvent is not None):
+            stopEvent.wait(wait)
+        else:
+            time.sleep(wait)
+
+    def __str__(self) -> str:
+        return f"{{RateLimiter - maxRate: {self.maxRate} | schedule: {self.schedule}}}"
+
+    def __repr__(self) -> str:
+        return self.__str__()
@@ -0,0 +1,52 @@
+from utils import AssertParameter
+
+
+class Scheduler:
+    '''Order in which jobs are started, picked by estimated cost of every job'''
+    # largest: most expensive first, so no long job is left for the end while other workers idle
+    # smallest: cheapest first, so most jobs finish early
+    # fair: most and least expensive in turns
+    # collection: in the order they were given
+    policies: list[str] = ["largest", "smallest", "fair", "collection"]
+
+    def __init__(self, policy: str = "largest") -> None:
+        AssertParameter(policy, str, "policy")
+        if (policy not in Scheduler.policies):
+            raise ValueError(f"policy must be one of {Scheduler.policies}: {policy}")
+
+        self.policy = policy
+
+    def order(self, costs: list[float]) -> list[int]:
+        '''Returns indexes of jobs in the order they should be started.
+        Jobs with the same cost keep their order'''
+        AssertParameter(costs, list, "costs")
+
+        indexes = list(range(len(costs)))
+        if (self.policy == "collection"):
+            return indexes
+
+        # sort is stable, so equal jobs stay in collection order
+        cheapestFirst = sorted(indexes, key=lambda index: costs[index])
+        if (self.policy == "smallest"):
+            return cheapestFirst
+
+        mostExpensiveFirst = sorted(indexes, key=lambda index: -costs[index])
+        if (self.policy == "largest"):
+            return mostExpensiveFirst
+
+        # taken from both ends of the same list, so every job is taken once
+        order: list[int] = []
+        first, last = 0, len(mostExpensiveFirst) - 1
+        while (first <= last):
+            order.append(mostExpensiveFirst[first])
+            first += 1
+            if (first <= last):
+                order.append(mostExpensiveFirst[last])
+                last -= 1
+        return order
+
+    def __str__(self) -> str:
+        return f"{{Scheduler - policy: {self.policy}}}"
+
+    def __repr__(self) -> str:
+        return self.__str__()
@@ -0,0 +1,113 @@
+import threading
+
+from utils import AssertParameter, LazyModule
+
+# imported by the first request
+requests = LazyModule("requests")
+
+
+class Settings:
+    # amount of hosts (api.steampowered.com, node, storage...) kept in the pool
+    poolConnections: int = 8
+    # connections kept open to every host
+    poolMaxSize: int = 32
+    # retries of connection errors, resets and retryStatuses
+    retries: int = 3
+    # seconds before the first retry, doubled for every next one
+    retryBackoff: float = 0.5
+    retryStatuses: list[int] = [500, 502, 503, 504]
+    # seconds to connect and seconds between received bytes
+    connectTimeout: float = 10
+    readTimeout: float = 60
+
+    def setPoolMaxSize(poolMaxSize: int):
+        AssertParameter(poolMaxSize, int, "poolMaxSize")
+        if (poolMaxSize < 1):
+            raise ValueError(f"Pool size must be greater than 0: {poolMaxSize}")
+        Settings.poolMaxSize = poolMaxSize
+        ResetSession()
+
+    def setRetries(retries: int):
+        AssertParameter(retries, int, "retries")
+        if (retries < 0):
+            raise ValueError(f"Retries must not be negative: {retries}")
+        Settings.retries = retries
+        ResetSession()
+
+
+# sessions with and without retries, created on first use
+_sessions: dict[bool, "requests.Session"] = {}
+_sessionLock: threading.Lock = threading.Lock()
+
+
+def createSession(retry: bool = True) -> "requests.Session":
+    '''Creates session with connection pool and retry policy from Settings'''
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    from utils.metrics import Metrics
+
+    class CountedRetry(Retry):
+        '''Retry policy, which counts retries made inside the connection pool in metrics'''
+
+        def increment(self, *args, **kwargs) -> Retry:
+            # raises instead of returning when no retries are left
+            retryPolicy = super().increment(*args, **kwargs)
+            Metrics().count("transport_retry")
+            return retryPolicy
+
+    retries = Settings.retries if retry else 0
+    retryPolicy = CountedRetry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=Settings.retryBackoff,
+        status_forcelist=Settings.retryStatuses,
+        # every request we send is safe to repeat,
+        # including POSTs to steam api and steamworkshopdownloader.io
+        allowed_methods=frozenset(["GET", "POST"]),
+        # callers check status codes themselves
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=Settings.poolConnections,
+        pool_maxsize=Settings.poolMaxSize,
+        max_retries=retryPolicy
+    )
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def Session(retry: bool = True) -> "requests.Session":
+    '''Returns session shared by all api modules, so connections are kept alive between requests.\n
+    retry=False is for callers which fail over to another host instead of retrying the same one'''
+    with _sessionLock:
+        if (retry not in _sessions):
+            _sessions[retry] = createSession(retry)
+        return _sessions[retry]
+
+
+def ResetSession() -> None:
+    '''Closes shared sessions. Next request creates a new one with current Settings'''
+    with _sessionLock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def get(url: str, retry: bool = True, **kwargs) -> "requests.Response":
+    kwargs.setdefault("timeout", (Settings.connectTimeout, Settings.readTimeout))
+    return Session(retry).get(url, **kwargs)
+
+
+def post(url: str, retry: bool = True, **kwargs) -> "requests.Response":
+    kwargs.setdefault("timeout", (Settings.connectTimeout, Settings.readTimeout))
+    return Session(retry).post(url, **kwargs)
+
+
+def head(url: str, retry: bool = True, **kwargs) -> "requests.Response":
+    kwargs.setdefault("timeout", (Settings.connectTimeout, Settings.readTimeout))
+    return Session(retry).head(url, **kwargs)
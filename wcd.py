@@ -1,33 +1,43 @@
 # 1.1.5
 
+from typing import Optional
 import argparse
 import os
 import json
 
 from classes import WorkshopCollection
 from classes.workshopCollection import WorkshopCollectionException
-from api import SteamDownloaderAPI
-from utils import logger, filemanager
+from api import SteamAPI, SteamDownloaderAPI, DownloadBackends, CollectionWatcher
+from utils import logger, filemanager, transport
+from utils.itemStore import ItemStore
+from utils.journal import Journal
+from utils.rateLimiter import RateWindow, parseRate
+from utils.scheduler import Scheduler
 
 
 def parseArgs():
     parser = argparse.ArgumentParser()
 
-    source = parser.add_mutually_exclusive_group(required=True)
-
-    source.add_argument("-curl", "--collectionUrl",
+    parser.add_argument("-curl", "--collectionUrl",
                         type=str,
-                        help="Steam collection url. "
+                        nargs="+",
+                        action="extend",
+                        default=[],
+                        help="Steam collection url, or several of them. "
                         "Pattern: https://steamcommunity.com/(sharedfiles | workshop)/filedetails/?id=*")
 
-    source.add_argument("-cjson", "--collectionJson",
+    parser.add_argument("-cjson", "--collectionJson",
                         type=str,
-                        help="Generated collection.json")
+                        nargs="+",
+                        action="extend",
+                        default=[],
+                        help="Generated collection.json, or several of them. "
+                        "Items shared by several collections are downloaded once.")
 
     parser.add_argument("-o", "--output",
                         type=str,
                         required=False,
-                        default="downloads/",
+                        default="",
                         help="Output directory. "
                         "A folder with collection name will be saved here. "
                         "Defaults to /downloads/")
@@ -42,16 +52,317 @@ def parseArgs():
                         action="store_true",
                         help="Remove items, which were are no longer on the steam workshop. (only when updating)")
 
+    parser.add_argument("-j", "--jobs",
+                        type=int,
+                        required=False,
+                        default=SteamDownloaderAPI.Settings.networkJobs,
+                        help="Amount of items resolved and downloaded at the same time. "
+                        f"Defaults to {SteamDownloaderAPI.Settings.networkJobs}")
+
+    parser.add_argument("--extractJobs",
+                        type=int,
+                        required=False,
+                        default=SteamDownloaderAPI.Settings.extractJobs,
+                        help="Amount of items extracted at the same time. "
+                        f"Defaults to {SteamDownloaderAPI.Settings.extractJobs}")
+
+    parser.add_argument("--extractThreads",
+                        type=int,
+                        required=False,
+                        default=filemanager.Settings.extractThreads,
+                        help="Threads extracting files of a single big item. "
+                        "Defaults to amount of CPU cores, up to 4")
+
+    parser.add_argument("--resolveWindow",
+                        type=int,
+                        required=False,
+                        default=SteamDownloaderAPI.Settings.resolveWindow,
+                        help="Amount of items steamworkshopdownloader.io prepares at the same time. "
+                        f"Defaults to {SteamDownloaderAPI.Settings.resolveWindow}")
+
+    parser.add_argument("--prepareTimeout",
+                        type=float,
+                        required=False,
+                        default=SteamDownloaderAPI.Settings.preparationTimeout,
+                        help="Seconds steamworkshopdownloader.io has to prepare an item, "
+                        f"plus {SteamDownloaderAPI.Settings.preparationTimeoutPerMB} for every MB of the item. "
+                        f"Defaults to {SteamDownloaderAPI.Settings.preparationTimeout}")
+
+    parser.add_argument("--metadataPageSize",
+                        type=int,
+                        required=False,
+                        default=SteamAPI.Settings.pageSize,
+                        help="Amount of items requested from steam api at once. "
+                        f"Defaults to {SteamAPI.Settings.pageSize}")
+
+    parser.add_argument("--metadataJobs",
+                        type=int,
+                        required=False,
+                        default=SteamAPI.Settings.pageJobs,
+                        help="Amount of steam api requests sent at the same time. "
+                        f"Defaults to {SteamAPI.Settings.pageJobs}")
+
+    parser.add_argument("--maxRate",
+                        type=str,
+                        required=False,
+                        default="0",
+                        help="Download speed of all downloads together, for example 500K or 2M (bytes per second). "
+                        "Defaults to 0 (unlimited)")
+
+    parser.add_argument("--rateSchedule",
+                        type=str,
+                        nargs="+",
+                        required=False,
+                        default=[],
+                        help="Download speed for times of the day, for example 08:00-20:00=1M 20:00-08:00=0. "
+                        "--maxRate is used outside of these windows.")
+
+    parser.add_argument("--chunkSize",
+                        type=int,
+                        required=False,
+                        default=SteamDownloaderAPI.Settings.chunkSize,
+                        help="Bytes read from the connection at once. "
+                        f"Defaults to {SteamDownloaderAPI.Settings.chunkSize}")
+
+    parser.add_argument("--poolSize",
+                        type=int,
+                        required=False,
+                        default=transport.Settings.poolMaxSize,
+                        help="Connections kept open to every host. "
+                        f"Defaults to {transport.Settings.poolMaxSize}")
+
+    parser.add_argument("--retries",
+                        type=int,
+                        required=False,
+                        default=transport.Settings.retries,
+                        help="Retries of failed connections and server errors. "
+                        f"Defaults to {transport.Settings.retries}")
+
+    parser.add_argument("--node",
+                        type=int,
+                        required=False,
+                        default=None,
+                        help="Send all requests to this steamworkshopdownloader.io node "
+                        f"({SteamDownloaderAPI.Settings.nodeRange[0]}-{SteamDownloaderAPI.Settings.nodeRange[1]}). "
+                        "By default the fastest healthy node is picked for every request")
+
+    parser.add_argument("--cache",
+                        type=str,
+                        required=False,
+                        default="",
+                        help="Cache steam api responses in this .json file, "
+                        "so repeated checks do not ask steam api again.")
+
+    parser.add_argument("--cacheTtl",
+                        type=float,
+                        required=False,
+                        default=SteamAPI.Settings.cacheTtl,
+                        help="Seconds cached responses are used for. "
+                        f"Defaults to {SteamAPI.Settings.cacheTtl:g}")
+
+    parser.add_argument("--cacheSize",
+                        type=int,
+                        required=False,
+                        default=SteamAPI.Settings.cacheMaxEntries,
+                        help="Maximum amount of cached items. "
+                        f"Defaults to {SteamAPI.Settings.cacheMaxEntries}")
+
+    parser.add_argument("--noCache",
+                        required=False,
+                        action="store_true",
+                        help="Ignore cached responses. Fresh responses are still cached.")
+
+    parser.add_argument("--inMemory",
+                        required=False,
+                        action="store_true",
+                        help="Keep downloaded zipfiles in memory instead of spooling them to disk.")
+
+    parser.add_argument("--delta",
+                        required=False,
+                        action="store_true",
+                        help="Rewrite only changed files of updated items, instead of extracting them again. "
+                        "Files added to item folders by hand are kept.")
+
+    parser.add_argument("--journalSync",
+                        type=str,
+                        required=False,
+                        choices=Journal.fsyncPolicies,
+                        default=SteamDownloaderAPI.Settings.journalFsync,
+                        help="When finished items are flushed to disk: after every item, "
+                        f"at most every {SteamDownloaderAPI.Settings.journalFsyncInterval:g} second, or when the OS decides. "
+                        f"Defaults to {SteamDownloaderAPI.Settings.journalFsync}")
+
+    parser.add_argument("--store",
+                        type=str,
+                        required=False,
+                        default="",
+                        help="Extract items to this folder once and link them into collections, "
+                        "so items shared by several collections are downloaded and stored once.")
+
+    parser.add_argument("--storeLink",
+                        type=str,
+                        required=False,
+                        choices=ItemStore.linkModes,
+                        default=SteamDownloaderAPI.Settings.storeLinkMode,
+                        help="How stored items are added to collections. "
+                        "Falls back to the next mode if filesystem does not support it. "
+                        f"Defaults to {SteamDownloaderAPI.Settings.storeLinkMode}")
+
+    parser.add_argument("--schedule",
+                        type=str,
+                        required=False,
+                        choices=Scheduler.policies,
+                        default=SteamDownloaderAPI.Settings.schedulePolicy,
+                        help="Order items are started in, by their size and preparation time "
+                        "measured by the previous run (see --metrics). "
+                        "largest finishes big collections soonest, smallest finishes most items early, "
+                        "fair takes large and small items in turns, collection keeps the order of collection. "
+                        f"Defaults to {SteamDownloaderAPI.Settings.schedulePolicy}")
+
+    parser.add_argument("--backends",
+                        type=str,
+                        nargs="+",
+                        required=False,
+                        choices=DownloadBackends.DownloadBackend.names,
+                        default=SteamDownloaderAPI.Settings.backends,
+                        help="Where zipfiles of items are downloaded from: a mirror (see --mirror), "
+                        "direct file_url steam api gives for legacy items, or steamworkshopdownloader.io nodes. "
+                        "Every item tries them fastest first, by measured speed and success rate. "
+                        f"Defaults to {' '.join(SteamDownloaderAPI.Settings.backends)}")
+
+    parser.add_argument("--mirror",
+                        type=str,
+                        required=False,
+                        default="",
+                        help="Folder or http url with zipfiles of items, "
+                        f"at {DownloadBackends.Settings.mirrorPattern}. Items missing there are downloaded from other backends.")
+
+    parser.add_argument("--metrics",
+                        type=str,
+                        required=False,
+                        default="",
+                        help="Write per-stage timings, retries and throughput of the run to this .json file.")
+
+    parser.add_argument("--prometheus",
+                        type=str,
+                        required=False,
+                        default="",
+                        help="Write the same metrics to this .prom file, "
+                        "for the textfile collector of prometheus node_exporter.")
+
+    parser.add_argument("--plan",
+                        type=str,
+                        required=False,
+                        default="",
+                        help="Only check what would be downloaded, updated and removed, "
+                        "and save it with download size and estimated duration to this .json file.")
+
+    parser.add_argument("--apply",
+                        type=str,
+                        required=False,
+                        default="",
+                        help="Run a plan saved by --plan, without asking steam api again. "
+                        "Collections are saved to the planned directory, unless -o is given.")
+
+    parser.add_argument("--watch",
+                        action="store_true",
+                        help="Keep running and check collections for updated items every --interval, "
+                        "downloading only items whose time_updated changed. Stop with Ctrl+C.")
+
+    parser.add_argument("--interval",
+                        type=float,
+                        nargs="+",
+                        required=False,
+                        default=[CollectionWatcher.Settings.interval],
+                        help="Seconds between checks of collections with --watch: one for all collections, "
+                        "or one for every collection (-curl first, then -cjson). "
+                        "Collections without changes are checked less often, up to --maxStaleness. "
+                        f"Defaults to {CollectionWatcher.Settings.interval:g}")
+
+    parser.add_argument("--maxStaleness",
+                        type=float,
+                        required=False,
+                        default=CollectionWatcher.Settings.maxStaleness,
+                        help="Longest time in seconds a collection goes unchecked with --watch. "
+                        f"Defaults to {CollectionWatcher.Settings.maxStaleness:g}")
+
     args = parser.parse_args()
 
-    directory = os.path.abspath(args.output)
+    if (args.plan and args.apply):
+        parser.error("argument --apply: not allowed with argument --plan")
+    if (args.watch and (args.plan or args.apply)):
+        parser.error("argument --watch: not allowed with arguments --plan and --apply")
+    collectionCount = len(args.collectionUrl) + len(args.collectionJson)
+    if (args.watch and len(args.interval) not in (1, collectionCount)):
+        parser.error(f"argument --interval: expected 1 or {collectionCount} values")
+    if (len(args.collectionUrl) == 0 and len(args.collectionJson) == 0 and not args.apply):
+        parser.error("at least one of the arguments -curl/--collectionUrl -cjson/--collectionJson is required")
+
+    try:
+        SteamDownloaderAPI.Settings.setNetworkJobs(args.jobs)
+        SteamDownloaderAPI.Settings.setExtractJobs(args.extractJobs)
+        filemanager.Settings.setExtractThreads(args.extractThreads)
+        SteamDownloaderAPI.Settings.setResolveWindow(args.resolveWindow)
+        SteamDownloaderAPI.Settings.setPreparationTimeout(args.prepareTimeout)
+        SteamAPI.Settings.setPageSize(args.metadataPageSize)
+        SteamAPI.Settings.setPageJobs(args.metadataJobs)
+        transport.Settings.setPoolMaxSize(args.poolSize)
+        transport.Settings.setRetries(args.retries)
+        SteamDownloaderAPI.Settings.setNodeId(args.node)
+        SteamAPI.Settings.setCache(
+            os.path.abspath(args.cache) if args.cache else "",
+            args.cacheTtl,
+            args.cacheSize
+        )
+        SteamDownloaderAPI.Settings.setJournalFsync(args.journalSync)
+        SteamDownloaderAPI.Settings.setChunkSize(args.chunkSize)
+        SteamDownloaderAPI.Settings.setMaxRate(
+            parseRate(args.maxRate),
+            [RateWindow.fromString(window) for window in args.rateSchedule]
+        )
+        SteamDownloaderAPI.Settings.setStore(
+            os.path.abspath(args.store) if args.store else "",
+            args.storeLink
+        )
+        SteamDownloaderAPI.Settings.setSchedulePolicy(args.schedule)
+        SteamDownloaderAPI.Settings.setBackends(
+            args.backends,
+            os.path.abspath(args.mirror) if args.mirror and not DownloadBackends.isUrl(args.mirror) else args.mirror
+        )
+        SteamDownloaderAPI.Settings.setMetrics(
+            os.path.abspath(args.metrics) if args.metrics else "",
+            os.path.abspath(args.prometheus) if args.prometheus else ""
+        )
+        CollectionWatcher.Settings.setMaxStaleness(args.maxStaleness)
+        if (args.watch):
+            CollectionWatcher.Settings.setInterval(args.interval[0])
+            for interval in args.interval:
+                if (interval <= 0 or interval > args.maxStaleness):
+                    raise ValueError(f"Interval must be greater than 0 and at most --maxStaleness: {interval:g}")
+    except ValueError as exception:
+        parser.error(str(exception))
+    SteamDownloaderAPI.Settings.spoolDownloads = not args.inMemory
+    SteamAPI.Settings.bypassCache = args.noCache
+    SteamDownloaderAPI.Settings.deltaUpdates = args.delta
+
+    directory = os.path.abspath(args.output or "downloads/")
     force = args.force
     cleanUp = args.cleanUp
 
-    steamUrl = args.collectionUrl
-    jsonPath = args.collectionJson
+    steamUrls = args.collectionUrl
+    jsonPaths = args.collectionJson
 
-    return directory, force, steamUrl, jsonPath, cleanUp
+    planPath = os.path.abspath(args.plan) if args.plan else ""
+    applyPath = os.path.abspath(args.apply) if args.apply else ""
+    # plans are applied to the planned directory by default
+    applyDirectory = directory if args.output else ""
+
+    # seconds between checks of every collection, empty without --watch
+    watchIntervals: list[float] = []
+    if (args.watch):
+        watchIntervals = args.interval * collectionCount if len(args.interval) == 1 else args.interval
+
+    return directory, force, steamUrls, jsonPaths, cleanUp, planPath, applyPath, applyDirectory, watchIntervals
 
 
 def readJsonFile(jsonPath):
@@ -59,51 +370,146 @@ def readJsonFile(jsonPath):
         return json.load(jsonFile)
 
 
-def main():
-    OutputDirectory, ForceRedownload, \
-        SteamCollectionUrl, JsonFilePath, CleanUp = parseArgs()
-
-    wCollection = None
-    if (SteamCollectionUrl):
+def readCollections(steamUrls: list[str], jsonPaths: list[str]) -> Optional[list[WorkshopCollection]]:
+    '''Returns collections from urls and collection.json files, or None if any of them is invalid'''
+    collections: list[WorkshopCollection] = []
+    for steamUrl in steamUrls:
         try:
-            wCollection = WorkshopCollection.fromUrl(SteamCollectionUrl)
+            collections.append(WorkshopCollection.fromUrl(steamUrl))
         except WorkshopCollectionException:
             logger.LogError(
-                "Could not create collection."
+                f"Could not create collection: {steamUrl}"
             )
-            return
+            return None
 
-    if (JsonFilePath):
-        if (filemanager.doesFileExist(JsonFilePath)):
-            jsonDict = readJsonFile(JsonFilePath)
+    for jsonPath in jsonPaths:
+        if (filemanager.doesFileExist(jsonPath)):
+            jsonDict = readJsonFile(jsonPath)
         else:
             logger.LogError(
-                "Could not find collection.json file"
+                f"Could not find collection.json file: {jsonPath}"
             )
-            return
+            return None
         try:
-            wCollection = WorkshopCollection.fromJson(jsonDict)
+            collection = WorkshopCollection.fromJson(jsonDict)
         except WorkshopCollectionException:
+            collection = None
+        if (collection is None):
             logger.LogError(
-                "Could not create collection."
+                f"Could not create collection: {jsonPath}"
             )
+            return None
+        collections.append(collection)
+
+    return collections
+
+
+def planCollections(downloadedCollections: list[WorkshopCollection], updatedCollections: list[WorkshopCollection], directory: str, cleanUp: bool, planPath: str) -> None:
+    '''Saves what would be downloaded, updated and removed, without changing anything'''
+    collections = downloadedCollections + updatedCollections
+    plans = [
+        SteamDownloaderAPI.PlanCollection(collection, directory, collection in downloadedCollections)
+        for collection
+        in collections
+    ]
+
+    for collection, plan in zip(collections, plans):
+        logger.LogMessage(
+            f"{logger.StartIndent()}Planned collection: {collection.name}\n"
+            f"{logger.Indent(1)}New items:     {len(plan.addedItems)}\n"
+            f"{logger.Indent(1)}Updated items: {len(plan.updatedItems)}\n"
+            f"{logger.Indent(1)}Removed items: {len(plan.deletedItems) + len(plan.deletedFolders) if cleanUp else 0}\n"
+            f"{logger.Indent(1)}Download size: {plan.totalBytes / 1024 / 1024:.1f} MB"
+            f"{f' (and {plan.unknownSizeItems} items of unknown size)' if plan.unknownSizeItems > 0 else ''}\n"
+            f"{logger.Indent(1)}Estimated duration: {SteamDownloaderAPI.EstimateDuration(plan) / 60:.1f} min"
+        )
+
+    SteamDownloaderAPI.SavePlan(planPath, collections, plans, directory, cleanUp)
+    logger.LogSuccess(
+        f"{logger.StartIndent()}Saved plan: {planPath}\n"
+        f"{logger.Indent(1)}Run it with: --apply {planPath}"
+    )
+
+
+def watchCollections(collections: list[WorkshopCollection], intervals: list[float], directory: str, cleanUp: bool, redownload: bool) -> None:
+    '''Keeps collections up to date until interrupted. With redownload, collections are downloaded again first'''
+    watcher = CollectionWatcher.CollectionWatcher(directory, cleanUp)
+    for collection, interval in zip(collections, intervals):
+        watcher.add(collection, interval, redownload)
+
+    logger.LogMessage(
+        f"{logger.StartIndent()}Watching {len(collections)} collections, press Ctrl+C to stop"
+    )
+    watcher.run()
+
+
+def main():
+    OutputDirectory, ForceRedownload, \
+        SteamCollectionUrls, JsonFilePaths, CleanUp, \
+        PlanPath, ApplyPath, ApplyDirectory, WatchIntervals = parseArgs()
+
+    if (ApplyPath):
+        if (not filemanager.doesFileExist(ApplyPath)):
+            logger.LogError(f"Could not find plan: {ApplyPath}")
             return
+        try:
+            SteamDownloaderAPI.ApplyPlan(ApplyPath, ApplyDirectory)
+        except KeyboardInterrupt:
+            SteamDownloaderAPI.StopDownload()
+        return
+
+    collections = readCollections(SteamCollectionUrls, JsonFilePaths)
+    if (collections is None):
+        return
+
+    # collections from urls are always downloaded, collection.json files are updated
+    downloadedCollections = collections[:len(SteamCollectionUrls)]
+    updatedCollections = collections[len(SteamCollectionUrls):]
+    if (ForceRedownload):
+        downloadedCollections += updatedCollections
+        updatedCollections = []
 
     try:
-        try:
-            wCollection.FetchNewItems()
-        except WorkshopCollectionException as exception:
-            logger.LogError(exception)
+        if (len(WatchIntervals) > 0):
+            # collections from urls are updated too, so restarting the watcher does not download them again
+            watchCollections(collections, WatchIntervals, OutputDirectory, CleanUp, ForceRedownload)
             return
 
-        if (SteamCollectionUrl or ForceRedownload):
-            SteamDownloaderAPI.DownloadCollection(
-                wCollection, OutputDirectory, True
-            )
-        else:
-            SteamDownloaderAPI.UpdateCollection(
-                wCollection, OutputDirectory, True, CleanUp
-            )
+        if (len(collections) == 1):
+            wCollection = collections[0]
+            try:
+                wCollection.FetchNewItems()
+            except WorkshopCollectionException as exception:
+                logger.LogError(exception)
+                return
+
+            if (PlanPath):
+                planCollections(downloadedCollections, updatedCollections, OutputDirectory, CleanUp, PlanPath)
+            elif (len(downloadedCollections) == 1):
+                SteamDownloaderAPI.DownloadCollection(
+                    wCollection, OutputDirectory, True
+                )
+            else:
+                SteamDownloaderAPI.UpdateCollection(
+                    wCollection, OutputDirectory, True, CleanUp
+                )
+            return
+
+        missingCollections = WorkshopCollection.FetchNewItemsBatch(collections)
+        for collection in missingCollections:
+            logger.LogError(f"Collection does not exist: {collection.id}")
+        downloadedCollections = [collection for collection in downloadedCollections if collection not in missingCollections]
+        updatedCollections = [collection for collection in updatedCollections if collection not in missingCollections]
+
+        if (PlanPath):
+            planCollections(downloadedCollections, updatedCollections, OutputDirectory, CleanUp, PlanPath)
+            return
+        SteamDownloaderAPI.SyncCollections(
+            downloadedCollections,
+            updatedCollections,
+            OutputDirectory,
+            CleanUp
+        )
     except KeyboardInterrupt:
         SteamDownloaderAPI.StopDownload()
 